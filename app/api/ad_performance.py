@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request, current_app
 import requests
 from datetime import datetime, timedelta
+from . import http_client
 
 ad_performance_bp = Blueprint('ad_performance', __name__)
 
@@ -15,7 +16,7 @@ def get_facebook_daily_spend(config, since, until):
         'access_token': config['FACEBOOK_ACCESS_TOKEN']
     }
     try:
-        response = requests.get(url, params=params)
+        response = http_client.get('facebook', url, params=params)
         response.raise_for_status()
         data = response.json().get('data', [])
         spend_data = {item['date_start']: float(item.get('spend', 0)) for item in data}
@@ -36,7 +37,7 @@ def get_shopify_orders_for_ads(config, since):
     all_orders = []
     try:
         while url:
-            response = requests.get(url, headers=headers, params=params)
+            response = http_client.get('shopify', url, headers=headers, params=params)
             response.raise_for_status()
             data = response.json()
             all_orders.extend(data.get('orders', []))
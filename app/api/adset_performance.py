@@ -9,27 +9,10 @@ import traceback
 from urllib.parse import urlparse
 import pytz
 
-from .helpers import get_all_shopify_orders_paginated, get_facebook_ads, get_order_source_term, load_cache, save_cache, get_raw_rapidshyp_status, normalize_status, pick_date_for_filter
+from .helpers import get_all_shopify_orders_paginated, get_facebook_ads, get_raw_rapidshyp_status
+from .order_store import get_order_store
 
 adset_performance_bp = Blueprint('adset_performance', __name__)
-MASTER_DATA_FILE = 'master_order_data.json'
-
-
-def load_master_orders_utf8_safe(path):
-    """
-    Safely load the master orders JSON file with UTF-8 encoding.
-    Falls back to error-tolerant mode if the file contains invalid UTF-8 bytes.
-    """
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except UnicodeDecodeError as e:
-        # Fallback: tolerate bad bytes to keep the API alive
-        print(f"[WARN] UTF-8 decode failed for {path} at position {e.start}: {e.reason}")
-        print("[WARN] Retrying with errors='replace'. Consider regenerating the file by running data_fetcher.py")
-        with open(path, 'r', encoding='utf-8', errors='replace') as f:
-            return json.load(f)
-
 
 def create_empty_bucket(bucket_id, name, spend=0):
     return {
@@ -79,16 +62,11 @@ def get_adset_performance_data(since, until, config, date_filter_type):
     start_date = datetime.strptime(since, '%Y-%m-%d').date()
     end_date = datetime.strptime(until, '%Y-%m-%d').date()
 
-    if not os.path.exists(MASTER_DATA_FILE):
-        raise FileNotFoundError("Master data file not found. Please run data_fetcher.py first.")
-    
-    all_orders = load_master_orders_utf8_safe(MASTER_DATA_FILE)
-    
-    shopify_orders_in_range = []
-    for o in all_orders:
-        filter_date = pick_date_for_filter(o, date_filter_type)
-        if filter_date and start_date <= filter_date <= end_date:
-            shopify_orders_in_range.append(o)
+    snapshot = get_order_store(config).snapshot()
+    if not snapshot.orders:
+        raise FileNotFoundError("Order store is empty. Please run data_fetcher.py first.")
+
+    shopify_orders_in_range = snapshot.orders_in_range(date_filter_type, start_date, end_date)
 
     fb_ads = get_facebook_ads(config, since, until)
 
@@ -104,9 +82,8 @@ def get_adset_performance_data(since, until, config, date_filter_type):
     adset_delivered_revenue_totals = {}
 
     for order in shopify_orders_in_range:
-        source, term = get_order_source_term(order)
-        raw_status = order.get('raw_rapidshyp_status')
-        status = normalize_status(order, raw_status)
+        source, term = order['attribution_source'], order['attribution_term']
+        status = order['normalized_status']
         
         adset_bucket, term_bucket = None, None
         adset_id_for_revenue = None
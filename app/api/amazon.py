@@ -1,59 +1,241 @@
 from flask import Blueprint, jsonify, current_app, request, send_file
+from . import http_client
 from .helpers import make_signed_api_request
+from .amazon_items_store import get_amazon_items_store
+from .order_store import get_order_store
+from .sp_rate_limiter import sp_api_rate
 from ..auth import token_required
 from datetime import datetime, timedelta
+import csv
+import gzip
+import io
 import json
 import os
+import tempfile
+import threading
 import time
 from io import BytesIO
 import openpyxl
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
 
-# ---------------- ADD HERE ----------------
-def get_fetch_period():
-    """Return full period once per day, else month-to-date."""
-    today_str = datetime.utcnow().strftime('%Y-%m-%d')
-    cache_date_file = 'amazon_cache_date.txt'
+amazon_bp = Blueprint('amazon', __name__)
+AMAZON_CACHE_FILE = 'amazon_cache.json'
+AMAZON_SYNC_STATE_FILE = 'amazon_sync_state.json'
+CACHE_DURATION_SECONDS = 30 * 60  # Cache for 30 minutes
+FULL_FETCH_DAYS = 180
+# Amazon only accepts LastUpdatedAfter at least 2 minutes in the past; the overlap re-reads the edge
+LAST_UPDATED_LAG = timedelta(minutes=2)
+LAST_UPDATED_OVERLAP = timedelta(minutes=10)
+# Amazon orders live in the cache file, not the order store; their changes are
+# logged in the store's change sequence under this prefix.
+AMAZON_CHANGE_PREFIX = 'amazon:'
+AMAZON_STATUS_MAP = {
+    'Pending': 'New', 
+    'Unshipped': 'New', 
+    'PartiallyShipped': 'Processing', 
+    'Shipped': 'Shipped', 
+    'Canceled': 'Cancelled'
+}
 
-    full_fetch = False
-    if not os.path.exists(cache_date_file):
-        full_fetch = True
-    else:
-        with open(cache_date_file, 'r') as f:
-            last_fetch_date = f.read().strip()
-        if last_fetch_date != today_str:
-            full_fetch = True
+def load_amazon_sync_state(config):
+    path = config.get('AMAZON_SYNC_STATE_FILE') or AMAZON_SYNC_STATE_FILE
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            pass
+    return {}
 
-    # Save today as last fetch date
-    with open(cache_date_file, 'w') as f:
-        f.write(today_str)
+def save_amazon_sync_state(config, state):
+    with open(config.get('AMAZON_SYNC_STATE_FILE') or AMAZON_SYNC_STATE_FILE, 'w') as f:
+        json.dump(state, f)
 
-    if full_fetch:
-        ninety_days_ago = get_fetch_period()
-    else:
-        month_start = datetime.utcnow().replace(day=1)
-        ninety_days_ago = month_start.isoformat() + 'Z'
+def get_fetch_period(state, now=None):
+    """
+    Decides the next Amazon fetch: a full 180-day CreatedAfter crawl at most
+    once a day (or when there is no watermark yet), otherwise only orders
+    changed since the stored LastUpdatedAfter watermark.
+    Returns (full_fetch, query_params).
+    """
+    now = now or datetime.utcnow()
+    watermark = state.get('last_updated_after')
+    if not watermark or state.get('last_full_fetch_date') != now.strftime('%Y-%m-%d'):
+        return True, {'CreatedAfter': (now - timedelta(days=FULL_FETCH_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')}
+    since = datetime.strptime(watermark, '%Y-%m-%dT%H:%M:%SZ') - LAST_UPDATED_OVERLAP
+    return False, {'LastUpdatedAfter': since.strftime('%Y-%m-%dT%H:%M:%SZ')}
 
-    return ninety_days_ago
-# ---------------- END ADD ----------------
+def load_cached_amazon_orders(config):
+    path = config.get('AMAZON_CACHE_FILE') or AMAZON_CACHE_FILE
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            pass
+    return []
 
-amazon_bp = Blueprint('amazon', __name__)
-AMAZON_CACHE_FILE = 'amazon_cache.json'
-AMAZON_ITEMS_CACHE_FILE = 'amazon_items_cache.json'
-CACHE_DURATION_SECONDS = 30 * 60  # Cache for 10 minutes
+def write_cached_amazon_orders(config, orders):
+    """
+    Replaces the cache file atomically so readers never see a half-written
+    list, then logs which orders were added, changed or removed.
+    """
+    path = config.get('AMAZON_CACHE_FILE') or AMAZON_CACHE_FILE
+    before = {order['id']: order for order in load_cached_amazon_orders(config)}
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp_', suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(orders, f)
+    os.replace(tmp_path, path)
+
+    after = {order['id']: order for order in orders}
+    changes = [(AMAZON_CHANGE_PREFIX + order_id, 'changed' if order_id in before else 'added')
+               for order_id, order in after.items() if before.get(order_id) != order]
+    changes += [(AMAZON_CHANGE_PREFIX + order_id, 'removed') for order_id in before if order_id not in after]
+    get_order_store(config).record_changes(changes)
+
+# --- CACHED ORDERS FOR THE DASHBOARD ---
+# /get-orders serves Amazon orders straight from the cache file, parsed once
+# per change, and refreshes a stale cache in the background instead of making
+# the request wait for SP-API.
+_cached_orders = {'mtime': None, 'orders': []}
+_refresh_lock = threading.Lock()
+
+def amazon_cache_mtime(config):
+    """Modification time (ns) of the Amazon cache file, 0 if there is none; doubles as its data version."""
+    try:
+        return os.stat(config.get('AMAZON_CACHE_FILE') or AMAZON_CACHE_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def get_cached_amazon_orders(config):
+    global _cached_orders
+    mtime = amazon_cache_mtime(config)
+    memo = _cached_orders
+    if memo['mtime'] != mtime:
+        memo = _cached_orders = {'mtime': mtime, 'orders': load_cached_amazon_orders(config)}
+    return memo['orders']
+
+def refresh_amazon_orders_if_stale(config):
+    """
+    Starts fetch_amazon_orders in a background thread once the cache is older
+    than CACHE_DURATION_SECONDS, at most one refresh at a time per process.
+    Returns True while there is no cache yet, so callers can serve an empty
+    Amazon list and say the first fetch is still running.
+    """
+    mtime = amazon_cache_mtime(config)
+    if mtime and time.time() - mtime / 1e9 < CACHE_DURATION_SECONDS:
+        return False
+    if not _refresh_lock.acquire(blocking=False):
+        return not mtime
+
+    def run():
+        try:
+            fetch_amazon_orders(config)
+        except Exception as e:
+            print(f"[Amazon] Background refresh failed: {e}")
+        finally:
+            _refresh_lock.release()
+
+    threading.Thread(target=run, name='amazon-refresh', daemon=True).start()
+    return not mtime
+
+# Marks orders normalized from the all-orders report, whose details are coarser than getOrders
+REPORT_SOURCE = 'report'
+# Placeholders a source uses when it lacks a field (e.g. the flat-file report has no buyer PII)
+UNKNOWN_ORDER_VALUES = {'name': 'N/A', 'address': 'No address', 'paymentMethod': 'N/A'}
+
+def merge_amazon_orders(existing_orders, changed_orders):
+    """
+    Merges changed orders into the cached list by AmazonOrderId, keeping
+    items, buyer names, addresses and payment methods already known.
+    """
+    merged = {order['id']: order for order in existing_orders}
+    for order in changed_orders:
+        previous = merged.get(order['id'])
+        if previous:
+            if previous.get('items') and not order.get('items'):
+                order['items'] = previous['items']
+            for key, unknown in UNKNOWN_ORDER_VALUES.items():
+                # A report address is only "city, state"; a full one from getOrders is kept
+                less_specific = key == 'address' and order.get('source') == REPORT_SOURCE
+                if (less_specific or order.get(key, unknown) == unknown) and previous.get(key, unknown) != unknown:
+                    order[key] = previous[key]
+        merged[order['id']] = order
+    return list(merged.values())
+
+def fetch_amazon_order_pages(config, filter_params):
+    """
+    Crawls /orders/v0/orders for the given CreatedAfter/LastUpdatedAfter
+    filter. Returns (raw_orders, complete); complete is False when the crawl
+    gave up on repeated quota errors.
+    """
+    all_amazon_orders_raw, next_token = [], None
+    page = 1
+    consecutive_quota_errors = 0
+    
+    while True:
+        print(f"[Amazon API] Fetching page {page}...")
+        query_params = {
+            'MarketplaceIds': config['MARKETPLACE_ID'], 
+            **filter_params,
+            # --- THIS IS THE FIX FOR PII ---
+            # Request buyer info and shipping address, which are restricted data elements.
+            'dataElements': 'buyerInfo,shippingAddress'
+        }
+        if next_token: 
+            query_params['NextToken'] = next_token
+        
+        options = {
+            'method': 'GET', 
+            'path': '/orders/v0/orders', 
+            'queryParams': query_params
+        }
+        
+        try:
+            response_data = make_signed_api_request(config, options)
+            
+            payload = response_data.get('payload', {})
+            orders_payload = payload.get('Orders', [])
+            all_amazon_orders_raw.extend(orders_payload)
+            
+            print(f"[Amazon API] Fetched page {page} ({len(orders_payload)} orders, total: {len(all_amazon_orders_raw)})")
+            
+            consecutive_quota_errors = 0
+            next_token = payload.get('NextToken')
+            page += 1
+            
+            if not next_token: 
+                return all_amazon_orders_raw, True
+                
+        except Exception as api_error:
+            error_str = str(api_error)
+            if 'QuotaExceeded' in error_str or 'quota' in error_str.lower():
+                consecutive_quota_errors += 1
+                wait_time = 60 * consecutive_quota_errors
+                print(f"[Amazon API] Quota exceeded at page {page}, waiting {wait_time} seconds...")
+                time.sleep(wait_time)
+                
+                if consecutive_quota_errors >= 5:
+                    print(f"[Amazon API] Too many quota errors, stopping at {len(all_amazon_orders_raw)} orders")
+                    return all_amazon_orders_raw, False
+                continue
+            else:
+                raise api_error
 
 def fetch_amazon_orders(config):
     """
     Fetches Amazon orders, using a file-based cache to avoid rate-limiting.
     NOW includes a request for PII data elements.
+    Once the cache is stale, only orders updated since the last fetch are
+    requested and merged in; a full 180-day fetch runs at most once a day.
     """
-    if os.path.exists(AMAZON_CACHE_FILE):
-        cache_age = time.time() - os.path.getmtime(AMAZON_CACHE_FILE)
+    cache_file = config.get('AMAZON_CACHE_FILE') or AMAZON_CACHE_FILE
+    if os.path.exists(cache_file):
+        cache_age = time.time() - os.path.getmtime(cache_file)
         if cache_age < CACHE_DURATION_SECONDS:
             print("\n--- [Amazon Cache] Using cached data. Age: {:.0f} seconds. ---".format(cache_age))
-            with open(AMAZON_CACHE_FILE, 'r') as f:
-                return json.load(f)
+            return load_cached_amazon_orders(config)
 
     print("\n--- [Amazon Cache] Cache is old or missing. Fetching fresh data from API. ---")
     required_keys = ['AWS_ACCESS_KEY', 'AWS_SECRET_KEY', 'AWS_REGION', 'LWA_CLIENT_ID', 'LWA_CLIENT_SECRET', 'REFRESH_TOKEN', 'MARKETPLACE_ID']
@@ -61,80 +243,48 @@ def fetch_amazon_orders(config):
         print("[WARNING] Amazon SP-API credentials not set. Skipping Amazon orders.")
         return []
 
-    ninety_days_ago = (datetime.utcnow() - timedelta(days=180)).isoformat() + 'Z'
-    all_amazon_orders_raw, next_token = [], None
-    page = 1
-    consecutive_quota_errors = 0
-    
+    state = load_amazon_sync_state(config)
+    started_at = datetime.utcnow()
+    full_fetch, filter_params = get_fetch_period(state, started_at)
     try:
-        while True:
-            print(f"[Amazon API] Fetching page {page}...")
-            query_params = {
-                'MarketplaceIds': config['MARKETPLACE_ID'], 
-                'CreatedAfter': ninety_days_ago,
-                # --- THIS IS THE FIX FOR PII ---
-                # Request buyer info and shipping address, which are restricted data elements.
-                'dataElements': 'buyerInfo,shippingAddress'
-            }
-            if next_token: 
-                query_params['NextToken'] = next_token
-            
-            options = {
-                'method': 'GET', 
-                'path': '/orders/v0/orders', 
-                'queryParams': query_params
-            }
-            
-            try:
-                response_data = make_signed_api_request(config, options)
-                
-                payload = response_data.get('payload', {})
-                orders_payload = payload.get('Orders', [])
-                all_amazon_orders_raw.extend(orders_payload)
-                
-                print(f"[Amazon API] Fetched page {page} ({len(orders_payload)} orders, total: {len(all_amazon_orders_raw)})")
-                
-                consecutive_quota_errors = 0
-                next_token = payload.get('NextToken')
-                page += 1
-                
-                if not next_token: 
-                    break
-                
-                if page <= 5: time.sleep(2)
-                elif page <= 10: time.sleep(3)
-                else: time.sleep(5)
-                    
-            except Exception as api_error:
-                error_str = str(api_error)
-                if 'QuotaExceeded' in error_str or 'quota' in error_str.lower():
-                    consecutive_quota_errors += 1
-                    wait_time = 60 * consecutive_quota_errors
-                    print(f"[Amazon API] Quota exceeded at page {page}, waiting {wait_time} seconds...")
-                    time.sleep(wait_time)
-                    
-                    if consecutive_quota_errors >= 5:
-                        print(f"[Amazon API] Too many quota errors, stopping at {len(all_amazon_orders_raw)} orders")
-                        break
-                    continue
-                else:
-                    raise api_error
+        if full_fetch and config.get('AMAZON_USE_REPORTS'):
+            print("[Amazon] Daily full fetch via the all-orders report...")
+            normalized_orders = merge_amazon_orders(
+                load_cached_amazon_orders(config), fetch_amazon_orders_via_report(config, days=FULL_FETCH_DAYS))
+            complete = True
+        elif full_fetch:
+            print(f"[Amazon] Daily full fetch of orders created after {filter_params['CreatedAfter']}...")
+            all_amazon_orders_raw, complete = fetch_amazon_order_pages(config, filter_params)
+            print(f"✅ Successfully fetched a total of {len(all_amazon_orders_raw)} Amazon orders.")
+            with open(cache_file + '.raw', 'w') as f:
+                json.dump(all_amazon_orders_raw, f)
+            normalized_orders = merge_amazon_orders(
+                load_cached_amazon_orders(config), [normalize_amazon_order(order) for order in all_amazon_orders_raw])
+        else:
+            print(f"[Amazon] Incremental fetch of orders updated after {filter_params['LastUpdatedAfter']}...")
+            changed_raw, complete = fetch_amazon_order_pages(config, filter_params)
+            print(f"✅ {len(changed_raw)} Amazon orders changed since the last fetch.")
+            normalized_orders = merge_amazon_orders(
+                load_cached_amazon_orders(config), [normalize_amazon_order(order) for order in changed_raw])
 
-        print(f"✅ Successfully fetched a total of {len(all_amazon_orders_raw)} Amazon orders.")
-        
-        with open(AMAZON_CACHE_FILE + '.raw', 'w') as f:
-            json.dump(all_amazon_orders_raw, f)
-        
-        normalized_orders = [normalize_amazon_order(order) for order in all_amazon_orders_raw]
-        
-        with open(AMAZON_CACHE_FILE, 'w') as f:
-            json.dump(normalized_orders, f)
-            
+        if full_fetch:
+            # Orders that aged out of the 180-day window are dropped on the full fetch
+            window_start = (started_at - timedelta(days=FULL_FETCH_DAYS)).strftime('%Y-%m-%d')
+            normalized_orders = [order for order in normalized_orders if order['date'] >= window_start]
+        write_cached_amazon_orders(config, normalized_orders)
+
+        # Only a complete crawl may advance the watermark, or orders on the missed pages would be skipped
+        if complete:
+            state['last_updated_after'] = (started_at - LAST_UPDATED_LAG).strftime('%Y-%m-%dT%H:%M:%SZ')
+            if full_fetch:
+                state['last_full_fetch_date'] = started_at.strftime('%Y-%m-%d')
+            save_amazon_sync_state(config, state)
         return normalized_orders
 
     except Exception as e:
         print(f"--- [ERROR] The Amazon SP-API request failed. Error: {e} ---")
-        return []
+        # Serve the last merged cache rather than dropping Amazon orders from the dashboard
+        return load_cached_amazon_orders(config)
 
 def normalize_amazon_order(order):
     """Normalize Amazon order, now correctly extracting PII data."""
@@ -159,66 +309,173 @@ def normalize_amazon_order(order):
         "date": order_date,
         "name": customer_name, # <-- Use the extracted name
         "total": float(order.get('OrderTotal', {}).get('Amount', 0)),
-        "status": {
-            'Pending': 'New', 
-            'Unshipped': 'New', 
-            'PartiallyShipped': 'Processing', 
-            'Shipped': 'Shipped', 
-            'Canceled': 'Cancelled'
-        }.get(order['OrderStatus'], 'Processing'),
+        "status": AMAZON_STATUS_MAP.get(order['OrderStatus'], 'Processing'),
         "items": [], # Items will be fetched in a separate step
         "address": f"{address.get('AddressLine1', '')}, {address.get('City', '')}".strip(', ') or 'No address',
         "paymentMethod": order.get('PaymentMethod', 'N/A')
     }
 
-def get_cached_order_items(order_id):
-    """Get items for an order from cache"""
-    if os.path.exists(AMAZON_ITEMS_CACHE_FILE):
-        try:
-            with open(AMAZON_ITEMS_CACHE_FILE, 'r') as f:
-                items_cache = json.load(f)
-                if order_id in items_cache:
-                    return items_cache[order_id]
-        except:
-            pass
-    return None
+# --- REPORTS API BULK INGESTION ---
+# One flat-file report returns every order with its items, instead of one
+# orderItems call per order.
+ORDERS_REPORT_TYPE = 'GET_FLAT_FILE_ALL_ORDERS_DATA_BY_ORDER_DATE_GENERAL'
+REPORT_WINDOW_DAYS = 30  # maximum date range Amazon accepts for this report
+REPORTS_PATH = '/reports/2021-06-30'
 
-def save_order_items_to_cache(order_id, items):
-    """Save items for an order to cache"""
-    items_cache = {}
-    if os.path.exists(AMAZON_ITEMS_CACHE_FILE):
-        try:
-            with open(AMAZON_ITEMS_CACHE_FILE, 'r') as f:
-                items_cache = json.load(f)
-        except:
-            pass
-    
-    items_cache[order_id] = items
-    
-    with open(AMAZON_ITEMS_CACHE_FILE, 'w') as f:
-        json.dump(items_cache, f)
+def create_orders_report(config, start, end):
+    """Requests an all-orders flat-file report for [start, end). Returns the reportId."""
+    options = {
+        'method': 'POST',
+        'path': f'{REPORTS_PATH}/reports',
+        'body': {
+            'reportType': ORDERS_REPORT_TYPE,
+            'marketplaceIds': [config['MARKETPLACE_ID']],
+            'dataStartTime': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'dataEndTime': end.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        }
+    }
+    report_id = make_signed_api_request(config, options)['reportId']
+    print(f"[Amazon Reports] Requested report {report_id} for {start:%Y-%m-%d} to {end:%Y-%m-%d}")
+    return report_id
+
+def wait_for_report(config, report_id, timeout_seconds=1800):
+    """Polls a report until it is done. Returns its reportDocumentId, or None if Amazon had no data."""
+    deadline, interval = time.time() + timeout_seconds, 15
+    while time.time() < deadline:
+        report = make_signed_api_request(config, {'method': 'GET', 'path': f'{REPORTS_PATH}/reports/{report_id}'})
+        status = report.get('processingStatus')
+        if status == 'DONE':
+            return report.get('reportDocumentId')
+        if status == 'CANCELLED':
+            # Amazon cancels reports that have no data for the range
+            print(f"[Amazon Reports] Report {report_id} cancelled (no data)")
+            return None
+        if status == 'FATAL':
+            raise Exception(f"Amazon report {report_id} failed (FATAL)")
+        print(f"[Amazon Reports] Report {report_id} is {status}, checking again in {interval}s...")
+        time.sleep(interval)
+        interval = min(interval * 2, 60)
+    raise Exception(f"Amazon report {report_id} was not ready within {timeout_seconds}s")
+
+def iter_report_document_lines(config, document_id):
+    """Downloads a report document and yields its decoded lines, decompressing on the fly."""
+    document = make_signed_api_request(config, {'method': 'GET', 'path': f'{REPORTS_PATH}/documents/{document_id}'})
+    with http_client.get('downloads', document['url'], stream=True) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        stream = response.raw
+        if document.get('compressionAlgorithm') == 'GZIP':
+            stream = gzip.GzipFile(fileobj=stream)
+        yield from io.TextIOWrapper(stream, encoding='utf-8', errors='replace', newline='')
+
+def report_row_item(row):
+    """An order item from a report row, in the orderItems API shape kept in the items store."""
+    currency = row.get('currency') or ''
+    money = lambda key: {'CurrencyCode': currency, 'Amount': row.get(key) or '0'}
+    return {
+        'ASIN': row.get('asin'),
+        'SellerSKU': row.get('sku'),
+        'Title': row.get('product-name'),
+        'QuantityOrdered': int(row.get('quantity') or 0),
+        'ItemPrice': money('item-price'),
+        'ItemTax': money('item-tax'),
+        'ShippingPrice': money('shipping-price'),
+        'PromotionDiscount': money('item-promotion-discount'),
+    }
+
+def normalize_report_order(rows):
+    """Normalizes the report rows of one order into the same shape as normalize_amazon_order."""
+    first = rows[0]
+    raw_status = first.get('order-status') or ''
+    try:
+        order_date = datetime.fromisoformat(first.get('purchase-date', '').replace('Z', '+00:00')).strftime('%Y-%m-%d')
+    except ValueError:
+        order_date = first.get('purchase-date', '')
+    items = [report_row_item(row) for row in rows]
+    total = sum(float(row.get('item-price') or 0) + float(row.get('shipping-price') or 0)
+                - float(row.get('item-promotion-discount') or 0) for row in rows)
+    address = ', '.join(part for part in (first.get('ship-city'), first.get('ship-state')) if part)
+    return {
+        "platform": "Amazon",
+        "id": first['amazon-order-id'],
+        "originalId": first['amazon-order-id'],
+        "date": order_date,
+        "name": 'N/A',  # the flat-file report carries no buyer PII
+        "total": total,
+        "status": 'Cancelled' if raw_status.startswith('Cancel') else
+                  'Shipped' if raw_status.startswith('Shipped') else AMAZON_STATUS_MAP.get(raw_status, 'Processing'),
+        "items": [{"name": i['Title'] or 'N/A', "sku": i['SellerSKU'] or 'N/A', "qty": i['QuantityOrdered']} for i in items],
+        "address": address or 'No address',
+        "paymentMethod": 'N/A',
+        "lastUpdated": first.get('last-updated-date'),
+        "source": REPORT_SOURCE,
+    }, items
+
+def iter_report_orders(lines):
+    """
+    Stream-parses a tab-separated all-orders report. Rows of one order are
+    adjacent, so each order is yielded as (normalized_order, items) as soon
+    as the next order starts.
+    """
+    current_id, rows = None, []
+    for row in csv.DictReader(lines, delimiter='\t'):
+        order_id = row.get('amazon-order-id')
+        if not order_id:
+            continue
+        if order_id != current_id and rows:
+            yield normalize_report_order(rows)
+            rows = []
+        current_id = order_id
+        rows.append(row)
+    if rows:
+        yield normalize_report_order(rows)
+
+def fetch_amazon_orders_via_report(config, days=180):
+    """
+    Report-based alternative to the Orders API crawl: requests all-orders
+    reports in 30-day windows, streams each one into normalized orders and
+    stores their items, so fetch_order_items_batch needs no API calls for them.
+    """
+    items_store = get_amazon_items_store(config)
+    end = datetime.utcnow().replace(microsecond=0)
+    start = end - timedelta(days=days)
+    orders = {}
+    while start < end:
+        window_end = min(start + timedelta(days=REPORT_WINDOW_DAYS), end)
+        document_id = wait_for_report(config, create_orders_report(config, start, window_end))
+        if document_id:
+            report_items = {}
+            for order, items in iter_report_orders(iter_report_document_lines(config, document_id)):
+                if order['id'] in report_items:
+                    # Rows of one order were not adjacent: merge rather than replace
+                    previous = orders[order['id']]
+                    order['items'] = previous['items'] + order['items']
+                    order['total'] += previous['total']
+                    items = report_items[order['id']] + items
+                orders[order['id']] = order
+                report_items[order['id']] = items
+            items_store.put_many(report_items)
+        start = window_end
+    print(f"✅ Ingested {len(orders)} Amazon orders from reports.")
+    return list(orders.values())
 
 def fetch_order_items_batch(config, order_ids, auto_fetch=False):
     """Fetch items for multiple orders with quota handling and caching"""
-    order_items_map = {}
+    items_store = get_amazon_items_store(config)
     
     print(f"[Amazon] Loading items from cache for {len(order_ids)} orders...")
     
-    missing_order_ids = []
-    for order_id in order_ids:
-        cached_items = get_cached_order_items(order_id)
-        if cached_items is not None:
-            order_items_map[order_id] = cached_items
-        else:
-            missing_order_ids.append(order_id)
-            order_items_map[order_id] = []
+    cached = items_store.get_many(order_ids)
+    order_items_map = {order_id: cached.get(order_id, []) for order_id in order_ids}
+    missing_order_ids = [order_id for order_id in order_ids if order_id not in cached]
     
     cached_count = sum(1 for items in order_items_map.values() if items)
     print(f"[Amazon] Loaded {cached_count}/{len(order_ids)} orders with items from cache")
     
     if auto_fetch and missing_order_ids:
         print(f"[Amazon] Auto-fetching items for {len(missing_order_ids)} orders...")
-        print(f"[Amazon] ⚠️ This will take approximately {len(missing_order_ids) * 0.5:.0f} seconds due to API rate limits")
+        rate = sp_api_rate('GET', f'/orders/v0/orders/{missing_order_ids[0]}/orderItems')
+        print(f"[Amazon] ⚠️ This will take approximately {len(missing_order_ids) / rate:.0f} seconds at the getOrderItems rate of {rate}/s")
         
         def fetch_single_order_items(order_id):
             """Fetch items for a single order with retry logic"""
@@ -235,7 +492,7 @@ def fetch_order_items_batch(config, order_ids, auto_fetch=False):
                     
                     response_data = make_signed_api_request(config, options)
                     items = response_data.get('payload', {}).get('OrderItems', [])
-                    save_order_items_to_cache(order_id, items)
+                    items_store.put_many({order_id: items})
                     return (order_id, items, None)
                     
                 except Exception as e:
@@ -245,10 +502,10 @@ def fetch_order_items_batch(config, order_ids, auto_fetch=False):
                         if retry_count < max_retries:
                             time.sleep(10)
                     else:
-                        save_order_items_to_cache(order_id, [])
+                        items_store.put_many({order_id: []})
                         return (order_id, [], str(e))
             
-            save_order_items_to_cache(order_id, [])
+            items_store.put_many({order_id: []})
             return (order_id, [], "Max retries exceeded")
         
         from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -274,8 +531,6 @@ def fetch_order_items_batch(config, order_ids, auto_fetch=False):
                 total_processed = fetched_count + error_count
                 if total_processed % 50 == 0:
                     print(f"[Amazon] Progress: {total_processed}/{len(missing_order_ids)} orders processed ({fetched_count} success, {error_count} failed)")
-                
-                time.sleep(0.5)
         
         print(f"[Amazon] ✅ Auto-fetch complete: {fetched_count} fetched, {error_count} failed")
     
@@ -0,0 +1,95 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Legacy whole-file items cache; imported into the database once if present.
+LEGACY_ITEMS_CACHE_FILE = 'amazon_items_cache.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_items (
+    order_id TEXT PRIMARY KEY,
+    items TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+class AmazonItemsStore:
+    """
+    SQLite-backed Amazon order items, keyed by AmazonOrderId. Reads and writes
+    are batched: get_many loads any number of orders with a single query and
+    put_many writes a batch in one transaction, safely from several threads.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per thread (and per process, in case of a fork).
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM order_items').fetchone()[0]
+
+    def get_many(self, order_ids):
+        """Returns {order_id: items} for the ids that are stored; missing ids are absent."""
+        ids = json.dumps([str(i) for i in order_ids])
+        cursor = self._connect().execute(
+            'SELECT order_id, items FROM order_items WHERE order_id IN (SELECT value FROM json_each(?))', (ids,))
+        return {order_id: json.loads(items) for order_id, items in cursor}
+
+    def put_many(self, items_by_order):
+        """Inserts or replaces {order_id: items} in a single transaction."""
+        now = time.time()
+        rows = [(str(order_id), json.dumps(items), now) for order_id, items in items_by_order.items()]
+        if not rows:
+            return 0
+        with self._write_lock, self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO order_items VALUES (?, ?, ?)', rows)
+        return len(rows)
+
+    def import_legacy_json(self, path=LEGACY_ITEMS_CACHE_FILE):
+        """One-time migration from the old amazon_items_cache.json file."""
+        if not os.path.exists(path):
+            return 0
+        print(f"[Amazon Items] Importing legacy items cache from '{path}'...")
+        try:
+            with open(path, 'r') as f:
+                items_cache = json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError) as e:
+            print(f"[Amazon Items] Could not import legacy items cache: {e}")
+            return 0
+        imported = self.put_many(items_cache)
+        print(f"[Amazon Items] Imported items for {imported} orders.")
+        return imported
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_amazon_items_store(config):
+    """Returns the shared AmazonItemsStore for config['AMAZON_ITEMS_DB_FILE'], creating it on first use."""
+    db_path = config.get('AMAZON_ITEMS_DB_FILE') or 'amazon_items.db'
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = AmazonItemsStore(db_path)
+            if store.count() == 0:
+                for legacy in (config.get('AMAZON_ITEMS_CACHE_FILE'), LEGACY_ITEMS_CACHE_FILE):
+                    if legacy and store.import_legacy_json(legacy):
+                        break
+            _stores[db_path] = store
+        return store
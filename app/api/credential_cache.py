@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+import time
+
+# --- SHARED CREDENTIAL CACHE ---
+# Short-lived upstream tokens (e.g. LWA access tokens) kept in a small SQLite
+# file next to the other caches, so every gunicorn worker and batch script
+# reuses the same token instead of minting its own. Refreshes are single-flight
+# across processes: whoever wins a lease row refreshes, everyone else waits for
+# the new token. A background thread renews tokens ahead of expiry.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS credentials (
+    name TEXT PRIMARY KEY,
+    token TEXT,
+    expires_at REAL NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+EXPIRY_MARGIN_SECONDS = 300   # a token this close to expiry is no longer handed out
+LEASE_SECONDS = 30            # a crashed refresher blocks the others at most this long
+POLL_SECONDS = 0.2
+REFRESH_CHECK_SECONDS = 30
+
+
+class CredentialCache:
+    """
+    name -> (token, expires_at), shared by all processes using the same file.
+    Callers pass a fetch function returning (token, expires_in_seconds); it is
+    only called by the one thread, in the one process, that holds the lease.
+    """
+
+    def __init__(self, db_path, refresh_ahead=600):
+        self.db_path = db_path
+        self.refresh_ahead = max(refresh_ahead, EXPIRY_MARGIN_SECONDS)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._name_locks = {}
+        self._fetchers = {}
+        self._refresher = None
+        self._lock = threading.Lock()   # guards _name_locks, _fetchers and _refresher
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per thread (and per process, in case of a fork).
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _read(self, name):
+        return self._connect().execute(
+            'SELECT token, expires_at, lease_until FROM credentials WHERE name = ?', (name,)).fetchone()
+
+    def _name_lock(self, name):
+        with self._lock:
+            return self._name_locks.setdefault(name, threading.Lock())
+
+    # --- Reads ---
+    def get(self, name, fetch):
+        """Returns (token, usable_until), refreshing through fetch only if no other process has a valid token."""
+        self._register(name, fetch)
+        row = self._read(name)
+        if row and row[0] and row[1] - EXPIRY_MARGIN_SECONDS > time.time():
+            return row[0], row[1] - EXPIRY_MARGIN_SECONDS
+        token, expires_at = self.refresh(name, fetch, min_valid=EXPIRY_MARGIN_SECONDS)
+        return token, expires_at - EXPIRY_MARGIN_SECONDS
+
+    # --- Refresh ---
+    def _try_lease(self, name, now):
+        with self._write_lock, self._connect() as conn:
+            conn.execute('INSERT OR IGNORE INTO credentials (name) VALUES (?)', (name,))
+            cursor = conn.execute('UPDATE credentials SET lease_until = ? WHERE name = ? AND lease_until < ?',
+                                  (now + LEASE_SECONDS, name, now))
+            return cursor.rowcount == 1
+
+    def _store(self, name, token, expires_at):
+        with self._write_lock, self._connect() as conn:
+            conn.execute('UPDATE credentials SET token = ?, expires_at = ?, lease_until = 0 WHERE name = ?',
+                         (token, expires_at, name))
+
+    def _release(self, name):
+        with self._write_lock, self._connect() as conn:
+            conn.execute('UPDATE credentials SET lease_until = 0 WHERE name = ?', (name,))
+
+    def refresh(self, name, fetch, min_valid):
+        """
+        Makes sure the stored token is valid for at least min_valid more seconds
+        and returns (token, expires_at). Threads queue on a per-name lock;
+        processes on the lease column, re-checking the token while they wait.
+        """
+        with self._name_lock(name):
+            while True:
+                now = time.time()
+                row = self._read(name)
+                if row and row[0] and row[1] - min_valid > now:
+                    return row[0], row[1]
+                if self._try_lease(name, now):
+                    break
+                time.sleep(POLL_SECONDS)   # another process is refreshing
+            try:
+                token, expires_in = fetch()
+            except Exception:
+                self._release(name)
+                raise
+            expires_at = now + expires_in
+            self._store(name, token, expires_at)
+            print(f"[Credentials] Refreshed '{name.split(':')[0]}' token, valid for {expires_in / 60:.0f} min")
+            return token, expires_at
+
+    # --- Background renewal ---
+    def _register(self, name, fetch):
+        with self._lock:
+            self._fetchers[name] = fetch
+            if self._refresher is None or not self._refresher.is_alive():
+                self._refresher = threading.Thread(target=self._run_refresher, name='credential-refresher', daemon=True)
+                self._refresher.start()
+
+    def _run_refresher(self):
+        while True:
+            time.sleep(REFRESH_CHECK_SECONDS)
+            with self._lock:
+                fetchers = list(self._fetchers.items())
+            for name, fetch in fetchers:
+                try:
+                    row = self._read(name)
+                    if row is None or row[1] - self.refresh_ahead <= time.time():
+                        self.refresh(name, fetch, min_valid=self.refresh_ahead)
+                except Exception as e:
+                    print(f"[Credentials] Background refresh of '{name.split(':')[0]}' failed: {e}")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_credential_cache(config):
+    """Returns the shared CredentialCache for config['CREDENTIALS_DB_FILE'], creating it on first use."""
+    db_path = config.get('CREDENTIALS_DB_FILE') or 'credentials.db'
+    with _caches_lock:
+        cache = _caches.get(db_path)
+        if cache is None:
+            cache = _caches[db_path] = CredentialCache(
+                db_path, refresh_ahead=config.get('CREDENTIAL_REFRESH_AHEAD_SECONDS', 600))
+        return cache
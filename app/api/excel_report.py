@@ -1,30 +1,14 @@
 from flask import Blueprint, request, Response, current_app
 from ..auth import token_required
-from .helpers import get_facebook_ads, get_order_source_term, normalize_status, pick_date_for_filter
+from .helpers import get_facebook_ads
+from .order_store import get_order_store
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
 import io
 from datetime import datetime
 import traceback
-import os
-import json
 
 excel_report_bp = Blueprint('excel_report', __name__)
-MASTER_DATA_FILE = 'master_order_data.json'
-
-def load_master_orders_utf8_safe(path):
-    """
-    Safely load the master orders JSON file with UTF-8 encoding.
-    Falls back to error-tolerant mode if the file contains invalid UTF-8 bytes.
-    """
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except UnicodeDecodeError as e:
-        print(f"[WARN] UTF-8 decode failed for {path} at position {e.start}: {e.reason}")
-        print("[WARN] Retrying with errors='replace'. Consider regenerating the file by running data_fetcher.py")
-        with open(path, 'r', encoding='utf-8', errors='replace') as f:
-            return json.load(f)
 
 @excel_report_bp.route('/download-excel-report', methods=['GET'])
 @token_required
@@ -38,17 +22,11 @@ def download_excel_report():
 
     try:
         print(f"\n--- [Excel Report] Loading data | filter={date_filter_type} ---")
-        if not os.path.exists(MASTER_DATA_FILE):
-            return "Master data file not found. Please run data_fetcher.py first.", 500
-        
-        # Use safe UTF-8 loader with fallback
-        all_orders = load_master_orders_utf8_safe(MASTER_DATA_FILE)
+        snapshot = get_order_store(config).snapshot()
+        if not snapshot.orders:
+            return "Order store is empty. Please run data_fetcher.py first.", 500
 
-        shopify_orders_in_range = []
-        for o in all_orders:
-            d = pick_date_for_filter(o, date_filter_type)
-            if d and start_date <= d <= end_date:
-                shopify_orders_in_range.append(o)
+        shopify_orders_in_range = snapshot.orders_in_range(date_filter_type, start_date, end_date)
         
         print(f"Filtered to {len(shopify_orders_in_range)} orders for Excel export")
         
@@ -76,9 +54,9 @@ def download_excel_report():
             cell.alignment = Alignment(horizontal='center')
 
         for order in shopify_orders_in_range:
-            source, term = get_order_source_term(order)
+            source, term = order['attribution_source'], order['attribution_term']
             raw_status = order.get('raw_rapidshyp_status', order.get('fulfillment_status') or 'Unfulfilled')
-            status = normalize_status(order, raw_status)
+            status = order['normalized_status']
             
             ad_set_name, ad_name, campaign_name = "N/A", "N/A", "N/A"
             if source == 'facebook_ad':
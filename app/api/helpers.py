@@ -1,111 +1,58 @@
-import hashlib
-import hmac
-from datetime import datetime, timezone
+import asyncio
+from datetime import datetime
 import requests
 import time
 import random
-from urllib.parse import urlencode, urlparse
+import threading
+from urllib.parse import urlparse
 import traceback
-import json
-import os
 import pytz
 
-# --- Global cache for LWA token ---
-lwa_token_cache = { "token": None, "expires_at": 0 }
-
-# --- Create a global session for all RapidShyp requests ---
-rapidshyp_session = requests.Session()
+from . import http_client
+from .sp_api_client import get_sp_api_client
 
 # Timezone
 TZ_INDIA = pytz.timezone('Asia/Kolkata')
 
 # --- AMAZON SP-API FUNCTIONS ---
 def get_lwa_access_token(config):
-    now = time.time()
-    if lwa_token_cache["token"] and lwa_token_cache["expires_at"] > now: return lwa_token_cache["token"]
-    try:
-        response = requests.post('https://api.amazon.com/auth/o2/token', json={ 'grant_type': 'refresh_token', 'refresh_token': config['REFRESH_TOKEN'], 'client_id': config['LWA_CLIENT_ID'], 'client_secret': config['LWA_CLIENT_SECRET'] })
-        response.raise_for_status()
-        data = response.json()
-        lwa_token_cache["token"] = data['access_token']
-        lwa_token_cache["expires_at"] = now + data.get('expires_in', 3600) - 300
-        return lwa_token_cache["token"]
-    except requests.exceptions.RequestException as e:
-        print(f"LWA token error: {e.response.text if e.response else e}")
-        raise Exception("Failed to retrieve LWA access token from Amazon.")
+    return get_sp_api_client(config).access_token()
 
 def make_signed_api_request(config, options, max_retries=5):
-    print("\n--- [START] Creating New Amazon Signed Request ---")
     try:
-        access_token = get_lwa_access_token(config)
-        host, service, method, path, query_params = config['BASE_URL'].replace('https://', ''), 'execute-api', options['method'], options['path'], options.get('queryParams', {})
-        region, secret_key, access_key = config['AWS_REGION'], config['AWS_SECRET_KEY'], config['AWS_ACCESS_KEY']
-        
-        if not secret_key or not access_key or not region:
-            raise ValueError("AWS credentials (AWS_SECRET_KEY, AWS_ACCESS_KEY, AWS_REGION) are not configured properly in your .env file.")
-
-        t = datetime.now(timezone.utc); amz_date = t.strftime('%Y%m%dT%H%M%SZ'); date_stamp = t.strftime('%Y%m%d')
-        canonical_uri, canonical_querystring = path, urlencode(sorted(query_params.items()))
-        canonical_headers = f"host:{host}\nx-amz-access-token:{access_token}\nx-amz-date:{amz_date}\n"; signed_headers = 'host;x-amz-access-token;x-amz-date'
-        payload_hash = hashlib.sha256(b'').hexdigest()
-        canonical_request = f"{method}\n{canonical_uri}\n{canonical_querystring}\n{canonical_headers}\n{signed_headers}\n{payload_hash}"
-        algorithm = 'AWS4-HMAC-SHA256'; credential_scope = f"{date_stamp}/{region}/{service}/aws4_request"
-        string_to_sign = f"{algorithm}\n{amz_date}\n{credential_scope}\n{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
-        
-        def sign_step(key_bytes, msg_string): return hmac.new(key_bytes, msg_string.encode('utf-8'), hashlib.sha256).digest()
-        k_secret = ('AWS4' + secret_key).encode('utf-8'); k_date = sign_step(k_secret, date_stamp)
-        k_region = sign_step(k_date, region); k_service = sign_step(k_region, service)
-        k_signing = sign_step(k_service, 'aws4_request')
-        signature = hmac.new(k_signing, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
-        
-        authorization_header = f"{algorithm} Credential={access_key}/{credential_scope}, SignedHeaders={signed_headers}, Signature={signature}"
-        headers = {'x-amz-access-token': access_token, 'x-amz-date': amz_date, 'Authorization': authorization_header}
-        url = f"{config['BASE_URL']}{path}"
-        
-        for attempt in range(max_retries):
-            try:
-                response = requests.request(method, url, headers=headers, params=query_params)
-
-                if response.status_code == 429:
-                    delay = (2 ** attempt) + (random.random() * 2)
-                    print(f"[RATE LIMIT] Amazon API is busy. Retrying in {delay:.2f} seconds...")
-                    time.sleep(delay)
-                    continue
-
-                response.raise_for_status()
-                print("--- [SUCCESS] Amazon API Request Successful ---\n")
-                return response.json() if response.content else {}
-            except requests.exceptions.RequestException as e:
-                print(f"Amazon SP-API request failed on attempt {attempt + 1}: {e}")
-                if attempt >= max_retries - 1: raise e
-                time.sleep((2 ** attempt) + random.random())
-        raise Exception("Max retries exceeded for SP-API request.")
+        return get_sp_api_client(config).request(options, max_retries=max_retries)
+    except http_client.CircuitOpenError as e:
+        print(f"[SP-API] {e}; failing fast")
+        raise
     except Exception as e:
         print(f"--- [CRITICAL ERROR] Amazon request failed: ---"); traceback.print_exc()
         raise e
 
-# --- RAPIDSHYP CACHE ---
-CACHE_FILE = 'rapidshyp_cache.json'
-
-def load_cache():
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'r') as f: return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError): return {}
-    return {}
+# --- SHOPIFY FUNCTIONS ---
+SHOPIFY_API_VERSION = '2024-07'
 
-def save_cache(cache):
-    with open(CACHE_FILE, 'w') as f: json.dump(cache, f, indent=2)
+def shopify_admin_url(config, path):
+    """
+    Builds an Admin API URL. SHOPIFY_SHOP_URL is normally a bare shop domain;
+    a value with a scheme (e.g. http://127.0.0.1:8000) is used as-is for local stand-ins.
+    """
+    shop = config['SHOPIFY_SHOP_URL'] or ''
+    base = shop if '://' in shop else f"https://{shop}"
+    return f"{base.rstrip('/')}/admin/api/{SHOPIFY_API_VERSION}/{path}"
 
-# --- SHOPIFY FUNCTIONS ---
-def get_all_shopify_orders_paginated(config, params):
-    all_orders, url, page_num = [], f"https://{config['SHOPIFY_SHOP_URL']}/admin/api/2024-07/orders.json", 1
+def iter_shopify_order_pages(config, params, raise_on_error=False):
+    """
+    Follows Shopify's Link-header pagination, yielding one page of orders at a
+    time. By default a failed page ends the crawl with what was fetched so far;
+    with raise_on_error the error propagates so callers that advance a
+    watermark never skip unfetched pages.
+    """
+    url, page_num = shopify_admin_url(config, 'orders.json'), 1
     headers = {'X-Shopify-Access-Token': config['SHOPIFY_TOKEN']}
     while url:
         try:
-            response = requests.get(url, headers=headers, params=params); response.raise_for_status()
+            response = http_client.get('shopify', url, headers=headers, params=params); response.raise_for_status()
             data = response.json(); orders_on_page = data.get('orders', [])
-            all_orders.extend(orders_on_page)
             print(f"[Shopify] Fetched page {page_num} ({len(orders_on_page)} orders)...")
             link_header, url = response.headers.get('Link'), None
             if link_header:
@@ -113,95 +60,268 @@ def get_all_shopify_orders_paginated(config, params):
                 for link in links:
                     if link.get('rel') == 'next': url = link.get('url'); params = {}; page_num += 1; break
         except requests.exceptions.RequestException as e:
-            print(f"Shopify API Error on page {page_num}: {e}"); break
+            print(f"Shopify API Error on page {page_num}: {e}")
+            if raise_on_error: raise
+            break
+        yield orders_on_page
+
+def get_all_shopify_orders_paginated(config, params, raise_on_error=False):
+    all_orders = []
+    for orders_on_page in iter_shopify_order_pages(config, params, raise_on_error):
+        all_orders.extend(orders_on_page)
     print(f"[Shopify] Total orders fetched: {len(all_orders)}")
     return all_orders
 
+def newest_updated_at(orders, current=None):
+    """Returns the latest Shopify updated_at among orders (ISO string), or current."""
+    newest_dt, newest = safe_parse_date(current), current
+    for order in orders:
+        dt = safe_parse_date(order.get('updated_at'))
+        if dt and (newest_dt is None or dt > newest_dt):
+            newest_dt, newest = dt, order['updated_at']
+    return newest
+
 # --- RAPIDSHYP FUNCTIONS (NOW WITH RETRY LOGIC) ---
-def get_raw_rapidshyp_status(awb, cache, config):
-    """Fetch current RapidShyp status for an AWB with retry logic."""
-    now = time.time()
-    if awb in cache:
-        entry = cache[awb]
-        if isinstance(entry, dict):
-            cached_status, last_checked = entry.get('raw_status', entry.get('status')), entry.get('timestamp', 0)
-            if any(s in (cached_status or '').upper() for s in ['DELIVERED', 'RTO']) or (now - last_checked) < 3600:
-                return cached_status
+RAPIDSHYP_API_BASE = "https://api.rapidshyp.com/rapidshyp/apis/v1"
+RAPIDSHYP_ERROR_STATUS = "API Error or Timeout"
 
-    url = "https://api.rapidshyp.com/rapidshyp/apis/v1/track_order"
-    headers = {"rapidshyp-token": config.get('RAPIDSHYP_API_KEY'), "Content-Type": "application/json"}
-    if not headers["rapidshyp-token"]: return "API Key Missing"
+def rapidshyp_url(config, endpoint):
+    """Builds a RapidShyp API URL; RAPIDSHYP_API_BASE can point at a local stand-in."""
+    return f"{(config.get('RAPIDSHYP_API_BASE') or RAPIDSHYP_API_BASE).rstrip('/')}/{endpoint}"
 
-    for attempt in range(3): # Try up to 3 times
-        try:
-            res = rapidshyp_session.post(url, headers=headers, json={'awb': awb}, timeout=10)
-            if res.status_code == 429:
-                wait_time = (2 ** attempt) + random.random()
-                print(f"[RATE LIMIT] Waiting for {wait_time:.2f}s for AWB {awb}")
-                time.sleep(wait_time)
-                continue # Retry
-            
-            res.raise_for_status()
-            data = res.json()
-            if data.get('success') and data.get('records'):
-                shipment = data['records'][0].get('shipment_details', [{}])[0]
-                # --- THIS IS THE FIX ---
-                # Prioritize the specific shipment_status if available
-                raw_status = shipment.get('shipment_status') or \
-                             shipment.get('current_tracking_status_desc') or \
-                             shipment.get('current_tracking_status') or \
-                             'Status Not Available'
-                # --- END OF FIX ---
-                cache[awb] = {'raw_status': raw_status, 'timestamp': now}
-                return raw_status
-        except requests.exceptions.RequestException as e:
-            if attempt >= 2: # Last attempt failed
-                print(f"RapidShyp status fetch error for AWB {awb}: {e}")
-                break # Exit loop
-            time.sleep((2 ** attempt) + random.random()) # Wait before retrying non-429 errors
-    
-    return "API Error or Timeout"
+def parse_rapidshyp_shipment(shipment, awb):
+    """
+    Extracts {raw_status, events, rto_awb} from one track_order shipment_details entry.
+    """
+    # Prioritize the specific shipment_status if available
+    raw_status = shipment.get('shipment_status') or \
+                 shipment.get('current_tracking_status_desc') or \
+                 shipment.get('current_tracking_status') or \
+                 shipment.get('current_status') or \
+                 'Status Not Available'
+
+    history = shipment.get('tracking_history') or []
+    events = []
+    for ev in history:
+        status = ev.get('status_desc') or ev.get('status') or ev.get('current_tracking_status_desc') or ''
+        ts = ev.get('date') or ev.get('timestamp') or ev.get('event_time') or ev.get('time') or ''
+        loc = ev.get('location') or ev.get('city') or ''
+        events.append({"status": status, "timestamp": ts, "location": loc})
+
+    # Try to detect RTO AWB
+    possible_keys = ['rto_awb', 'return_awb', 'return_shipment_awb', 'linked_awb', 'child_awb', 'reverse_awb']
+    rto_awb = None
+    for k in possible_keys:
+        v = shipment.get(k)
+        if isinstance(v, str) and len(v) >= 8:
+            rto_awb = v
+            break
+
+    # Fallback: parse from history text
+    if not rto_awb:
+        for ev in history:
+            for field in ['remarks', 'note', 'status_desc', 'status']:
+                txt = str(ev.get(field) or '')
+                if 'AWB' in txt.upper() or 'RETURN' in txt.upper():
+                    parts = [p.strip(' ,.-:()[]') for p in txt.split()]
+                    for p in parts:
+                        if p != awb and len(p) >= 8 and p.replace('-','').isalnum():
+                            rto_awb = p
+                            break
+                if rto_awb:
+                    break
+            if rto_awb:
+                break
 
+    return {"raw_status": raw_status, "events": events, "rto_awb": rto_awb}
 
-def get_rapidshyp_timeline(awb, config):
-    """Fetch full RapidShyp event timeline for an AWB with retry logic."""
-    url = "https://api.rapidshyp.com/rapidshyp/apis/v1/track_order"
+def fetch_rapidshyp_tracking(awb, cache, config):
+    """
+    Fetches status, timeline and RTO AWB for an AWB with a single track_order
+    call (retried by the shared HTTP client) and records the status in the cache.
+    Returns None if the API key is missing or every attempt failed.
+    """
     headers = {"rapidshyp-token": config.get('RAPIDSHYP_API_KEY'), "Content-Type": "application/json"}
-    if not headers["rapidshyp-token"]: 
-        return []
+    if not headers["rapidshyp-token"]: return None
+
+    try:
+        # track_order only reads, so it is safe to resend
+        res = http_client.post('rapidshyp', rapidshyp_url(config, 'track_order'), headers=headers, json={'awb': awb}, idempotent=True, timeout=10)
+        res.raise_for_status()
+        data = res.json()
+        if data.get('success') and data.get('records'):
+            shipment = (data['records'][0].get('shipment_details') or [{}])[0]
+            details = parse_rapidshyp_shipment(shipment, awb)
+            if cache is not None:
+                cache[awb] = {'raw_status': details['raw_status'], 'timestamp': time.time()}
+            return details
+    except http_client.CircuitOpenError:
+        pass   # already reported when the circuit opened
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"RapidShyp tracking fetch error for AWB {awb}: {e}")
+    return None
+
+# --- ASYNC RAPIDSHYP TRACKING CLIENT ---
+async def _fetch_rapidshyp_tracking_async(session, semaphore, awb, config, timeout):
+    """
+    Async counterpart of fetch_rapidshyp_tracking. The semaphore bounds
+    in-flight requests; backoff sleeps happen outside it so a throttled AWB
+    does not hold a slot.
+    """
+    import aiohttp
 
+    headers = {"rapidshyp-token": config.get('RAPIDSHYP_API_KEY'), "Content-Type": "application/json"}
+    url = rapidshyp_url(config, 'track_order')
+    # Shares the RapidShyp circuit breaker with the synchronous client
+    breaker = http_client.get_breaker('rapidshyp')
     for attempt in range(3): # Try up to 3 times
+        if not breaker.allow():
+            return None
         try:
-            res = rapidshyp_session.post(url, headers=headers, json={'awb': awb}, timeout=10)
-            if res.status_code == 429:
+            async with semaphore:
+                async with session.post(url, headers=headers, json={'awb': awb}, timeout=aiohttp.ClientTimeout(total=timeout)) as res:
+                    status_code = res.status
+                    breaker.record(status_code < 500)
+                    if status_code != 429:
+                        res.raise_for_status()
+                        data = await res.json(content_type=None)
+            if status_code == 429:
                 wait_time = (2 ** attempt) + random.random()
-                print(f"[RATE LIMIT] Waiting for {wait_time:.2f}s for AWB timeline {awb}")
-                time.sleep(wait_time)
+                print(f"[RATE LIMIT] Waiting for {wait_time:.2f}s for AWB {awb}")
+                await asyncio.sleep(wait_time)
                 continue # Retry
-            
-            res.raise_for_status()
-            data = res.json()
+
             if data.get('success') and data.get('records'):
-                shipment = data['records'][0].get('shipment_details', [{}])[0]
-                tracking_history = shipment.get('tracking_history', [])
-                events = []
-                for event in tracking_history:
-                    status = event.get('status_desc') or event.get('status') or event.get('current_tracking_status_desc') or ''
-                    timestamp = event.get('date') or event.get('timestamp') or event.get('event_time') or ''
-                    location = event.get('location') or event.get('city') or ''
-                    events.append({
-                        'status': status,
-                        'timestamp': timestamp,
-                        'location': location
-                    })
-                return events
-        except requests.exceptions.RequestException as e:
+                shipment = (data['records'][0].get('shipment_details') or [{}])[0]
+                return parse_rapidshyp_shipment(shipment, awb)
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            if not isinstance(e, aiohttp.ClientResponseError):
+                breaker.record(False)
             if attempt >= 2: # Last attempt failed
-                print(f"RapidShyp timeline fetch error for AWB {awb}: {e}")
+                print(f"RapidShyp tracking fetch error for AWB {awb}: {e!r}")
                 break
-            time.sleep((2 ** attempt) + random.random())
+            await asyncio.sleep((2 ** attempt) + random.random())
+    return None
+
+class RapidShypTrackingSession:
+    """
+    One event loop thread and aiohttp session shared by every thread that
+    calls fetch_many(), so all enrich workers of a sync together keep at most
+    `concurrency` requests in flight (Config.RAPIDSHYP_ASYNC_CONCURRENCY).
+    Call close() when done.
+    """
+
+    def __init__(self, config, concurrency=None, timeout=10):
+        self.config = config
+        self.concurrency = concurrency or config.get('RAPIDSHYP_ASYNC_CONCURRENCY') or 50
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='rapidshyp-async', daemon=True)
+        self._thread.start()
+        self._session, self._semaphore = self._call(self._open())
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _open(self):
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        return aiohttp.ClientSession(connector=connector), asyncio.Semaphore(self.concurrency)
+
+    async def _fetch_many(self, awbs, cache):
+        results = {}
+
+        async def one(awb):
+            details = await _fetch_rapidshyp_tracking_async(self._session, self._semaphore, awb, self.config, self.timeout)
+            results[awb] = details
+            if details and cache is not None:
+                cache[awb] = {'raw_status': details['raw_status'], 'timestamp': time.time()}
+
+        await asyncio.gather(*(one(awb) for awb in awbs))
+        return results
+
+    def fetch_many(self, awbs, cache):
+        """
+        Returns {awb: details or None}, like fetch_rapidshyp_tracking per AWB,
+        and records fetched statuses in the cache. Blocks the calling thread
+        until its AWBs are done; other callers' AWBs share the same slots.
+        """
+        if not self.config.get('RAPIDSHYP_API_KEY'):
+            return {awb: None for awb in awbs}
+        return self._call(self._fetch_many(list(awbs), cache))
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        self._call(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def fetch_rapidshyp_tracking_many(awbs, cache, config, concurrency=None, timeout=10):
+    """
+    Fetches tracking details for many AWBs on a one-off RapidShypTrackingSession
+    with at most `concurrency` requests in flight. Callers fetching repeatedly
+    (the sync) should share one session instead. Requires aiohttp.
+    """
+    if not config.get('RAPIDSHYP_API_KEY'):
+        return {awb: None for awb in awbs}
+    with RapidShypTrackingSession(config, concurrency, timeout) as session:
+        return session.fetch_many(awbs, cache)
+
+def is_terminal_status(status):
+    """Delivered and RTO shipments no longer change for reporting purposes."""
+    status_upper = (status or '').upper()
+    if 'UNDELIVERED' in status_upper:
+        return False
+    return 'DELIVERED' in status_upper or 'RTO' in status_upper
+
+def is_terminal_shipment(order, cache_entry=None):
+    """
+    True if the shipment has reached a terminal state according to the cache,
+    the webhook status or the stored status/events.
+    """
+    if isinstance(cache_entry, dict) and is_terminal_status(cache_entry.get('raw_status', cache_entry.get('status'))):
+        return True
+    if is_terminal_status(order.get('rapidshyp_webhook_status')) or is_terminal_status(order.get('raw_rapidshyp_status')):
+        return True
+    return any(
+        is_terminal_status(ev.get('status')) and 'OUT FOR DELIVERY' not in (ev.get('status') or '').upper()
+        for ev in order.get('rapidshyp_events') or []
+    )
 
-    return []
+def get_raw_rapidshyp_status(awb, cache, config):
+    """Fetch current RapidShyp status for an AWB, using the cache when fresh or terminal."""
+    now = time.time()
+    if awb in cache:
+        entry = cache[awb]
+        if isinstance(entry, dict):
+            cached_status, last_checked = entry.get('raw_status', entry.get('status')), entry.get('timestamp', 0)
+            if is_terminal_status(cached_status) or (now - last_checked) < 3600:
+                return cached_status
+
+    if not config.get('RAPIDSHYP_API_KEY'): return "API Key Missing"
+    details = fetch_rapidshyp_tracking(awb, cache, config)
+    if details:
+        return details['raw_status']
+    # RapidShyp is down: a stale status beats an error
+    if http_client.is_open('rapidshyp') and isinstance(cache.get(awb), dict):
+        return cache[awb].get('raw_status', cache[awb].get('status')) or RAPIDSHYP_ERROR_STATUS
+    return RAPIDSHYP_ERROR_STATUS
+
+
+def get_rapidshyp_timeline(awb, config):
+    """Fetch full RapidShyp event timeline for an AWB with retry logic."""
+    details = fetch_rapidshyp_tracking(awb, None, config)
+    return details['events'] if details else []
 
 def has_rto_initiated(order):
     """
@@ -311,67 +431,8 @@ def get_rapidshyp_details(awb, config):
       "raw_status": str or None
     }
     """
-    url = "https://api.rapidshyp.com/rapidshyp/apis/v1/track_order"
-    headers = {"rapidshyp-token": config.get('RAPIDSHYP_API_KEY'), "Content-Type": "application/json"}
-    if not headers["rapidshyp-token"]:
-        return {"events": [], "rto_awb": None, "raw_status": None}
-    try:
-        # --- MODIFIED: Use the session object ---
-        res = rapidshyp_session.post(url, headers=headers, json={'awb': awb}, timeout=12)
-        res.raise_for_status()
-        data = res.json()
-        if not (data.get('success') and data.get('records')):
-            return {"events": [], "rto_awb": None, "raw_status": None}
-
-        rec = data['records'][0]
-        shipment = (rec.get('shipment_details') or [{}])[0]
-
-        # Extract raw status
-        raw_status = (
-            shipment.get('current_tracking_status_desc') or
-            shipment.get('current_status') or
-            shipment.get('status') or
-            None
-        )
-
-        # Extract timeline events
-        history = shipment.get('tracking_history') or []
-        events = []
-        for ev in history:
-            status = ev.get('status_desc') or ev.get('status') or ev.get('current_tracking_status_desc') or ''
-            ts = ev.get('event_time') or ev.get('date') or ev.get('timestamp') or ev.get('time') or ''
-            loc = ev.get('location') or ev.get('city') or ''
-            events.append({"status": status, "timestamp": ts, "location": loc})
-
-        # Try to detect RTO AWB
-        possible_keys = ['rto_awb', 'return_awb', 'return_shipment_awb', 'linked_awb', 'child_awb', 'reverse_awb']
-        rto_awb = None
-        for k in possible_keys:
-            v = shipment.get(k)
-            if isinstance(v, str) and len(v) >= 8:
-                rto_awb = v
-                break
-
-        # Fallback: parse from history text
-        if not rto_awb:
-            for ev in history:
-                for field in ['remarks', 'note', 'status_desc', 'status']:
-                    txt = str(ev.get(field) or '')
-                    if 'AWB' in txt.upper() or 'RETURN' in txt.upper():
-                        parts = [p.strip(' ,.-:()[]') for p in txt.split()]
-                        for p in parts:
-                            if p != awb and len(p) >= 8 and p.replace('-','').isalnum():
-                                rto_awb = p
-                                break
-                    if rto_awb:
-                        break
-                if rto_awb:
-                    break
-
-        return {"events": events, "rto_awb": rto_awb, "raw_status": raw_status}
-    except Exception as e:
-        print(f"[RapidShyp] details fetch error for AWB {awb}: {e}")
-        return {"events": [], "rto_awb": None, "raw_status": None}
+    details = fetch_rapidshyp_tracking(awb, None, config)
+    return details or {"events": [], "rto_awb": None, "raw_status": None}
 
 def is_undelivered(order):
     """Check if order is in Undelivered state."""
@@ -412,13 +473,27 @@ def get_order_source_term(order):
     return ('direct', 'direct')
 
 # --- FACEBOOK ADS FUNCTIONS ---
+# Last successful result per date range, served while the Graph API is failing
+facebook_ads_cache = {}
+FACEBOOK_ADS_CACHE_SIZE = 32
+
 def get_facebook_ads(config, since, until):
     url = f"https://graph.facebook.com/v18.0/act_{config['FACEBOOK_AD_ACCOUNT_ID']}/insights"
     params = {'level': 'ad', 'fields': 'ad_id,ad_name,adset_id,adset_name,spend,campaign_name', 'time_range': f"{{'since':'{since}','until':'{until}'}}", 'limit': 1000, 'access_token': config['FACEBOOK_ACCESS_TOKEN']}
     try:
-        r = requests.get(url, params=params); r.raise_for_status(); data = r.json().get('data', [])
-        return [{**ad, 'spend': float(ad.get('spend', 0))} for ad in data]
-    except Exception as e: print(f"FB Adset API Error: {e}"); return []
+        r = http_client.get('facebook', url, params=params); r.raise_for_status(); data = r.json().get('data', [])
+        ads = [{**ad, 'spend': float(ad.get('spend', 0))} for ad in data]
+    except Exception as e:
+        print(f"FB Adset API Error: {e}")
+        cached = facebook_ads_cache.get((since, until))
+        if cached is not None:
+            print(f"[Facebook] Serving cached ads for {since}..{until}")
+            return cached
+        return []
+    if len(facebook_ads_cache) >= FACEBOOK_ADS_CACHE_SIZE:
+        facebook_ads_cache.pop(next(iter(facebook_ads_cache)), None)
+    facebook_ads_cache[(since, until)] = ads
+    return ads
 
 # --- DATE FILTER HELPERS WITH TIMEZONE SUPPORT ---
 def safe_parse_date(dt_str):
@@ -521,4 +596,26 @@ def pick_date_for_filter(order, date_filter_type: str):
         dt = infer_delivered_datetime(order)
         return dt.date() if dt else None
 
-    return created_date
\ No newline at end of file
+    return created_date
+
+# --- MATERIALIZED ORDER FIELDS ---
+def materialize_order_fields(order):
+    """
+    Computes the values the dashboard endpoints filter and group by (IST
+    dates, normalized status, attribution, undelivered flag) and stores
+    them on the order, so requests only have to filter and sum.
+    """
+    created_dt = safe_parse_date(order.get('created_at'))
+    shipped_dt = safe_parse_date(order.get('shipped_at')) or infer_shipped_datetime(order)
+    delivered_dt = safe_parse_date(order.get('delivered_at')) or infer_delivered_datetime(order)
+    source, term = get_order_source_term(order)
+
+    order['ist_order_date'] = created_dt.date().isoformat() if created_dt else None
+    # Same fallback as pick_date_for_filter: unshipped orders filter by order date
+    order['ist_shipped_date'] = shipped_dt.date().isoformat() if shipped_dt else order['ist_order_date']
+    order['ist_delivered_date'] = delivered_dt.date().isoformat() if delivered_dt else None
+    order['normalized_status'] = normalize_status(order, order.get('raw_rapidshyp_status'))
+    order['attribution_source'] = source
+    order['attribution_term'] = term
+    order['is_undelivered'] = is_undelivered(order)
+    return order
@@ -0,0 +1,302 @@
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- SHARED HTTP CLIENT ---
+# One pooled keep-alive session per upstream, with default timeouts, a uniform
+# retry policy and per-upstream counters. Every outbound HTTP call in the app
+# and the batch scripts goes through request()/get()/post() here.
+#
+# Each upstream also has a circuit breaker: once too many recent requests have
+# failed it opens and requests fail fast with CircuitOpenError, then after a
+# cool-down a single probe decides whether it closes again. Requests to one
+# host are capped at the pool size in flight (streamed downloads count until
+# they are closed); callers beyond that wait briefly for a slot and then fail
+# fast too.
+
+# upstream: (pool size = in-flight cap per host, connect timeout, read timeout, retries)
+UPSTREAMS = {
+    'shopify': (10, 5, 30, 3),
+    'facebook': (4, 5, 30, 2),
+    'rapidshyp': (20, 5, 15, 2),
+    'sp-api': (20, 5, 30, 0),     # SPAPIClient paces and retries itself
+    'lwa': (2, 5, 15, 2),
+    'downloads': (10, 10, 300, 2),  # label/invoice PDFs, report documents, bulk exports
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REJECTED_STATUSES = {429, 503}    # the upstream did not act on the request, so even a POST is safe to resend
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+MAX_RETRY_AFTER_SECONDS = 60
+SLOW_REQUEST_SECONDS = 10
+
+BREAKER_WINDOW_SECONDS = 60
+BREAKER_MIN_REQUESTS = 10       # don't judge an upstream on a handful of requests
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_OPEN_SECONDS = 30
+SLOT_WAIT_SECONDS = 10
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to an upstream that is failing or saturated."""
+
+
+class CircuitBreaker:
+    """
+    closed: requests flow and outcomes are counted over a sliding window; a
+    failure rate above the threshold opens the breaker.
+    open: requests are refused until the cool-down has passed.
+    half-open: one probe is let through; success closes, failure re-opens.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.state = 'closed'
+        self._outcomes = deque()   # (time, failed)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a request may be sent now. In half-open state this claims the single probe."""
+        with self._lock:
+            if self.state == 'open' and time.time() - self._opened_at >= BREAKER_OPEN_SECONDS:
+                self.state, self._probe_in_flight = 'half-open', False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half-open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def is_open(self):
+        """True while requests are being refused (open, or half-open with its probe out)."""
+        with self._lock:
+            if self.state == 'open':
+                return time.time() - self._opened_at < BREAKER_OPEN_SECONDS
+            return self.state == 'half-open' and self._probe_in_flight
+
+    def record(self, ok):
+        with self._lock:
+            now = time.time()
+            if self.state == 'half-open':
+                if ok:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                    print(f"[HTTP] {self.name} circuit closed")
+                else:
+                    self._open(now)
+                return
+            if self.state == 'open':
+                return
+            self._outcomes.append((now, not ok))
+            while self._outcomes and now - self._outcomes[0][0] > BREAKER_WINDOW_SECONDS:
+                self._outcomes.popleft()
+            failures = sum(1 for _, failed in self._outcomes if failed)
+            if len(self._outcomes) >= BREAKER_MIN_REQUESTS and failures / len(self._outcomes) >= BREAKER_FAILURE_RATE:
+                self._open(now)
+
+    def cancel(self):
+        """Gives back a half-open probe claimed by allow() when no request was sent after all."""
+        with self._lock:
+            if self.state == 'half-open':
+                self._probe_in_flight = False
+
+    def _open(self, now):
+        self.state, self._opened_at, self._probe_in_flight = 'open', now, False
+        self._outcomes.clear()
+        print(f"[HTTP] {self.name} circuit OPEN; failing fast for {BREAKER_OPEN_SECONDS}s")
+
+
+class UpstreamStats:
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=False, retry=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.retries += int(retry)
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def summary(self):
+        avg = self.total_seconds / self.requests if self.requests else 0.0
+        return (f"{self.name}: {self.requests} requests, {self.errors} errors, {self.retries} retries, "
+                f"avg {avg:.2f}s, max {self.max_seconds:.2f}s")
+
+
+_sessions = {}
+_stats = {}
+_breakers = {}
+_host_slots = {}
+_lock = threading.Lock()
+
+
+def get_session(upstream):
+    """Returns this process's pooled session for the upstream (recreated after a fork)."""
+    key = (upstream, os.getpid())
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                pool_size = UPSTREAMS[upstream][0]
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _sessions[key] = session
+    return session
+
+
+def get_stats(upstream):
+    stats = _stats.get(upstream)
+    if stats is None:
+        with _lock:
+            stats = _stats.setdefault(upstream, UpstreamStats(upstream))
+    return stats
+
+
+def get_breaker(upstream):
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(upstream, CircuitBreaker(upstream))
+    return breaker
+
+
+def is_open(upstream):
+    """True while the upstream's breaker is refusing requests; callers can serve cached data instead."""
+    return get_breaker(upstream).is_open()
+
+
+def _host_slot(upstream, url):
+    host = urlparse(url).netloc
+    slot = _host_slots.get(host)
+    if slot is None:
+        with _lock:
+            slot = _host_slots.setdefault(host, threading.BoundedSemaphore(UPSTREAMS[upstream][0]))
+    return slot
+
+
+def _hold_slot_until_closed(response, slot):
+    """A streamed body is still downloading after the headers arrive; the host slot is freed on close()."""
+    release = weakref.finalize(response, slot.release)   # also frees it if the caller never closes
+    close = response.close
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            release()
+    response.close = close_and_release
+
+
+def retry_after_seconds(response):
+    """Parses Retry-After as delta-seconds or an HTTP date; None if absent or unparseable."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def request(upstream, method, url, retries=None, idempotent=None, **kwargs):
+    """
+    Sends a request through the upstream's session with its default timeout.
+    Retries connection errors and 429/5xx responses with jittered backoff, or
+    after Retry-After when the upstream sends one. Non-idempotent methods are
+    only resent when the upstream rejected them outright (429/503). Returns the
+    last response; connection errors from the final attempt propagate, and
+    CircuitOpenError is raised while the upstream's breaker is open or its
+    host has no free slot.
+    """
+    _, connect_timeout, read_timeout, default_retries = UPSTREAMS[upstream]
+    retries = default_retries if retries is None else retries
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    kwargs.setdefault('timeout', (connect_timeout, read_timeout))
+    session, stats, breaker, slot = get_session(upstream), get_stats(upstream), get_breaker(upstream), _host_slot(upstream, url)
+
+    for attempt in range(retries + 1):
+        last_attempt = attempt >= retries
+        if not breaker.allow():
+            raise CircuitOpenError(f"{upstream} circuit is open")
+        if not slot.acquire(timeout=SLOT_WAIT_SECONDS):
+            breaker.cancel()   # saturation is our own doing, not an upstream failure
+            raise CircuitOpenError(f"{upstream}: too many requests in flight to {urlparse(url).netloc}")
+        started = time.time()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            slot.release()
+            breaker.record(False)
+            stats.record(time.time() - started, error=True, retry=not last_attempt and idempotent)
+            if last_attempt or not idempotent:
+                raise
+            delay = (2 ** attempt) + random.random()
+            print(f"[HTTP] {upstream} {method} failed ({e.__class__.__name__}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        except BaseException:
+            # Any other failure (bad chunking, decoding, redirects...) still settles a half-open probe
+            slot.release()
+            breaker.record(False)
+            stats.record(time.time() - started, error=True)
+            raise
+        if kwargs.get('stream'):
+            _hold_slot_until_closed(response, slot)
+        else:
+            slot.release()
+
+        elapsed = time.time() - started
+        # Throttling (429) is paced by the retry policy; only server errors count against the upstream
+        breaker.record(response.status_code < 500)
+        if elapsed >= SLOW_REQUEST_SECONDS:
+            print(f"[HTTP] Slow {upstream} {method} {response.status_code} took {elapsed:.1f}s")
+        retryable = response.status_code in (RETRY_STATUSES if idempotent else REJECTED_STATUSES)
+        delay = retry_after_seconds(response) if retryable else None
+        if retryable and delay is None:
+            delay = (2 ** attempt) + random.random()
+        if not retryable or last_attempt or delay > MAX_RETRY_AFTER_SECONDS:
+            stats.record(elapsed, error=response.status_code >= 400)
+            return response
+        stats.record(elapsed, error=True, retry=True)
+        print(f"[HTTP] {upstream} {method} returned {response.status_code}; retrying in {delay:.1f}s")
+        response.close()
+        time.sleep(delay)
+
+
+def get(upstream, url, **kwargs):
+    return request(upstream, 'GET', url, **kwargs)
+
+
+def post(upstream, url, **kwargs):
+    return request(upstream, 'POST', url, **kwargs)
+
+
+def log_http_stats():
+    """Prints per-upstream request counts and latencies (called at the end of batch runs)."""
+    for stats in list(_stats.values()):
+        if stats.requests:
+            print(f"[HTTP] {stats.summary()}")
@@ -0,0 +1,116 @@
+import json
+import os
+import queue
+import threading
+
+# --- ORDER CHANGE BROADCASTER ---
+# One poller thread per process follows the order store's change sequence,
+# which sync runs (in any process) and the webhook writer append to, and fans
+# each batch of changes out to the connected /orders/stream clients. A batch
+# is rendered and serialized once, however many dashboards are listening.
+
+SUBSCRIBER_QUEUE_SIZE = 50
+
+
+class Subscriber:
+    """One connected stream. A client that stops reading overflows and is told to reload."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+
+class OrderEventBroadcaster:
+    """
+    Publishes (event, data, seq) tuples to every subscriber. `render(seq,
+    kinds)` turns a changes_since() result into the event payload.
+    """
+
+    def __init__(self, store, render, poll_seconds=1.0, max_clients=40):
+        self.store = store
+        self.render = render
+        self.poll_seconds = poll_seconds
+        self.max_clients = max_clients
+        self.seq = store.change_seq()
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._poller_pid = None
+
+    def subscribe(self):
+        """Returns a new Subscriber, or None if this process already serves max_clients streams."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            subscriber = Subscriber()
+            self._subscribers.add(subscriber)
+            if self._poller_pid != os.getpid():
+                self._poller_pid = os.getpid()
+                threading.Thread(target=self._run_poller, name='order-event-poller', daemon=True).start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def client_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def wake(self):
+        """Checks for changes now instead of at the next poll (e.g. right after a webhook write)."""
+        self._wake.set()
+
+    def publish(self, event, data, seq):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait((event, data, seq))
+            except queue.Full:
+                subscriber.overflowed = True
+
+    def poll_once(self):
+        seq, kinds = self.store.changes_since(self.seq)
+        if kinds is None:
+            self.publish('reset', json.dumps({'seq': seq}), seq)
+        elif kinds and self.client_count():
+            self.publish('changes', json.dumps(self.render(seq, kinds)), seq)
+        self.seq = seq
+
+    def _run_poller(self):
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"[Order Events] Poll failed: {e}")
+
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+
+def get_order_broadcaster(config, store, render):
+    """Returns the shared broadcaster for the store, creating it on first use."""
+    with _broadcasters_lock:
+        broadcaster = _broadcasters.get(store.db_path)
+        if broadcaster is None:
+            broadcaster = _broadcasters[store.db_path] = OrderEventBroadcaster(
+                store, render,
+                poll_seconds=config.get('ORDER_STREAM_POLL_SECONDS', 1.0),
+                max_clients=config.get('ORDER_STREAM_MAX_CLIENTS', 12),
+            )
+        return broadcaster
+
+
+def wake_order_broadcasters():
+    """Called by writers in this process so their changes reach streams without waiting for the poll."""
+    for broadcaster in list(_broadcasters.values()):
+        broadcaster.wake()
+
+
+def format_sse(event, data, seq=None):
+    lines = f"id: {seq}\n" if seq is not None else ''
+    return f"{lines}event: {event}\ndata: {data}\n\n"
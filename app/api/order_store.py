@@ -0,0 +1,491 @@
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .helpers import materialize_order_fields
+
+# Legacy single-file store; imported into the database once if present.
+MASTER_DATA_FILE = 'master_order_data.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    awb TEXT,
+    created_date TEXT,
+    shipped_date TEXT,
+    delivered_date TEXT,
+    source TEXT,
+    term TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_name ON orders(name);
+CREATE INDEX IF NOT EXISTS idx_orders_awb ON orders(awb);
+CREATE INDEX IF NOT EXISTS idx_orders_created_date ON orders(created_date);
+CREATE INDEX IF NOT EXISTS idx_orders_shipped_date ON orders(shipped_date);
+CREATE INDEX IF NOT EXISTS idx_orders_delivered_date ON orders(delivered_date);
+CREATE INDEX IF NOT EXISTS idx_orders_term ON orders(term);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_meta VALUES ('version', 0);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_progress (
+    order_id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS status_deltas (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    awb TEXT,
+    received_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS order_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    changed_at REAL NOT NULL
+);
+INSERT OR IGNORE INTO store_meta VALUES ('changes_pruned_through', 0);
+"""
+
+BUMP_VERSION_SQL = "UPDATE store_meta SET value = value + 1 WHERE key = 'version'"
+LOG_CHANGE_SQL = 'INSERT INTO order_changes (order_id, kind, changed_at) VALUES (?, ?, ?)'
+# Dashboards that fall further behind than this reload everything
+CHANGE_LOG_RETENTION_SECONDS = 7 * 86400
+
+# Maps a dashboard date_filter_type to the indexed column holding that date.
+DATE_COLUMNS = {
+    'order_date': 'created_date',
+    'shipped_date': 'shipped_date',
+    'delivered_date': 'delivered_date',
+}
+
+
+def load_master_orders_utf8_safe(path):
+    """
+    Safely load the master orders JSON file with UTF-8 encoding.
+    Falls back to error-tolerant mode if the file contains invalid UTF-8 bytes.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except UnicodeDecodeError as e:
+        print(f"[WARN] UTF-8 decode failed for {path} at position {e.start}: {e.reason}")
+        print("[WARN] Retrying with errors='replace'. Consider regenerating the file by running data_fetcher.py")
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return json.load(f)
+
+
+def name_variants(order_name):
+    """RapidShyp sends order names with or without the leading '#'."""
+    bare = (order_name or '').lstrip('#')
+    return [order_name, bare, '#' + bare]
+
+
+def apply_status_delta(order, status, awb, received_at=None):
+    """Applies a RapidShyp webhook status update to an order document."""
+    order['rapidshyp_webhook_status'] = status
+    order['rapidshyp_webhook_at'] = received_at or time.time()
+    if awb and not order.get('awb'): # Update AWB if missing
+        order['awb'] = awb
+    return materialize_order_fields(order)
+
+
+class OrderSnapshot:
+    """
+    In-memory copy of every order, parsed once. Range queries use bisect over
+    pre-sorted filter-date lists, so no JSON is parsed per request. Pending
+    status deltas replace individual orders with updated copies; callers must
+    treat the returned orders as read-only.
+    """
+
+    def __init__(self, stamp, rows):
+        self.stamp = stamp
+        self.delta_seq = 0
+        self.orders = []
+        self._index = {}
+        dated = {column: [] for column in DATE_COLUMNS.values()}
+        for data, created_date, shipped_date, delivered_date in rows:
+            idx = len(self.orders)
+            order = json.loads(data)
+            if 'normalized_status' not in order:
+                materialize_order_fields(order)  # rows written before fields were materialized
+            self.orders.append(order)
+            self._index[str(order['id'])] = idx
+            for column, value in (('created_date', created_date), ('shipped_date', shipped_date), ('delivered_date', delivered_date)):
+                if value:
+                    dated[column].append((value, idx))
+        self._dates, self._positions = {}, {}
+        for column, pairs in dated.items():
+            pairs.sort()
+            self._dates[column] = [d for d, _ in pairs]
+            self._positions[column] = [i for _, i in pairs]
+
+    def merge_deltas(self, deltas):
+        """Overlays (seq, order_id, status, awb, received_at) rows that are not compacted yet."""
+        for seq, order_id, status, awb, received_at in deltas:
+            idx = self._index.get(order_id)
+            if idx is not None:
+                # Webhook deltas only change status fields, so date positions stay valid
+                self.orders[idx] = apply_status_delta(dict(self.orders[idx]), status, awb, received_at)
+            self.delta_seq = seq
+
+    def get(self, order_id):
+        idx = self._index.get(str(order_id))
+        return self.orders[idx] if idx is not None else None
+
+    def orders_in_range(self, date_filter_type, start_date, end_date):
+        column = DATE_COLUMNS.get((date_filter_type or 'order_date').lower(), 'created_date')
+        dates = self._dates[column]
+        lo = bisect.bisect_left(dates, start_date.isoformat())
+        hi = bisect.bisect_right(dates, end_date.isoformat())
+        return [self.orders[i] for i in self._positions[column][lo:hi]]
+
+
+class OrderStore:
+    """
+    SQLite-backed order store. Each order is kept as its JSON document plus
+    indexed columns for name, AWB, filter dates and attribution term, so range
+    queries and single-order updates never touch the rest of the data.
+
+    Webhook status updates are appended to the status_deltas log and folded
+    into the orders table in batches by a background compactor.
+
+    Every order that is added or actually changes, by a sync or a webhook,
+    gets a row in order_changes. Its AUTOINCREMENT seq is the change sequence
+    dashboards poll with (see changes_since).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
+        self._compactor_pid = None
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per thread (and per process, in case of a fork).
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _row_for(order):
+        if 'normalized_status' not in order:
+            materialize_order_fields(order)
+        return (
+            str(order['id']), order.get('name'), order.get('awb'),
+            order.get('ist_order_date'), order.get('ist_shipped_date'), order.get('ist_delivered_date'),
+            order.get('attribution_source'), order.get('attribution_term'),
+            json.dumps(order, ensure_ascii=False)
+        )
+
+    def _keep_newer_webhook_status(self, stored, order, row):
+        stored_at = stored.get('rapidshyp_webhook_at') or 0
+        if stored_at <= (order.get('rapidshyp_webhook_at') or 0):
+            return row
+        order = apply_status_delta(dict(order), stored.get('rapidshyp_webhook_status'), stored.get('awb'), stored_at)
+        return self._row_for(order)
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+    def upsert_orders(self, orders, record_progress=False):
+        """
+        Insert or replace a batch of orders in a single transaction. Orders
+        whose document is unchanged are not rewritten, so they neither bump the
+        version nor appear in the change log. With record_progress the ids are
+        also marked done for the current sync run, atomically with the write,
+        so a resumed run can skip them.
+
+        Orders are usually read well before they are written back (a sync
+        enriches them in between), so a webhook status the compactor stored
+        meanwhile is kept rather than overwritten with the older one.
+        """
+        rows = [self._row_for(o) for o in orders]
+        with self._write_lock, self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')   # no compaction between the read below and the write
+            existing = dict(conn.execute(
+                'SELECT id, data FROM orders WHERE id IN (SELECT value FROM json_each(?))',
+                (json.dumps([row[0] for row in rows]),)))
+            for i, row in enumerate(rows):
+                stored = existing.get(row[0])
+                if stored and stored != row[-1] and '"rapidshyp_webhook_at"' in stored:
+                    rows[i] = self._keep_newer_webhook_status(json.loads(stored), orders[i], row)
+            changed = [row for row in rows if existing.get(row[0]) != row[-1]]
+            if changed:
+                now = time.time()
+                conn.executemany('INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', changed)
+                conn.executemany(LOG_CHANGE_SQL, [(row[0], 'changed' if row[0] in existing else 'added', now) for row in changed])
+                conn.execute(BUMP_VERSION_SQL)
+            if record_progress:
+                conn.executemany('INSERT OR IGNORE INTO sync_progress VALUES (?)', [(row[0],) for row in rows])
+        return len(rows)
+
+    def synced_order_ids(self):
+        """Ids written so far by the current (possibly interrupted) sync run."""
+        return {order_id for (order_id,) in self._connect().execute('SELECT order_id FROM sync_progress')}
+
+    def clear_sync_progress(self):
+        with self._write_lock, self._connect() as conn:
+            conn.execute('DELETE FROM sync_progress')
+
+    def update_order(self, order):
+        """Rewrites a single order; an indexed primary-key write."""
+        return self.upsert_orders([order])
+
+    def get_state(self, key, default=None):
+        """Reads a persisted sync setting such as a watermark."""
+        row = self._connect().execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', (key, value))
+
+    def version(self):
+        return self._connect().execute("SELECT value FROM store_meta WHERE key = 'version'").fetchone()[0]
+
+    def _stamp(self):
+        # Every write to the orders table, from any process, bumps the version.
+        # The WAL file is deliberately not stat'ed: delta appends land there
+        # and are merged into the snapshot without a full reload.
+        try:
+            st = os.stat(self.db_path)
+            file_id = (st.st_dev, st.st_ino)
+        except FileNotFoundError:
+            file_id = (0, 0)
+        return file_id + (self.version(),)
+
+    def snapshot(self):
+        """
+        Returns the per-process OrderSnapshot, reloading it only when the
+        database file or the version stamp has changed. Status deltas that
+        have not been compacted yet are merged in on every call.
+        """
+        stamp = self._stamp()
+        with self._snapshot_lock:
+            snap = self._snapshot
+            if snap is None or snap.stamp != stamp:
+                rows = self._connect().execute('SELECT data, created_date, shipped_date, delivered_date FROM orders').fetchall()
+                snap = OrderSnapshot(stamp, rows)
+                self._snapshot = snap
+                print(f"[Order Store] Loaded snapshot of {len(snap.orders)} orders (version {stamp[-1]}).")
+            deltas = self._connect().execute(
+                'SELECT seq, order_id, status, awb, received_at FROM status_deltas WHERE seq > ? ORDER BY seq', (snap.delta_seq,)
+            ).fetchall()
+            if deltas:
+                snap.merge_deltas(deltas)
+            return snap
+
+    # --- STATUS DELTA LOG ---
+    def resolve_order_id(self, order_name, awb=None):
+        """Looks up an order id through the name index, falling back to the AWB index."""
+        conn = self._connect()
+        row = conn.execute('SELECT id FROM orders WHERE name IN (?, ?, ?) LIMIT 1', name_variants(order_name)).fetchone()
+        if not row and awb:
+            row = conn.execute('SELECT id FROM orders WHERE awb = ? LIMIT 1', (awb,)).fetchone()
+        return row[0] if row else None
+
+    def append_status_delta(self, order_name, status, awb=None):
+        """
+        Records a webhook status update as a single appended row; the order
+        document itself is rewritten later by compact_status_deltas().
+        Returns True if the order was found.
+        """
+        return self.append_status_deltas([(order_name, status, awb)]) == 1
+
+    def append_status_deltas(self, updates):
+        """
+        Appends a batch of (order_name, status, awb) updates in one transaction.
+        Updates for unknown orders are dropped. Returns the number recorded.
+        """
+        now, rows = time.time(), []
+        for order_name, status, awb in updates:
+            order_id = self.resolve_order_id(order_name, awb)
+            if order_id is None:
+                print(f"[Order Store] Order '{order_name}' not found; dropping status '{status}'.")
+                continue
+            rows.append((order_id, status, awb, now))
+        if rows:
+            with self._connect() as conn:
+                conn.executemany('INSERT INTO status_deltas (order_id, status, awb, received_at) VALUES (?, ?, ?, ?)', rows)
+                conn.executemany(LOG_CHANGE_SQL, [(order_id, 'changed', received_at) for order_id, _, _, received_at in rows])
+        return len(rows)
+
+    def compact_status_deltas(self):
+        """
+        Folds all pending status deltas into the orders table in one
+        transaction, coalescing multiple updates to the same order.
+        Returns the number of orders rewritten.
+        """
+        with self._write_lock, self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            deltas = conn.execute('SELECT seq, order_id, status, awb, received_at FROM status_deltas ORDER BY seq').fetchall()
+            if not deltas:
+                return 0
+            latest = {}
+            for seq, order_id, status, awb, received_at in deltas:
+                previous_awb = latest.get(order_id, (None, None, None))[1]
+                latest[order_id] = (status, previous_awb or awb, received_at)
+            rows = []
+            for order_id, (status, awb, received_at) in latest.items():
+                row = conn.execute('SELECT data FROM orders WHERE id = ?', (order_id,)).fetchone()
+                if row:
+                    rows.append(self._row_for(apply_status_delta(json.loads(row[0]), status, awb, received_at)))
+            conn.executemany('INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.execute('DELETE FROM status_deltas WHERE seq <= ?', (deltas[-1][0],))
+            conn.execute(BUMP_VERSION_SQL)
+        print(f"[Order Store] Compacted {len(deltas)} status deltas into {len(rows)} orders.")
+        return len(rows)
+
+    # --- CHANGE SEQUENCE ---
+    def change_seq(self):
+        """The latest change sequence number (0 before the first change)."""
+        row = self._connect().execute("SELECT seq FROM sqlite_sequence WHERE name = 'order_changes'").fetchone()
+        return row[0] if row else 0
+
+    def record_changes(self, changes):
+        """Logs (order_id, kind) changes made outside the orders table, e.g. to cached Amazon orders."""
+        if not changes:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(LOG_CHANGE_SQL, [(order_id, kind, now) for order_id, kind in changes])
+
+    def changes_since(self, seq):
+        """
+        Returns (current_seq, {order_id: 'added' | 'changed' | 'removed'}) for
+        changes after seq, or (current_seq, None) if seq is from before the
+        retained log or from another database; the caller must then reload.
+        An order added and later changed is still reported as added.
+        """
+        conn = self._connect()
+        current = self.change_seq()
+        pruned_through = conn.execute("SELECT value FROM store_meta WHERE key = 'changes_pruned_through'").fetchone()[0]
+        if seq < pruned_through or seq > current:
+            return current, None
+        kinds = {}
+        for order_id, kind in conn.execute(
+                'SELECT order_id, kind FROM order_changes WHERE seq > ? AND seq <= ? ORDER BY seq', (seq, current)):
+            if kind == 'changed' and kinds.get(order_id) == 'added':
+                continue
+            kinds[order_id] = kind
+        return current, kinds
+
+    def prune_changes(self, max_age_seconds=CHANGE_LOG_RETENTION_SECONDS):
+        with self._write_lock, self._connect() as conn:
+            row = conn.execute('SELECT MAX(seq) FROM order_changes WHERE changed_at < ?', (time.time() - max_age_seconds,)).fetchone()
+            if row[0] is None:
+                return 0
+            deleted = conn.execute('DELETE FROM order_changes WHERE seq <= ?', (row[0],)).rowcount
+            conn.execute("UPDATE store_meta SET value = ? WHERE key = 'changes_pruned_through'", (row[0],))
+        return deleted
+
+    def start_compactor(self, interval_seconds=30):
+        """Starts the background compaction thread once per process."""
+        with self._snapshot_lock:
+            if self._compactor_pid == os.getpid():
+                return
+            self._compactor_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.compact_status_deltas()
+                    self.prune_changes()
+                except Exception as e:
+                    print(f"[Order Store] Delta compaction failed: {e}")
+
+        threading.Thread(target=run, name='order-delta-compactor', daemon=True).start()
+
+    def all_orders(self):
+        return [json.loads(data) for (data,) in self._connect().execute('SELECT data FROM orders')]
+
+    def iter_order_batches(self, batch_size=500):
+        """Yields stored orders in id order, batch_size at a time, without loading the whole table."""
+        last_id = ''
+        while True:
+            rows = self._connect().execute(
+                'SELECT id, data FROM orders WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [json.loads(data) for _, data in rows]
+
+    def orders_in_range(self, date_filter_type, start_date, end_date):
+        """Returns orders whose filter date (IST) falls within [start_date, end_date]."""
+        column = DATE_COLUMNS.get((date_filter_type or 'order_date').lower(), 'created_date')
+        cursor = self._connect().execute(
+            f'SELECT data FROM orders WHERE {column} BETWEEN ? AND ?',
+            (start_date.isoformat(), end_date.isoformat())
+        )
+        return [json.loads(data) for (data,) in cursor]
+
+    def get_orders(self, order_ids):
+        """Returns {id: order} for the given ids via the primary-key index."""
+        ids = [str(i) for i in order_ids]
+        found = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            for order_id, data in self._connect().execute(f'SELECT id, data FROM orders WHERE id IN ({placeholders})', chunk):
+                found[order_id] = json.loads(data)
+        return found
+
+    def find_by_name(self, order_name):
+        row = self._connect().execute(
+            'SELECT data FROM orders WHERE name IN (?, ?, ?) LIMIT 1', name_variants(order_name)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_by_awb(self, awb):
+        row = self._connect().execute('SELECT data FROM orders WHERE awb = ? LIMIT 1', (awb,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def import_legacy_json(self, path=MASTER_DATA_FILE):
+        """One-time migration from the old master_order_data.json file."""
+        if not os.path.exists(path):
+            return 0
+        print(f"[Order Store] Importing legacy master data from '{path}'...")
+        try:
+            orders = load_master_orders_utf8_safe(path)
+        except (json.JSONDecodeError, FileNotFoundError) as e:
+            print(f"[Order Store] Could not import legacy master data: {e}")
+            return 0
+        imported = self.upsert_orders(orders)
+        print(f"[Order Store] Imported {imported} orders.")
+        return imported
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_order_store(config):
+    """Returns the shared OrderStore for config['ORDER_DB_FILE'], creating it on first use."""
+    db_path = config.get('ORDER_DB_FILE') or 'orders.db'
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = OrderStore(db_path)
+            if store.count() == 0:
+                store.import_legacy_json()
+            _stores[db_path] = store
+        return store
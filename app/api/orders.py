@@ -1,13 +1,21 @@
-from flask import Blueprint, jsonify, current_app
+import queue
+from flask import Blueprint, Response, jsonify, current_app, request, stream_with_context
 from datetime import datetime, timedelta
-from .amazon import fetch_amazon_orders
-# --- THIS IS THE FIX ---
-from .helpers import get_all_shopify_orders_paginated
-# --- END OF FIX ---
+from .amazon import AMAZON_CHANGE_PREFIX, amazon_cache_mtime, get_cached_amazon_orders, refresh_amazon_orders_if_stale
+from .helpers import TZ_INDIA
+from .order_events import format_sse, get_order_broadcaster
+from .order_store import get_order_store
 from ..auth import token_required
 
 orders_bp = Blueprint('orders', __name__)
 
+ORDERS_WINDOW_DAYS = 30
+STREAM_HEARTBEAT_SECONDS = 15   # keeps proxies from closing an idle stream
+STREAM_RETRY_MS = 5000
+
+# Last serialized /get-orders body in this process, keyed by its data version
+_orders_response = {'version': None, 'body': None}
+
 def normalize_shopify_order(order):
     status = "New" if not order.get('fulfillment_status') else "Shipped" if order.get('fulfillment_status') == 'fulfilled' else "Processing"
     if order.get('cancelled_at'): status = "Cancelled"
@@ -24,27 +32,174 @@ def normalize_shopify_order(order):
         "name": customer_name, "total": net_total, "status": status,
         "items": [{"name": i.get('name', 'N/A'), "sku": i.get('sku', 'N/A'), "qty": i.get('quantity', 0)} for i in order.get('line_items', [])],
         "address": address_str or 'No address',
-        "paymentMethod": 'Prepaid' if order.get('financial_status') == 'paid' else 'COD',
-        "awb": awb
+        "paymentMethod": payment_method(order),
+        "awb": awb,
+        # Courier status: the latest RapidShyp webhook, else the last polled status
+        "shipmentStatus": order.get('rapidshyp_webhook_status') or order.get('raw_rapidshyp_status'),
     }
 
+def payment_method(order):
+    """
+    Prepaid or COD from financial_status. Orders synced before it was requested
+    have none and show as Unknown until the next full reconcile backfills it.
+    """
+    if 'financial_status' not in order:
+        return 'Unknown'
+    return 'Prepaid' if order.get('financial_status') == 'paid' else 'COD'
+
+def orders_data_version(snapshot, amazon_mtime, window_start):
+    """
+    Identifies the /get-orders payload: the order store file and version,
+    the last merged webhook delta, the Amazon cache file and the window start.
+    Any synced write, webhook update or Amazon refresh changes it.
+    """
+    st_dev, st_ino, store_version = snapshot.stamp
+    return f"{st_ino:x}.{store_version}.{snapshot.delta_seq}.{amazon_mtime:x}.{window_start:%Y%m%d}"
+
+def _orders_json_response(body, version, seq, amazon_pending, status=200):
+    response = Response(body, status=status, mimetype='application/json')
+    response.set_etag(version)
+    response.headers['X-Data-Version'] = version
+    response.headers['X-Change-Seq'] = str(seq)
+    # The first Amazon fetch is still running; its orders arrive as a later change
+    response.headers['X-Amazon-Pending'] = 'true' if amazon_pending else 'false'
+    # Browsers must revalidate every poll; unchanged data comes back as an empty 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _orders_body(config, snapshot, window_start, today, version):
+    """The serialized full order list for this data version, built once per process."""
+    global _orders_response
+    cached = _orders_response
+    if cached['version'] != version:
+        stored = snapshot.orders_in_range('order_date', window_start, today)
+        shopify_orders = [normalize_shopify_order(order) for order in stored]
+        all_orders = sorted(shopify_orders + get_cached_amazon_orders(config), key=lambda x: x['date'], reverse=True)
+        cached = _orders_response = {'version': version, 'body': current_app.json.dumps(all_orders)}
+        print(f"[Orders Endpoint] Built {len(all_orders)} orders for data version {version}")
+    return cached['body']
+
+def _order_changes(config, snapshot, kinds, window_start):
+    """Splits a changes_since() result into normalized added/changed orders and removed {platform, id} keys."""
+    amazon_orders = None
+    delta = {'added': [], 'changed': [], 'removed': []}
+    for order_id, kind in kinds.items():
+        if order_id.startswith(AMAZON_CHANGE_PREFIX):
+            if amazon_orders is None:
+                amazon_orders = {order['id']: order for order in get_cached_amazon_orders(config)}
+            amazon_id = order_id[len(AMAZON_CHANGE_PREFIX):]
+            order, key = amazon_orders.get(amazon_id), {'platform': 'Amazon', 'id': amazon_id}
+        else:
+            raw = snapshot.get(order_id)
+            if raw is None:
+                continue
+            key = {'platform': 'Shopify', 'id': raw['name']}
+            # Orders outside the dashboard window are removed, like in the full list
+            in_window = (raw.get('ist_order_date') or '') >= window_start.isoformat()
+            order = normalize_shopify_order(raw) if in_window else None
+        if kind == 'removed' or order is None:
+            delta['removed'].append(key)
+        else:
+            delta[kind].append(order)
+    return delta
+
+def _order_changes_event(config, store, seq, kinds):
+    """The {seq, windowStart, added, changed, removed} payload shared by ?since= and the stream."""
+    window_start = datetime.now(TZ_INDIA).date() - timedelta(days=ORDERS_WINDOW_DAYS)
+    return {'seq': seq, 'windowStart': window_start.isoformat(), **_order_changes(config, store.snapshot(), kinds, window_start)}
+
 @orders_bp.route('/get-orders', methods=['GET'])
 @token_required
 def get_orders():
+    """
+    Last 30 days of Shopify orders from the local order store plus the cached
+    Amazon orders. Responds 304 when If-None-Match matches the data version.
+
+    With ?since=<seq> (the X-Change-Seq of an earlier response) only the
+    orders added, changed or removed since then are returned, as
+    {seq, windowStart, added, changed, removed}; if seq is too old to answer
+    from the change log the reply is {seq, windowStart, reset: true, orders}.
+
+    Until the first Amazon fetch has finished the list has no Amazon orders and
+    X-Amazon-Pending is true; they then arrive as added changes.
+    """
     config = current_app.config
     try:
-        sixty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
-        shopify_params = {
-            'status': 'any', 'limit': 250,
-            'created_at_min': sixty_days_ago,
-            'fields': 'id,name,created_at,total_price,financial_status,fulfillment_status,cancelled_at,shipping_address,line_items,tags,refunds,fulfillments'
-        }
-        print("\n[Orders Endpoint] Fetching all paginated Shopify orders...")
-        shopify_orders_raw = get_all_shopify_orders_paginated(config, shopify_params)
-        shopify_orders = [normalize_shopify_order(order) for order in shopify_orders_raw]
-        amazon_orders = fetch_amazon_orders(config)
-        all_orders = sorted(shopify_orders + amazon_orders, key=lambda x: x['date'], reverse=True)
-        return jsonify(all_orders)
+        amazon_pending = refresh_amazon_orders_if_stale(config)
+        store = get_order_store(config)
+        # Read the sequence before the snapshot, so the data is at least as new as the seq
+        since = request.args.get('since', type=int)
+        if since is None:
+            seq, kinds = store.change_seq(), None
+        else:
+            seq, kinds = store.changes_since(since)
+        snapshot = store.snapshot()
+        today = datetime.now(TZ_INDIA).date()
+        window_start = today - timedelta(days=ORDERS_WINDOW_DAYS)
+        version = orders_data_version(snapshot, amazon_cache_mtime(config), window_start)
+
+        if since is not None:
+            if kinds is None:
+                body = _orders_body(config, snapshot, window_start, today, version)
+                response = Response(f'{{"seq": {seq}, "windowStart": "{window_start}", "reset": true, "orders": {body}}}',
+                                    mimetype='application/json')
+            else:
+                response = jsonify({'seq': seq, 'windowStart': window_start.isoformat(), **_order_changes(config, snapshot, kinds, window_start)})
+            response.headers['X-Amazon-Pending'] = 'true' if amazon_pending else 'false'
+            return response
+
+        if request.if_none_match.contains(version):
+            return _orders_json_response(None, version, seq, amazon_pending, status=304)
+        return _orders_json_response(_orders_body(config, snapshot, window_start, today, version), version, seq, amazon_pending)
     except Exception as e:
         print(f"CRITICAL ERROR in get-orders: {e}")
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+@orders_bp.route('/orders/stream', methods=['GET'])
+@token_required
+def stream_orders():
+    """
+    Server-Sent Events feed of order changes. Each 'changes' event carries the
+    same payload as /get-orders?since= and its seq as the event id; 'reset'
+    means the client must reload /get-orders. Pass ?since=<seq> (or
+    Last-Event-ID) to catch up on changes made while disconnected.
+
+    The stream only waits on a queue fed by the process's broadcaster, so with
+    gthread workers an open dashboard costs a thread, not a worker.
+    """
+    config = current_app.config
+    store = get_order_store(config)
+    broadcaster = get_order_broadcaster(config, store, lambda seq, kinds: _order_changes_event(config, store, seq, kinds))
+    since = request.args.get('since', type=int)
+    if since is None:
+        since = request.headers.get('Last-Event-ID', type=int)
+    subscriber = broadcaster.subscribe()
+    if subscriber is None:
+        return jsonify({"error": "Too many open order streams; poll /get-orders instead."}), 503
+    json_dumps = current_app.json.dumps
+
+    def events():
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            if since is not None:
+                seq, kinds = store.changes_since(since)
+                if kinds is None:
+                    yield format_sse('reset', json_dumps({'seq': seq}), seq)
+                elif kinds:
+                    yield format_sse('changes', json_dumps(_order_changes_event(config, store, seq, kinds)), seq)
+            while not subscriber.overflowed:
+                try:
+                    event, data, seq = subscriber.queue.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, data, seq)
+            # The client fell too far behind; it reloads and reconnects
+            yield format_sse('reset', json_dumps({'seq': broadcaster.seq}), broadcaster.seq)
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'   # stop nginx-style proxies from buffering the stream
+    return response
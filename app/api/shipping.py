@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app, Response
 import requests
 from ..auth import token_required
+from . import http_client
 import json
 import time
 
@@ -19,7 +20,7 @@ def create_shipment():
         # 1. Fetch full order details from Shopify
         shopify_url = f"https://{config['SHOPIFY_SHOP_URL']}/admin/api/2024-07/orders/{shopify_order_id}.json"
         headers = {'X-Shopify-Access-Token': config['SHOPIFY_TOKEN']}
-        response = requests.get(shopify_url, headers=headers)
+        response = http_client.get('shopify', shopify_url, headers=headers)
         response.raise_for_status()
         order = response.json()['order']
 
@@ -62,7 +63,8 @@ def create_shipment():
         print(f"Calling URL: {rapidshyp_url}")
         print(f"Payload: {json.dumps(rapidshyp_payload, indent=2)}")
         
-        rs_response = requests.post(rapidshyp_url, json=rapidshyp_payload, headers=rs_headers)
+        # Not idempotent: only resent if RapidShyp rejected it outright (429/503)
+        rs_response = http_client.post('rapidshyp', rapidshyp_url, json=rapidshyp_payload, headers=rs_headers)
         
         print(f"Status Code: {rs_response.status_code}")
         print(f"Response Body: {rs_response.text}")
@@ -97,13 +99,13 @@ def get_shipping_label():
     try:
         track_url = "https://api.rapidshyp.com/rapidshyp/apis/v1/track_order"
         headers = {"rapidshyp-token": config.get('RAPIDSHYP_API_KEY'), "Content-Type": "application/json"}
-        response = requests.post(track_url, headers=headers, json={'awb': awb})
+        response = http_client.post('rapidshyp', track_url, headers=headers, json={'awb': awb}, idempotent=True)
         response.raise_for_status()
         data = response.json()
         label_url = data.get('records', [{}])[0].get('shipment_details', [{}])[0].get('label_url')
         if not label_url:
             return jsonify({'error': 'Label URL not found in RapidShyp response.'}), 404
-        pdf_response = requests.get(label_url); pdf_response.raise_for_status()
+        pdf_response = http_client.get('downloads', label_url); pdf_response.raise_for_status()
         return Response(pdf_response.content, mimetype='application/pdf', headers={'Content-Disposition': f'attachment;filename=label_{awb}.pdf'})
     except Exception as e:
         print(f"Error fetching label for AWB {awb}: {e}")
@@ -119,13 +121,13 @@ def get_shipping_invoice():
     try:
         track_url = "https://api.rapidshyp.com/rapidshyp/apis/v1/track_order"
         headers = {"rapidshyp-token": config.get('RAPIDSHYP_API_KEY'), "Content-Type": "application/json"}
-        response = requests.post(track_url, headers=headers, json={'awb': awb})
+        response = http_client.post('rapidshyp', track_url, headers=headers, json={'awb': awb}, idempotent=True)
         response.raise_for_status()
         data = response.json()
         invoice_url = data.get('records', [{}])[0].get('shipment_details', [{}])[0].get('invoice_url')
         if not invoice_url:
             return jsonify({'error': 'Invoice URL not found in RapidShyp response.'}), 404
-        pdf_response = requests.get(invoice_url); pdf_response.raise_for_status()
+        pdf_response = http_client.get('downloads', invoice_url); pdf_response.raise_for_status()
         filename = f'invoice_{order_id.replace("#", "")}.pdf' if order_id else f'invoice_{awb}.pdf'
         return Response(pdf_response.content, mimetype='application/pdf', headers={'Content-Disposition': f'attachment;filename={filename}'})
     except Exception as e:
@@ -0,0 +1,216 @@
+import json
+import time
+
+from . import http_client
+from .helpers import materialize_order_fields, newest_updated_at, shopify_admin_url
+
+# --- SHOPIFY BULK OPERATIONS ---
+# A full reconcile submits one bulk query, waits for Shopify to build the
+# JSONL export, then streams it line by line into the order store instead of
+# walking REST pages of 250 orders.
+
+BULK_ORDERS_QUERY = """
+{
+  orders(query: "%s") {
+    edges {
+      node {
+        id
+        legacyResourceId
+        name
+        createdAt
+        updatedAt
+        cancelledAt
+        email
+        sourceName
+        displayFulfillmentStatus
+        displayFinancialStatus
+        tags
+        totalPriceSet { shopMoney { amount } }
+        customAttributes { key value }
+        refunds { createdAt totalRefundedSet { shopMoney { amount } } }
+        customerJourneySummary { lastVisit { referrerUrl } }
+        shippingAddress { firstName lastName address1 city province zip phone }
+        fulfillments { createdAt updatedAt trackingInfo { number company } }
+        lineItems {
+          edges { node { id sku name quantity originalUnitPriceSet { shopMoney { amount } } } }
+        }
+      }
+    }
+  }
+}
+"""
+
+RUN_BULK_MUTATION = """
+mutation runBulk($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+BULK_STATUS_QUERY = """
+query bulkStatus($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation { id status errorCode objectCount url partialDataUrl }
+  }
+}
+"""
+
+FULFILLMENT_STATUS_MAP = {
+    'FULFILLED': 'fulfilled',
+    'PARTIALLY_FULFILLED': 'partial',
+    'RESTOCKED': 'restocked',
+}
+
+
+def shopify_graphql(config, query, variables=None):
+    headers = {'X-Shopify-Access-Token': config['SHOPIFY_TOKEN'], 'Content-Type': 'application/json'}
+    response = http_client.post('shopify', shopify_admin_url(config, 'graphql.json'), headers=headers,
+                                json={'query': query, 'variables': variables or {}}, timeout=(10, 60))
+    response.raise_for_status()
+    data = response.json()
+    if data.get('errors'):
+        raise Exception(f"Shopify GraphQL error: {data['errors']}")
+    return data['data']
+
+
+def submit_bulk_order_export(config, since_iso):
+    """Starts a bulk export of orders created or updated since since_iso. Returns the operation id."""
+    search = f"created_at:>='{since_iso}' OR updated_at:>='{since_iso}'"
+    data = shopify_graphql(config, RUN_BULK_MUTATION, {'query': BULK_ORDERS_QUERY % search})
+    result = data['bulkOperationRunQuery']
+    if result.get('userErrors'):
+        raise Exception(f"Shopify bulk operation rejected: {result['userErrors']}")
+    operation = result['bulkOperation']
+    print(f"[Shopify Bulk] Submitted bulk operation {operation['id']} ({operation['status']})")
+    return operation['id']
+
+
+def wait_for_bulk_operation(config, operation_id, timeout_seconds=1800):
+    """Polls until the bulk operation finishes; returns its JSONL URL (None if no orders matched)."""
+    deadline, interval = time.time() + timeout_seconds, 2
+    while time.time() < deadline:
+        operation = shopify_graphql(config, BULK_STATUS_QUERY, {'id': operation_id})['node']
+        status = operation['status']
+        if status == 'COMPLETED':
+            print(f"[Shopify Bulk] Operation completed with {operation.get('objectCount')} objects")
+            return operation.get('url')
+        if status in ('FAILED', 'CANCELED', 'EXPIRED'):
+            raise Exception(f"Shopify bulk operation {status}: {operation.get('errorCode')}")
+        print(f"[Shopify Bulk] Operation {status} ({operation.get('objectCount')} objects so far)...")
+        time.sleep(interval)
+        interval = min(interval * 2, 10)
+    raise Exception(f"Shopify bulk operation {operation_id} did not finish within {timeout_seconds}s")
+
+
+def graphql_order_to_rest(node, line_items):
+    """Converts a bulk-export order node into the REST order shape the rest of the app uses."""
+    address = node.get('shippingAddress') or {}
+    last_visit = (node.get('customerJourneySummary') or {}).get('lastVisit') or {}
+    fulfillments = []
+    for f in node.get('fulfillments') or []:
+        tracking = (f.get('trackingInfo') or [{}])[0] if f.get('trackingInfo') else {}
+        fulfillments.append({
+            'created_at': f.get('createdAt'),
+            'updated_at': f.get('updatedAt'),
+            'tracking_number': tracking.get('number'),
+            'tracking_company': tracking.get('company'),
+        })
+    return {
+        'id': int(node['legacyResourceId']),
+        'name': node.get('name'),
+        'created_at': node.get('createdAt'),
+        'updated_at': node.get('updatedAt'),
+        'cancelled_at': node.get('cancelledAt'),
+        'email': node.get('email'),
+        'source_name': node.get('sourceName'),
+        'referring_site': last_visit.get('referrerUrl'),
+        'fulfillment_status': FULFILLMENT_STATUS_MAP.get(node.get('displayFulfillmentStatus')),
+        # PAID -> 'paid', PARTIALLY_REFUNDED -> 'partially_refunded', as in the REST API
+        'financial_status': (node.get('displayFinancialStatus') or '').lower() or None,
+        'tags': ', '.join(node.get('tags') or []),
+        # Only the refunded total is exported; shaped like a successful REST refund transaction
+        'refunds': [{
+            'created_at': r.get('createdAt'),
+            'transactions': [{'kind': 'refund', 'status': 'success',
+                              'amount': ((r.get('totalRefundedSet') or {}).get('shopMoney') or {}).get('amount', '0')}],
+        } for r in node.get('refunds') or []],
+        'total_price': ((node.get('totalPriceSet') or {}).get('shopMoney') or {}).get('amount', '0'),
+        'note_attributes': [{'name': a.get('key'), 'value': a.get('value')} for a in node.get('customAttributes') or []],
+        'shipping_address': {
+            'first_name': address.get('firstName'), 'last_name': address.get('lastName'),
+            'address1': address.get('address1'), 'city': address.get('city'),
+            'province': address.get('province'), 'zip': address.get('zip'), 'phone': address.get('phone'),
+        } if address else None,
+        'fulfillments': fulfillments,
+        'line_items': [{
+            'id': int(item['id'].rsplit('/', 1)[-1]) if item.get('id') else None,
+            'sku': item.get('sku'), 'name': item.get('name'), 'quantity': item.get('quantity'),
+            'price': ((item.get('originalUnitPriceSet') or {}).get('shopMoney') or {}).get('amount'),
+        } for item in line_items],
+    }
+
+
+def iter_bulk_orders(url):
+    """
+    Streams the bulk JSONL export one line at a time. Line items arrive as
+    separate lines after their order (linked by __parentId), so only the
+    current order is held in memory.
+    """
+    with http_client.get('downloads', url, stream=True) as response:
+        response.raise_for_status()
+        current, line_items = None, []
+        for line in response.iter_lines():
+            if not line:
+                continue
+            obj = json.loads(line)
+            parent_id = obj.get('__parentId')
+            if parent_id is None:
+                if current:
+                    yield graphql_order_to_rest(current, line_items)
+                current, line_items = obj, []
+            elif current and parent_id == current['id']:
+                line_items.append(obj)
+            else:
+                print(f"[Shopify Bulk] Skipping child line for unexpected parent {parent_id}")
+        if current:
+            yield graphql_order_to_rest(current, line_items)
+
+
+def import_bulk_orders(config, store, since_iso, batch_size=500):
+    """
+    Runs a bulk export and merges the streamed orders into the order store in
+    batches, keeping RapidShyp fields on existing orders.
+    Returns (orders_imported, newest_updated_at).
+    """
+    url = wait_for_bulk_operation(config, submit_bulk_order_export(config, since_iso))
+    if not url:
+        return 0, None
+
+    imported, newest, batch = 0, None, []
+
+    def flush():
+        existing = store.get_orders(o['id'] for o in batch)
+        merged = []
+        for new_order in batch:
+            order = existing.get(str(new_order['id'])) or {}
+            order.update(new_order)
+            merged.append(materialize_order_fields(order))
+        store.upsert_orders(merged)
+
+    for order in iter_bulk_orders(url):
+        batch.append(order)
+        if len(batch) >= batch_size:
+            flush()
+            imported += len(batch)
+            newest = newest_updated_at(batch, newest)
+            print(f"[Shopify Bulk] Imported {imported} orders...")
+            batch = []
+    if batch:
+        flush()
+        imported += len(batch)
+        newest = newest_updated_at(batch, newest)
+
+    print(f"[Shopify Bulk] Imported {imported} orders in total")
+    return imported, newest
@@ -0,0 +1,152 @@
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlparse
+
+import requests
+
+from . import http_client
+from .credential_cache import get_credential_cache
+from .sp_rate_limiter import record_sp_api_response, wait_for_sp_api_slot
+
+# --- AMAZON SP-API CLIENT ---
+# One client per set of credentials, shared by every thread in the process.
+# Requests reuse the shared client's pooled 'sp-api' session, the SigV4
+# signing key is derived once per (date, region, service), and the LWA access
+# token comes from the credential cache shared with the other processes.
+
+DEFAULT_LWA_TOKEN_URL = 'https://api.amazon.com/auth/o2/token'
+SERVICE = 'execute-api'
+ALGORITHM = 'AWS4-HMAC-SHA256'
+SIGNED_HEADERS = 'host;x-amz-access-token;x-amz-date'
+
+
+def _hmac(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+class SPAPIClient:
+    """Signs and sends SP-API requests over the shared pooled session."""
+
+    def __init__(self, config):
+        self.base_url = config['BASE_URL']
+        self.host = urlparse(self.base_url).netloc
+        self.region = config['AWS_REGION']
+        self.access_key = config['AWS_ACCESS_KEY']
+        self.secret_key = config['AWS_SECRET_KEY']
+        self.lwa_token_url = config.get('LWA_TOKEN_URL') or DEFAULT_LWA_TOKEN_URL
+        self.lwa_credentials = {
+            'grant_type': 'refresh_token',
+            'refresh_token': config['REFRESH_TOKEN'],
+            'client_id': config['LWA_CLIENT_ID'],
+            'client_secret': config['LWA_CLIENT_SECRET'],
+        }
+        self.credentials = get_credential_cache(config)
+        # Cache key: the refresh token itself is not stored, only a digest of it
+        self.credential_name = 'lwa:' + hashlib.sha256(
+            f"{self.lwa_token_url}|{config['LWA_CLIENT_ID']}|{config['REFRESH_TOKEN']}".encode('utf-8')).hexdigest()[:16]
+        self._token = None
+        self._token_expires_at = 0
+        self._signing_keys = {}
+
+    # --- LWA token ---
+    def access_token(self):
+        """Returns a valid LWA token from memory, else from the cross-process credential cache."""
+        if self._token and self._token_expires_at > time.time():
+            return self._token
+        self._token, self._token_expires_at = self.credentials.get(self.credential_name, self._fetch_lwa_token)
+        return self._token
+
+    def _fetch_lwa_token(self):
+        """Mints a new token; only called by the credential cache's single refresher."""
+        try:
+            response = http_client.post('lwa', self.lwa_token_url, json=self.lwa_credentials, idempotent=True)
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"LWA token error: {e.response.text if e.response is not None else e}")
+            raise Exception("Failed to retrieve LWA access token from Amazon.")
+        return data['access_token'], data.get('expires_in', 3600)
+
+    # --- SigV4 ---
+    def signing_key(self, date_stamp, region, service):
+        """The derived SigV4 key only changes with the date, so it is computed once per day."""
+        cache_key = (date_stamp, region, service)
+        key = self._signing_keys.get(cache_key)
+        if key is None:
+            k_date = _hmac(('AWS4' + self.secret_key).encode('utf-8'), date_stamp)
+            key = _hmac(_hmac(_hmac(k_date, region), service), 'aws4_request')
+            # Keys for previous days are never needed again
+            self._signing_keys = {cache_key: key}
+        return key
+
+    def signed_headers(self, method, path, query_params, body):
+        access_token = self.access_token()
+        t = datetime.now(timezone.utc)
+        amz_date, date_stamp = t.strftime('%Y%m%dT%H%M%SZ'), t.strftime('%Y%m%d')
+        canonical_querystring = urlencode(sorted(query_params.items()))
+        canonical_headers = f"host:{self.host}\nx-amz-access-token:{access_token}\nx-amz-date:{amz_date}\n"
+        payload_hash = hashlib.sha256(body.encode('utf-8')).hexdigest()
+        canonical_request = f"{method}\n{path}\n{canonical_querystring}\n{canonical_headers}\n{SIGNED_HEADERS}\n{payload_hash}"
+        credential_scope = f"{date_stamp}/{self.region}/{SERVICE}/aws4_request"
+        string_to_sign = f"{ALGORITHM}\n{amz_date}\n{credential_scope}\n{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
+        signature = hmac.new(self.signing_key(date_stamp, self.region, SERVICE), string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        headers = {
+            'x-amz-access-token': access_token,
+            'x-amz-date': amz_date,
+            'Authorization': f"{ALGORITHM} Credential={self.access_key}/{credential_scope}, SignedHeaders={SIGNED_HEADERS}, Signature={signature}",
+        }
+        if body:
+            headers['Content-Type'] = 'application/json'
+        return headers
+
+    # --- Requests ---
+    def request(self, options, max_retries=5):
+        """Sends options = {method, path, queryParams?, body?}; returns the decoded JSON response."""
+        method, path, query_params = options['method'], options['path'], options.get('queryParams', {})
+        body = json.dumps(options['body']) if options.get('body') is not None else ''
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(max_retries):
+            try:
+                # Paced per operation by a shared token bucket instead of backing off after 429s
+                wait_for_sp_api_slot(method, path)
+                # Signed per attempt: cheap with the cached key, and x-amz-date stays fresh
+                headers = self.signed_headers(method, path, query_params, body)
+                response = http_client.request('sp-api', method, url, headers=headers, params=query_params, data=body or None)
+                record_sp_api_response(method, path, response)
+
+                if response.status_code == 429:
+                    print(f"[RATE LIMIT] Amazon API throttled {method} {path}; retrying at the operation's restore rate...")
+                    continue
+
+                response.raise_for_status()
+                return response.json() if response.content else {}
+            except http_client.CircuitOpenError:
+                raise   # fail fast: retrying would only add load to a failing upstream
+            except requests.exceptions.RequestException as e:
+                print(f"Amazon SP-API request failed on attempt {attempt + 1}: {e}")
+                if attempt >= max_retries - 1: raise e
+                time.sleep((2 ** attempt) + random.random())
+        raise Exception("Max retries exceeded for SP-API request.")
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_sp_api_client(config):
+    """Returns the shared SPAPIClient for the configured endpoint and credentials, creating it on first use."""
+    secret_key, access_key, region = config.get('AWS_SECRET_KEY'), config.get('AWS_ACCESS_KEY'), config.get('AWS_REGION')
+    if not secret_key or not access_key or not region:
+        raise ValueError("AWS credentials (AWS_SECRET_KEY, AWS_ACCESS_KEY, AWS_REGION) are not configured properly in your .env file.")
+    key = (config['BASE_URL'], access_key, config.get('LWA_CLIENT_ID'), config.get('REFRESH_TOKEN'))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = SPAPIClient(config)
+        return client
@@ -0,0 +1,116 @@
+import re
+import threading
+import time
+
+# --- SP-API RATE LIMITING ---
+# One token bucket per SP-API operation, shared by every thread in the
+# process. Requests wait for a token before they are sent, so bursts are paced
+# ahead of time instead of being answered with 429s. Buckets start from the
+# documented usage plans and adopt the rate Amazon reports in the
+# x-amzn-RateLimit-Limit response header.
+
+# (method, path pattern, operation, requests per second, burst)
+SP_API_OPERATIONS = [
+    ('GET', r'^/orders/v0/orders$', 'getOrders', 0.0167, 20),
+    ('GET', r'^/orders/v0/orders/[^/]+$', 'getOrder', 0.5, 30),
+    ('GET', r'^/orders/v0/orders/[^/]+/orderItems$', 'getOrderItems', 0.5, 30),
+    ('POST', r'^/reports/2021-06-30/reports$', 'createReport', 0.0167, 15),
+    ('GET', r'^/reports/2021-06-30/reports/[^/]+$', 'getReport', 2.0, 15),
+    ('GET', r'^/reports/2021-06-30/documents/[^/]+$', 'getReportDocument', 0.0167, 15),
+]
+DEFAULT_RATE, DEFAULT_BURST = 0.5, 1
+# Path segments that identify a resource (order ids, report ids...) rather than
+# an operation; API versions such as v0 and 2021-06-30 are kept
+ID_SEGMENT = re.compile(r'^(?!v\d+$)(?!\d{4}-\d{2}-\d{2}$).*\d')
+
+
+class TokenBucket:
+    """Thread-safe token bucket. acquire() reserves a token and sleeps until it is available."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Takes one token, waiting as long as needed; returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Reserving a token (possibly going negative) queues concurrent callers fairly
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def set_rate(self, rate):
+        """Adopts a new restore rate; returns False if it was already in effect."""
+        with self._lock:
+            if abs(rate - self.rate) < 1e-9:
+                return False
+            self._refill(time.monotonic())
+            self.rate = rate
+            return True
+
+    def drain(self):
+        """Called on a 429: Amazon's bucket is empty, so ours should be too."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def sp_api_operation(method, path):
+    """Maps a request to its SP-API operation name and documented (rate, burst)."""
+    for op_method, pattern, name, rate, burst in SP_API_OPERATIONS:
+        if method.upper() == op_method and re.match(pattern, path):
+            return name, rate, burst
+    # Unknown operations share one bucket per path pattern, so ids don't grow the bucket map
+    pattern = '/'.join('{id}' if ID_SEGMENT.match(segment) else segment for segment in path.split('/'))
+    return f"{method.upper()} {pattern}", DEFAULT_RATE, DEFAULT_BURST
+
+
+def get_bucket(method, path):
+    name, rate, burst = sp_api_operation(method, path)
+    with _buckets_lock:
+        bucket = _buckets.get(name)
+        if bucket is None:
+            bucket = _buckets[name] = TokenBucket(rate, burst)
+        return bucket
+
+
+def wait_for_sp_api_slot(method, path):
+    """Blocks until the operation's bucket allows another request."""
+    waited = get_bucket(method, path).acquire()
+    if waited >= 1:
+        print(f"[SP-API Rate] Waited {waited:.1f}s for {sp_api_operation(method, path)[0]}")
+    return waited
+
+
+def record_sp_api_response(method, path, response):
+    """Learns the operation's rate from x-amzn-RateLimit-Limit and empties the bucket on a 429."""
+    bucket = get_bucket(method, path)
+    limit = response.headers.get('x-amzn-RateLimit-Limit')
+    if limit:
+        try:
+            rate = float(limit)
+        except ValueError:
+            rate = None
+        if rate and rate > 0 and bucket.set_rate(rate):
+            print(f"[SP-API Rate] {sp_api_operation(method, path)[0]} rate is now {rate}/s")
+    if response.status_code == 429:
+        bucket.drain()
+
+
+def sp_api_rate(method, path):
+    return get_bucket(method, path).rate
@@ -0,0 +1,180 @@
+import queue
+import threading
+import time
+
+# --- STREAMING SYNC PIPELINE ---
+# A source thread produces batches of orders, each stage runs a pool of worker
+# threads, and the calling thread drains the last queue into a sink. Queues are
+# bounded, so a slow stage blocks the ones upstream of it instead of letting
+# batches pile up in memory.
+
+_DONE = object()
+POLL_SECONDS = 0.2
+
+
+class StageStats:
+    """Per-stage counters: throughput plus time spent starved (waiting for input) and blocked (downstream full)."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.starved_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **amounts):
+        with self._lock:
+            for key, value in amounts.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def summary(self, elapsed):
+        rate = self.items / elapsed if elapsed else 0.0
+        return (f"{self.name}: {self.items} orders ({rate:.1f}/s, busy {self.busy_seconds:.1f}s, "
+                f"starved {self.starved_seconds:.1f}s, blocked {self.blocked_seconds:.1f}s)")
+
+
+class SyncPipeline:
+    """
+    Runs source -> stages -> sink. Each stage is (name, fn, workers) where fn
+    maps a batch to a batch; the sink runs in the calling thread. The first
+    exception in any thread stops the pipeline and is re-raised from run().
+    """
+
+    def __init__(self, source, stages, sink, queue_size=4, report_interval=10):
+        self.source = source
+        self.stages = stages
+        self.sink = sink
+        self.queue_size = queue_size
+        self.report_interval = report_interval
+        self.stats = [StageStats('source', 1)] + [StageStats(name, workers) for name, _, workers in stages] + [StageStats('sink', 1)]
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        self._stop = threading.Event()    # take no new batches
+        self._abort = threading.Event()   # drop in-flight batches too
+        self._errors = []
+        self._remaining = [workers for _, _, workers in stages]
+        self._remaining_lock = threading.Lock()
+
+    def _fail(self, error):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, q, item, stats):
+        started = time.time()
+        # Once stopped, only results headed for the sink are still delivered
+        while not self._abort.is_set() and not (self._stop.is_set() and q is not self._queues[-1]):
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        stats.add(blocked_seconds=time.time() - started)
+
+    def _get(self, q, stats):
+        started = time.time()
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=POLL_SECONDS)
+                stats.add(starved_seconds=time.time() - started)
+                return item
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _run_source(self):
+        stats, out_q = self.stats[0], self._queues[0]
+        consumers = self.stages[0][2] if self.stages else 1
+        try:
+            batches = iter(self.source)
+            while not self._stop.is_set():
+                started = time.time()
+                batch = next(batches, _DONE)
+                if batch is _DONE:
+                    break
+                stats.add(items=len(batch), batches=1, busy_seconds=time.time() - started)
+                self._put(out_q, batch, stats)
+        except Exception as e:
+            print(f"[Pipeline] source failed: {e}")
+            self._fail(e)
+        finally:
+            for _ in range(consumers):
+                self._put(out_q, _DONE, stats)
+
+    def _run_stage(self, index):
+        _, fn, _ = self.stages[index]
+        stats = self.stats[index + 1]
+        in_q, out_q = self._queues[index], self._queues[index + 1]
+        try:
+            while True:
+                batch = self._get(in_q, stats)
+                if batch is _DONE:
+                    break
+                started = time.time()
+                result = fn(batch)
+                stats.add(items=len(result), batches=1, busy_seconds=time.time() - started)
+                self._put(out_q, result, stats)
+        except Exception as e:
+            print(f"[Pipeline] {stats.name} failed: {e}")
+            self._fail(e)
+        finally:
+            with self._remaining_lock:
+                self._remaining[index] -= 1
+                last_worker = self._remaining[index] == 0
+            if last_worker:
+                consumers = self.stages[index + 1][2] if index + 1 < len(self.stages) else 1
+                for _ in range(consumers):
+                    self._put(out_q, _DONE, stats)
+
+    def report(self, elapsed):
+        depths = ' '.join(str(q.qsize()) for q in self._queues)
+        print(f"[Pipeline] {elapsed:.0f}s | " + ' | '.join(s.summary(elapsed) for s in self.stats) + f" | queues [{depths}]")
+
+    def run(self):
+        """Runs the pipeline to completion and returns the per-stage stats."""
+        started = last_report = time.time()
+        threads = [threading.Thread(target=self._run_source, name='sync-source', daemon=True)]
+        for index, (name, _, workers) in enumerate(self.stages):
+            threads += [threading.Thread(target=self._run_stage, args=(index,), name=f'sync-{name}-{n}', daemon=True)
+                        for n in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        stats, in_q = self.stats[-1], self._queues[-1]
+        try:
+            # After a failure the source and stages stop taking new batches, but
+            # batches already being processed still reach the sink so their work is kept.
+            waiting_since = time.time()
+            while not (self._stop.is_set() and in_q.empty() and not any(t.is_alive() for t in threads)):
+                try:
+                    batch = in_q.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    continue
+                stats.add(starved_seconds=time.time() - waiting_since)
+                if batch is _DONE:
+                    if not self._stop.is_set():
+                        break
+                    continue
+                batch_started = time.time()
+                try:
+                    self.sink(batch)
+                except Exception as e:
+                    print(f"[Pipeline] sink failed: {e}")
+                    self._fail(e)
+                    break
+                stats.add(items=len(batch), batches=1, busy_seconds=time.time() - batch_started)
+                if time.time() - last_report >= self.report_interval:
+                    last_report = time.time()
+                    self.report(last_report - started)
+                waiting_since = time.time()
+        finally:
+            # Also reached on KeyboardInterrupt and sink failures: drop whatever is still in flight
+            self._stop.set()
+            self._abort.set()
+            for thread in threads:
+                thread.join()
+        self.report(time.time() - started)
+        if self._errors:
+            raise self._errors[0]
+        return self.stats
@@ -0,0 +1,214 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+# --- RAPIDSHYP TRACKING CACHE ---
+# Latest known RapidShyp status per AWB. The file is an append-only JSON-lines
+# log ({"awb", "raw_status", "timestamp"} per line, last line wins); writes are
+# buffered and appended in batches by a background flusher, and the log is
+# rewritten without superseded or expired lines once it grows too large.
+
+# Previous whole-dict JSON cache; imported once if the log does not exist yet.
+LEGACY_CACHE_FILE = 'rapidshyp_cache.json'
+
+FLUSH_BATCH_SIZE = 200
+COMPACT_MIN_LINES = 1000
+
+
+class TrackingCache:
+    """
+    Dict-like AWB -> {'raw_status', 'timestamp'} cache. Reads never take a
+    lock: entries are immutable dicts swapped in atomically. Writers only lock
+    to queue the line for the next batched append.
+    """
+
+    def __init__(self, path, ttl_seconds=200 * 86400, flush_interval=5):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self._entries = {}
+        self._pending = []
+        self._lines_on_disk = 0
+        self._lock = threading.Lock()        # guards _pending
+        self._file_lock = threading.Lock()   # serializes appends and compaction in this process
+        self._flushed = threading.Event()
+        self.load()
+        self._flusher = threading.Thread(target=self._run_flusher, name='tracking-cache-flusher', daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    # --- Reads (lock-free) ---
+    def get(self, awb, default=None):
+        return self._entries.get(awb, default)
+
+    def __getitem__(self, awb):
+        return self._entries[awb]
+
+    def __contains__(self, awb):
+        return awb in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    # --- Writes ---
+    def put(self, awb, raw_status, timestamp=None):
+        entry = {'raw_status': raw_status, 'timestamp': timestamp or time.time()}
+        self._entries[awb] = entry
+        with self._lock:
+            self._pending.append(dict(entry, awb=awb))
+            flush_now = len(self._pending) >= FLUSH_BATCH_SIZE
+        if flush_now:
+            self._flushed.set()
+
+    def __setitem__(self, awb, entry):
+        self.put(awb, entry.get('raw_status', entry.get('status')), entry.get('timestamp'))
+
+    def is_expired(self, entry, now=None):
+        return (now or time.time()) - (entry.get('timestamp') or 0) > self.ttl_seconds
+
+    # --- Persistence ---
+    def load(self):
+        entries, lines = {}, 0
+        path = self.path
+        if not os.path.exists(path):
+            legacy = os.path.splitext(path)[0] + '.json'
+            path = next((p for p in (legacy, LEGACY_CACHE_FILE) if p != self.path and os.path.exists(p)), None)
+        if path:
+            entries, lines = self._read(path)
+        now = time.time()
+        self._entries = {awb: e for awb, e in entries.items() if not self.is_expired(e, now)}
+        self._lines_on_disk = lines
+        if path and path != self.path:
+            print(f"[Tracking Cache] Importing {len(self._entries)} entries from legacy '{path}'")
+            self.compact()
+
+    @staticmethod
+    def _read(path):
+        entries, lines = {}, 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        if lines == 0:
+                            # Pretty-printed legacy dict: not line-oriented
+                            f.seek(0)
+                            return _legacy_entries(json.load(f)), 0
+                        continue  # torn last line from an interrupted append
+                    lines += 1
+                    if isinstance(record.get('awb'), str):
+                        entries[record['awb']] = {'raw_status': record.get('raw_status'), 'timestamp': record.get('timestamp', 0)}
+                    else:
+                        entries.update(_legacy_entries(record))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[Tracking Cache] Could not read '{path}', starting empty: {e}")
+        return entries, lines
+
+    def flush(self):
+        """Appends buffered writes to the log; compacts it once superseded lines dominate."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        with self._file_lock, _locked(self.path):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(record) + '\n' for record in pending))
+            self._lines_on_disk += len(pending)
+            needs_compaction = self._lines_on_disk > max(COMPACT_MIN_LINES, 2 * len(self._entries))
+        if needs_compaction:
+            self.compact()
+
+    def compact(self):
+        """Rewrites the log with one line per live AWB, dropping entries older than the TTL."""
+        with self._file_lock, _locked(self.path):
+            # Pick up lines appended by other processes since we loaded
+            if os.path.exists(self.path):
+                on_disk, _ = self._read(self.path)
+                for awb, entry in on_disk.items():
+                    current = self._entries.get(awb)
+                    if current is None or (entry.get('timestamp') or 0) > (current.get('timestamp') or 0):
+                        self._entries[awb] = entry
+            now = time.time()
+            live = {}
+            for awb, entry in list(self._entries.items()):
+                if not self.is_expired(entry, now):
+                    live[awb] = entry
+                elif self._entries.get(awb) is entry:
+                    self._entries.pop(awb, None)
+            dir_ = os.path.dirname(self.path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=dir_, prefix='.tmp_', suffix='.jsonl')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for awb, entry in live.items():
+                    f.write(json.dumps(dict(entry, awb=awb)) + '\n')
+            os.replace(tmp_path, self.path)
+            self._lines_on_disk = len(live)
+        print(f"[Tracking Cache] Compacted '{self.path}' to {len(live)} entries")
+
+    def _run_flusher(self):
+        while True:
+            self._flushed.wait(self.flush_interval)
+            self._flushed.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Tracking Cache] Flush failed: {e}")
+
+
+def _legacy_entries(data):
+    """Entries from the old {awb: {'raw_status'|'status', 'timestamp'}} format."""
+    entries = {}
+    for awb, entry in (data or {}).items():
+        if isinstance(entry, dict):
+            entries[awb] = {'raw_status': entry.get('raw_status', entry.get('status')), 'timestamp': entry.get('timestamp', 0)}
+    return entries
+
+
+class _locked:
+    """Exclusive advisory lock on '<path>.lock' so processes don't interleave compactions."""
+
+    def __init__(self, path):
+        self.lock_path = path + '.lock'
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_tracking_cache(config):
+    """Returns the shared TrackingCache for config['RAPIDSHYP_CACHE_FILE'], loading it on first use."""
+    path = config.get('RAPIDSHYP_CACHE_FILE') or 'rapidshyp_cache.jsonl'
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = TrackingCache(
+                path,
+                ttl_seconds=config.get('RAPIDSHYP_CACHE_TTL_DAYS', 200) * 86400,
+                flush_interval=config.get('RAPIDSHYP_CACHE_FLUSH_SECONDS', 5),
+            )
+            _caches[path] = cache
+        return cache
@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .helpers import is_terminal_status, normalize_status
+
+# --- ADAPTIVE RAPIDSHYP POLLING ---
+# Base poll interval per normalized status, in seconds.
+BASE_INTERVALS = {
+    'In-Transit': 2 * 3600,
+    'Exception': 1 * 3600,
+    'Processing': 3 * 3600,
+    'Unfulfilled': 6 * 3600,
+}
+OUT_FOR_DELIVERY_INTERVAL = 30 * 60
+DEFAULT_INTERVAL = 3 * 3600
+MAX_INTERVAL = 24 * 3600
+STALE_AFTER_SECONDS = 2 * 86400      # status unchanged for 2 days -> back off
+RECENT_WEBHOOK_SECONDS = 12 * 3600   # webhooks are keeping this AWB up to date
+RECENT_WEBHOOK_FACTOR = 3
+
+
+def poll_interval(order, last_change, now):
+    """
+    Seconds until an AWB should be polled again, based on its normalized
+    status, how long the status has been unchanged and recent webhook activity.
+    """
+    raw_upper = (order.get('raw_rapidshyp_status') or '').upper()
+    if any(s in raw_upper for s in ['OUT FOR DELIVERY', 'OUT_FOR_DELIVERY', 'OFD']):
+        interval = OUT_FOR_DELIVERY_INTERVAL
+    else:
+        status = order.get('normalized_status') or normalize_status(order, order.get('raw_rapidshyp_status'))
+        interval = BASE_INTERVALS.get(status, DEFAULT_INTERVAL)
+
+    unchanged_for = now - (last_change or now)
+    if unchanged_for > STALE_AFTER_SECONDS:
+        # Grows by one base interval per stale day, e.g. a week in "Shipment Booked"
+        interval *= 1 + (unchanged_for - STALE_AFTER_SECONDS) / 86400
+
+    webhook_at = order.get('rapidshyp_webhook_at')
+    if webhook_at and now - webhook_at < RECENT_WEBHOOK_SECONDS:
+        interval *= RECENT_WEBHOOK_FACTOR
+
+    return min(interval, MAX_INTERVAL)
+
+
+class TrackingScheduler:
+    """
+    Next-check time per AWB, persisted as JSON next to the RapidShyp cache.
+    The sync asks is_due() for each order it walks, so a dict lookup is all
+    scheduling needs. AWBs the scheduler has never seen are always due.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}   # awb -> {next_check, last_status, last_change}
+        self.load()
+
+    def load(self):
+        entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError) as e:
+                print(f"[Scheduler] Could not read '{self.path}', starting fresh: {e}")
+        with self._lock:
+            self._entries = entries
+
+    def save(self):
+        with self._lock:
+            data = dict(self._entries)
+        dir_ = os.path.dirname(self.path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=dir_, prefix='.tmp_', suffix='.json')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_due(self, awb, now=None):
+        entry = self._entries.get(awb)
+        return entry is None or entry['next_check'] <= (now or time.time())
+
+    def due_count(self, now=None):
+        """Number of scheduled AWBs whose next check has passed (for logging; nothing is consumed)."""
+        now = now or time.time()
+        with self._lock:
+            return sum(1 for entry in self._entries.values() if entry['next_check'] <= now)
+
+    def record_check(self, awb, order, now=None):
+        """Schedules the next poll after a fresh status was fetched for this AWB."""
+        now = now or time.time()
+        status = order.get('raw_rapidshyp_status')
+        if is_terminal_status(status):
+            self.forget(awb)
+            return
+        with self._lock:
+            entry = self._entries.get(awb) or {}
+            last_change = entry.get('last_change', now) if entry.get('last_status') == status else now
+            next_check = now + poll_interval(order, last_change, now)
+            self._entries[awb] = {'next_check': next_check, 'last_status': status, 'last_change': last_change}
+
+    def forget(self, awb):
+        with self._lock:
+            self._entries.pop(awb, None)
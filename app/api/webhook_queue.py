@@ -0,0 +1,214 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from .order_events import wake_order_broadcasters
+from .order_store import get_order_store
+
+# --- WEBHOOK INGESTION QUEUE ---
+# The webhook endpoint only validates and enqueues; a background writer per
+# process drains the queue in batches and records the statuses in the order
+# store's delta log, then wakes this process's /orders/stream broadcaster.
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL_SECONDS = 0.5
+RETRY_MAX_SECONDS = 30   # backoff cap while the store is busy (e.g. "database is locked")
+DEAD_LETTER_LIMIT = 100  # most recent records that could not be applied, kept for /webhook/metrics
+
+_queue = queue.Queue()
+_writer_lock = threading.Lock()
+_writer = {'pid': None, 'config': None}
+_metrics_lock = threading.Lock()
+_dead_letters = deque(maxlen=DEAD_LETTER_LIMIT)
+_metrics = {
+    'enqueued': 0,
+    'applied': 0,
+    'dropped': 0,
+    'retries': 0,
+    'dead_lettered': 0,
+    'in_flight': 0,   # items taken off the queue and not yet applied
+    'batches': 0,
+    'coalesced': 0,
+    'last_lag_seconds': 0.0,
+    'max_lag_seconds': 0.0,
+    'total_lag_seconds': 0.0,
+}
+
+
+def _as_text(value, field, required=True):
+    # RapidShyp may send ids as numbers; anything else (objects, lists, booleans) is malformed
+    if value is None or value == '':
+        if required:
+            raise ValueError(f"{field} is missing")
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f"{field} must be a string, got {type(value).__name__}")
+    return str(value)
+
+
+def validate_status_update(order_name, status, awb):
+    """Returns the update as (str, str, str or None); raises ValueError for malformed values."""
+    return _as_text(order_name, 'seller_order_id'), _as_text(status, 'shipment_status'), _as_text(awb, 'awb', required=False)
+
+
+def enqueue_status_updates(config, updates):
+    """
+    Queues (order_name, status, awb) tuples and makes sure the writer is
+    running. Every update is validated first, so nothing that would fail in
+    the writer is acknowledged; a malformed one raises ValueError and nothing
+    is queued.
+    """
+    updates = [validate_status_update(*update) for update in updates]
+    _ensure_writer(config)
+    now = time.time()
+    for update in updates:
+        _queue.put((now, update))
+    with _metrics_lock:
+        _metrics['enqueued'] += len(updates)
+
+
+def get_queue_metrics():
+    """Queue depth and enqueue-to-apply lag for the current process."""
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    total_lag = metrics.pop('total_lag_seconds')
+    metrics['avg_lag_seconds'] = round(total_lag / metrics['applied'], 4) if metrics['applied'] else 0.0
+    metrics['queue_depth'] = _queue.qsize()
+    metrics['dead_letters'] = list(_dead_letters)
+    metrics['pid'] = os.getpid()
+    return metrics
+
+
+def coalesce_updates(items):
+    """
+    Collapses queued updates so each order gets one write: the latest status
+    wins, and the first AWB seen is kept.
+    """
+    latest = {}
+    for _, (order_name, status, awb) in items:
+        key = (order_name or '').lstrip('#')
+        _, _, previous_awb = latest.get(key, (None, None, None))
+        latest[key] = (order_name, status, previous_awb or awb)
+    return list(latest.values())
+
+
+def _drain_batch(block=True):
+    items = []
+    try:
+        items.append(_queue.get(block=block))
+    except queue.Empty:
+        return items
+    deadline = time.time() + FLUSH_INTERVAL_SECONDS
+    while len(items) < BATCH_SIZE:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        try:
+            items.append(_queue.get(timeout=remaining) if block else _queue.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+
+def _apply_batch(store, items):
+    updates = coalesce_updates(items)
+    recorded = store.append_status_deltas(updates)
+    if recorded:
+        wake_order_broadcasters()
+    now = time.time()
+    lags = [now - enqueued_at for enqueued_at, _ in items]
+    lag = max(lags)
+    with _metrics_lock:
+        _metrics['batches'] += 1
+        _metrics['applied'] += len(items)
+        _metrics['coalesced'] += len(items) - len(updates)
+        _metrics['dropped'] += len(updates) - recorded
+        _metrics['last_lag_seconds'] = round(lag, 4)
+        _metrics['max_lag_seconds'] = round(max(_metrics['max_lag_seconds'], lag), 4)
+        _metrics['total_lag_seconds'] += sum(lags)
+    print(f"[Webhook Queue] Applied {len(items)} update(s) as {recorded} delta(s), lag {lag:.3f}s.")
+
+
+def _apply_with_retry(store, items):
+    """
+    Applies the batch. The senders were already acknowledged, so a busy
+    store ("database is locked") is retried with backoff until the batch
+    lands. Any other error is specific to the data: the batch is split and
+    the records that still fail are dead-lettered so they cannot block the
+    queue.
+    """
+    attempt = 0
+    while True:
+        try:
+            _apply_batch(store, items)
+            return
+        except sqlite3.OperationalError as e:
+            delay = min(RETRY_MAX_SECONDS, 0.5 * (2 ** attempt))
+            attempt += 1
+            with _metrics_lock:
+                _metrics['retries'] += 1
+            print(f"[Webhook Queue] Store busy applying batch of {len(items)} (attempt {attempt}): {e}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+        except Exception as e:
+            if len(items) > 1:
+                print(f"[Webhook Queue] Batch of {len(items)} failed ({e!r}); applying records one by one")
+                for item in items:
+                    _apply_with_retry(store, [item])
+                return
+            _dead_letter(items[0], e)
+            return
+
+
+def _dead_letter(item, error):
+    enqueued_at, update = item
+    with _metrics_lock:
+        _metrics['dead_lettered'] += 1
+        _dead_letters.append({'update': list(update), 'error': repr(error), 'enqueued_at': enqueued_at})
+    print(f"[Webhook Queue] Dead-lettered update {update}: {error!r}")
+
+
+def _run_writer(config):
+    store = get_order_store(config)
+    while True:
+        items = _drain_batch()
+        with _metrics_lock:
+            _metrics['in_flight'] = len(items)
+        try:
+            _apply_with_retry(store, items)
+        finally:
+            with _metrics_lock:
+                _metrics['in_flight'] = 0
+            for _ in items:
+                _queue.task_done()
+
+
+def flush_queue():
+    """Synchronously applies whatever is still queued (used at process exit)."""
+    config = _writer['config']
+    if config is None:
+        return
+    store = get_order_store(config)
+    while True:
+        items = _drain_batch(block=False)
+        if not items:
+            return
+        try:
+            _apply_batch(store, items)
+        finally:
+            for _ in items:
+                _queue.task_done()
+
+
+def _ensure_writer(config):
+    if _writer['pid'] == os.getpid():
+        return
+    with _writer_lock:
+        if _writer['pid'] == os.getpid():
+            return
+        _writer['pid'], _writer['config'] = os.getpid(), config
+        threading.Thread(target=_run_writer, args=(config,), name='webhook-queue-writer', daemon=True).start()
+        atexit.register(flush_queue)
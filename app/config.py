@@ -9,6 +9,8 @@ class Config:
     # Shopify Credentials
     SHOPIFY_TOKEN = os.environ.get('SHOPIFY_TOKEN')
     SHOPIFY_SHOP_URL = os.environ.get('SHOPIFY_SHOP_URL')
+    SHOPIFY_SYNC_OVERLAP_MINUTES = int(os.environ.get('SHOPIFY_SYNC_OVERLAP_MINUTES', 10))  # re-read this much before the watermark
+    SHOPIFY_FULL_RECONCILE_HOURS = int(os.environ.get('SHOPIFY_FULL_RECONCILE_HOURS', 24))  # full 180-day pass at most this often
 
     # Facebook Ads Credentials
     FACEBOOK_ACCESS_TOKEN = os.environ.get('FACEBOOK_ACCESS_TOKEN')
@@ -23,9 +25,13 @@ class Config:
     REFRESH_TOKEN = os.environ.get('REFRESH_TOKEN')
     MARKETPLACE_ID = os.environ.get('MARKETPLACE_ID')
     BASE_URL = os.environ.get('BASE_URL', 'https://sellingpartnerapi-eu.amazon.com')
+    LWA_TOKEN_URL = os.environ.get('LWA_TOKEN_URL', 'https://api.amazon.com/auth/o2/token')
+    AMAZON_USE_REPORTS = os.environ.get('AMAZON_USE_REPORTS', 'false').lower() == 'true'
 
     # RapidShyp Credentials
     RAPIDSHYP_API_KEY = os.environ.get('RAPIDSHYP_API_KEY')
+    RAPIDSHYP_API_BASE = os.environ.get('RAPIDSHYP_API_BASE', 'https://api.rapidshyp.com/rapidshyp/apis/v1')
+    RAPIDSHYP_ASYNC_CONCURRENCY = int(os.environ.get('RAPIDSHYP_ASYNC_CONCURRENCY', 50))
     
     # App User Credentials (for login)
     APP_USER_EMAIL = os.environ.get('APP_USER_EMAIL')
@@ -35,4 +41,19 @@ class Config:
     CACHE_DIR = os.environ.get('CACHE_DIR', '.')  # change to instance path or shared storage for multi-instance
     AMAZON_CACHE_FILE = os.path.join(CACHE_DIR, os.environ.get('AMAZON_CACHE_FILE', 'amazon_cache.json'))
     AMAZON_ITEMS_CACHE_FILE = os.path.join(CACHE_DIR, os.environ.get('AMAZON_ITEMS_CACHE_FILE', 'amazon_items_cache.json'))
-    RAPIDSHYP_CACHE_FILE = os.path.join(CACHE_DIR, os.environ.get('RAPIDSHYP_CACHE_FILE', 'rapidshyp_cache.json'))
\ No newline at end of file
+    AMAZON_ITEMS_DB_FILE = os.path.join(CACHE_DIR, os.environ.get('AMAZON_ITEMS_DB_FILE', 'amazon_items.db'))
+    AMAZON_SYNC_STATE_FILE = os.path.join(CACHE_DIR, os.environ.get('AMAZON_SYNC_STATE_FILE', 'amazon_sync_state.json'))
+    RAPIDSHYP_CACHE_FILE = os.path.join(CACHE_DIR, os.environ.get('RAPIDSHYP_CACHE_FILE', 'rapidshyp_cache.jsonl'))
+    RAPIDSHYP_CACHE_TTL_DAYS = int(os.environ.get('RAPIDSHYP_CACHE_TTL_DAYS', 200))  # longer than the 180-day sync window
+    RAPIDSHYP_CACHE_FLUSH_SECONDS = float(os.environ.get('RAPIDSHYP_CACHE_FLUSH_SECONDS', 5))
+    RAPIDSHYP_SCHEDULE_FILE = os.path.join(CACHE_DIR, os.environ.get('RAPIDSHYP_SCHEDULE_FILE', 'rapidshyp_schedule.json'))
+    ORDER_DB_FILE = os.path.join(CACHE_DIR, os.environ.get('ORDER_DB_FILE', 'orders.db'))
+    DELTA_COMPACT_INTERVAL_SECONDS = int(os.environ.get('DELTA_COMPACT_INTERVAL_SECONDS', 30))
+    SYNC_CHECKPOINT_INTERVAL_SECONDS = int(os.environ.get('SYNC_CHECKPOINT_INTERVAL_SECONDS', 60))
+    CREDENTIALS_DB_FILE = os.path.join(CACHE_DIR, os.environ.get('CREDENTIALS_DB_FILE', 'credentials.db'))  # LWA tokens shared by workers and scripts
+    CREDENTIAL_REFRESH_AHEAD_SECONDS = int(os.environ.get('CREDENTIAL_REFRESH_AHEAD_SECONDS', 600))
+    ORDER_STREAM_POLL_SECONDS = float(os.environ.get('ORDER_STREAM_POLL_SECONDS', 1))  # change log check for /orders/stream
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 50))  # gthread threads per worker; the Procfile passes the same value
+    # Each open stream holds a thread, so streams get at most a quarter of the worker's threads
+    # and the rest stay free for API requests. An override must stay well below GUNICORN_THREADS.
+    ORDER_STREAM_MAX_CLIENTS = int(os.environ.get('ORDER_STREAM_MAX_CLIENTS', GUNICORN_THREADS // 4))
@@ -1,5 +1,6 @@
 // --- STATE ---
 let allOrders = [];
+let ordersSeq = null; // X-Change-Seq of the last order sync, for delta refreshes
 let performanceData = [];
 let adsetPerformanceData = [];
 let selectedOrderId = null;
@@ -118,6 +119,7 @@ async function handleLogin() {
 
 function logout() {
     authToken = null;
+    stopOrderStream();
     localStorage.removeItem('authToken');
     if(loginEmailEl) loginEmailEl.value = '';
     if(loginPasswordEl) loginPasswordEl.value = '';
@@ -154,6 +156,7 @@ async function fetchApiData(endpoint, errorMessage, options = {}) {
 
     try {
         const response = await fetch(`/api${endpoint}`, { ...options, headers });
+        if (options.onHeaders) options.onHeaders(response.headers);
         if (response.status === 401) {
             showNotification("Session expired. Please log in again.", true);
             logout();
@@ -178,7 +181,105 @@ async function fetchApiData(endpoint, errorMessage, options = {}) {
 }
 
 // --- DATA FETCHING & ACTION WRAPPERS ---
-const fetchOrdersFromServer = () => fetchApiData(`/get-orders`, 'Failed to fetch orders.');
+const fetchOrdersFromServer = () => fetchApiData(`/get-orders`, 'Failed to fetch orders.', {
+    onHeaders: (headers) => { ordersSeq = headers.get('X-Change-Seq') !== null ? Number(headers.get('X-Change-Seq')) : null; }
+});
+const fetchOrderChanges = (seq) => fetchApiData(`/get-orders?since=${seq}`, 'Failed to fetch order updates.');
+
+// Merges a /get-orders?since= delta into allOrders; returns true if anything changed.
+const orderKey = (order) => `${order.platform}:${order.id}`;
+function applyOrderChanges(delta) {
+    ordersSeq = delta.seq;
+    if (delta.reset) {
+        allOrders = delta.orders;
+        return true;
+    }
+    const updates = [...delta.added, ...delta.changed];
+    // Shopify orders that aged out of the server's window are dropped as well
+    const inWindow = allOrders.filter(o => o.platform !== 'Shopify' || o.date >= delta.windowStart);
+    if (!updates.length && !delta.removed.length && inWindow.length === allOrders.length) return false;
+    const byKey = new Map(inWindow.map(o => [orderKey(o), o]));
+    delta.removed.forEach(o => byKey.delete(orderKey(o)));
+    updates.forEach(o => byKey.set(orderKey(o), o));
+    allOrders = [...byKey.values()].sort((a, b) => (b.date || '').localeCompare(a.date || ''));
+    return true;
+}
+
+async function refreshOrders() {
+    if (ordersSeq === null) {
+        allOrders = await fetchOrdersFromServer();
+        return true;
+    }
+    return applyOrderChanges(await fetchOrderChanges(ordersSeq));
+}
+// --- LIVE ORDER UPDATES ---
+// /api/orders/stream pushes the same deltas as ?since= as Server-Sent Events.
+// EventSource cannot send the Authorization header, so the stream is read with fetch.
+const ORDER_STREAM_RETRY_MS = 5000;
+const ORDER_STREAM_MAX_RETRY_MS = 300000; // a busy (503) or failing stream is retried ever less often
+let orderStreamRetryMs = ORDER_STREAM_RETRY_MS;
+const ORDER_POLL_INTERVAL_MS = 600000; // safety net only; the stream delivers changes
+let orderStreamController = null;
+
+function renderOrderViews() {
+    if (currentView === 'orders-dashboard') renderAllDashboard();
+    else if (currentView === 'order-insights') renderAllInsights();
+}
+
+async function handleOrderStreamEvent(frame) {
+    let event = 'message', data = '';
+    frame.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+    });
+    if (event === 'changes') {
+        if (applyOrderChanges(JSON.parse(data))) renderOrderViews();
+    } else if (event === 'reset') {
+        ordersSeq = null;
+        await refreshOrders();
+        renderOrderViews();
+    }
+}
+
+async function startOrderStream() {
+    stopOrderStream();
+    const controller = orderStreamController = new AbortController();
+    try {
+        const since = ordersSeq !== null ? `?since=${ordersSeq}` : '';
+        const response = await fetch(`/api/orders/stream${since}`, { headers: getAuthHeaders(), signal: controller.signal });
+        if (response.status === 401) {
+            showNotification("Session expired. Please log in again.", true);
+            logout();
+            return;
+        }
+        if (!response.ok || !response.body) throw new Error(`Order stream unavailable (${response.status})`);
+        orderStreamRetryMs = ORDER_STREAM_RETRY_MS;
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value.replace(/\r/g, '');
+            let end;
+            while ((end = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, end);
+                buffer = buffer.slice(end + 2);
+                await handleOrderStreamEvent(frame);
+            }
+        }
+    } catch (error) {
+        if (controller.signal.aborted) return;
+        console.warn('Order stream interrupted:', error);
+        orderStreamRetryMs = Math.min(orderStreamRetryMs * 2, ORDER_STREAM_MAX_RETRY_MS);
+    }
+    if (orderStreamController === controller && authToken) setTimeout(() => { if (orderStreamController === controller) startOrderStream(); }, orderStreamRetryMs);
+}
+
+function stopOrderStream() {
+    if (orderStreamController) orderStreamController.abort();
+    orderStreamController = null;
+}
+
 const fetchAdPerformanceData = (since, until) => fetchApiData(`/get-ad-performance?since=${since}&until=${until}`, 'Failed to fetch ad performance.');
 const fetchAdsetPerformanceData = (endpoint) => fetchApiData(endpoint, 'Failed to fetch ad set performance.');
 
@@ -638,7 +739,7 @@ o.forEach(order=>{
     const r=document.createElement('tr');
     r.className=`order-row border-b border-slate-100 cursor-pointer`;
     r.dataset.orderId=order.id;
-    r.innerHTML=`<td class="p-4"><img src="${platformLogos[order.platform]||''}" class="w-6 h-6" alt="${order.platform}"></td><td class="p-4 text-slate-600 text-sm">${order.date}</td><td class="p-4 font-semibold text-slate-700">${order.id}</td><td class="p-4 font-medium">${displayName}</td><td class="p-4">${formatCurrency(order.total)}</td><td class="p-4"><span class="px-2 py-1 text-xs font-semibold rounded-full ${getStatusBadge(order.status)}">${order.status}</span></td>`;
+    r.innerHTML=`<td class="p-4"><img src="${platformLogos[order.platform]||''}" class="w-6 h-6" alt="${order.platform}"></td><td class="p-4 text-slate-600 text-sm">${order.date}</td><td class="p-4 font-semibold text-slate-700">${order.id}</td><td class="p-4 font-medium">${displayName}</td><td class="p-4">${formatCurrency(order.total)}</td><td class="p-4"><span class="px-2 py-1 text-xs font-semibold rounded-full ${getStatusBadge(order.status)}">${order.status}</span>${order.shipmentStatus?`<p class="text-xs text-slate-500 mt-1">${order.shipmentStatus}</p>`:''}</td>`;
     r.addEventListener('click',()=>openOrderModal(order.id));
     ordersListEl.appendChild(r)
 })}
@@ -662,10 +763,10 @@ d.setHours(23,59,59,999);const r=o.filter(i=>{const n=new Date(i.date);return n>
 function updateDashboardKpis(o){const k={new:0,processing:0,shipped:0,cancelled:0};o.forEach(s=>{if(s.status==='New')k.new++;else if(s.status==='Processing')k.processing++;else if(s.status==='Shipped')k.shipped++;else if(s.status==='Cancelled')k.cancelled++});const renderKpi=(e,t,v,i)=>{e.innerHTML=`<div class="flex items-center">${i}<p class="text-sm font-medium text-slate-500 ml-2">${t}</p></div><p class="text-3xl font-bold text-slate-800 mt-2">${v}</p>`};renderKpi(dashboardKpiElements.newOrders,'New Orders',k.new,`<svg class="w-6 h-6 text-blue-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M13 10V3L4 14h7v7l9-11h-7z"></path></svg>`);renderKpi(dashboardKpiElements.processing,'Processing',k.processing,`<svg class="w-6 h-6 text-yellow-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M12 8v4l3 3m6-3a9 9 0 11-18 0 9 9 0 0118 0z"></path></svg>`);renderKpi(dashboardKpiElements.shipped,'Shipped',k.shipped,`<svg class="w-6 h-6 text-indigo-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path d="M9 17a2 2 0 11-4 0 2 2 0 014 0zM19 17a2 2 0 11-4 0 2 2 0 014 0z"></path><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M13 17H6V6h11v4l4 4v2h-3zM6 6l6-4l6 4"></path></svg>`);renderKpi(dashboardKpiElements.cancelled,'Cancelled',k.cancelled,`<svg class="w-6 h-6 text-red-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M18.364 18.364A9 9 0 005.636 5.636m12.728 12.728A9 9 0 015.636 5.636m12.728 12.728L5.636 5.636"></path></svg>`)}
 function updateInsightsKpis(o,c){const a=o.filter(s=>s.status!=='Cancelled');const t=a.reduce((s,r)=>s+r.total,0);const v=a.length>0?t/a.length:0;const l=o.length;const n=o.filter(s=>s.status==='New').length;const p=o.filter(s=>s.status==='Shipped').length;const r=0;const d=o.filter(s=>s.status==='Cancelled').length;const renderKpi=(e,i,u,f,h,m)=>{const g=h&&h.startsWith('+')?'text-green-500':'text-red-500';e.innerHTML=`<div class="flex items-center">${f}<p class="text-xs font-medium text-slate-500 ml-2">${i}</p></div><p class="text-2xl font-bold text-slate-800 mt-2">${u}</p>${h?`<p class="text-xs ${g} mt-1">${h} <span class="text-slate-400">${m}</span></p>`:`<p class="text-xs text-slate-400 mt-1">&nbsp;</p>`}`};renderKpi(insightsKpiElements.revenue.el,'Total Revenue',formatCurrency(t),`<svg class="w-5 h-5 text-green-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M12 8c-1.657 0-3 .895-3 2s1.343 2 3 2 3 .895 3 2-1.343 2-3 2m0-8c1.11 0 2.08.402 2.599 1M12 8V7m0 1v.01"></path></svg>`,c.revenueTrend,c.periodLabel);renderKpi(insightsKpiElements.avgValue.el,'Avg. Value',formatCurrency(v),`<svg class="w-5 h-5 text-blue-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M3 6l3 6h10a2 2 0 001.79-1.11L21 8M6 18h12a2 2 0 002-2v-5a2 2 0 00-2-2H6a2 2 0 00-2 2v5a2 2 0 002 2z"></path></svg>`,'','');renderKpi(insightsKpiElements.allOrders.el,'All Orders',l,`<svg class="w-5 h-5 text-slate-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M3 7v10a2 2 0 002 2h14a2 2 0 002-2V9a2 2 0 00-2-2h-6l-2-2H5a2 2 0 00-2 2z"></path></svg>`,c.ordersTrend,c.periodLabel);renderKpi(insightsKpiElements.new.el,'New Orders',n,`<svg class="w-5 h-5 text-blue-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M13 10V3L4 14h7v7l9-11h-7z"></path></svg>`,'','');renderKpi(insightsKpiElements.shipped.el,'Shipped',p,`<svg class="w-5 h-5 text-indigo-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path d="M9 17a2 2 0 11-4 0 2 2 0 014 0zM19 17a2 2 0 11-4 0 2 2 0 014 0z"></path><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M13 17H6V6h11v4l4 4v2h-3zM6 6l6-4l6 4"></path></svg>`,'','');renderKpi(insightsKpiElements.rto.el,'RTO',r,`<svg class="w-5 h-5 text-orange-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M17 9l-5 5-5-5"></path></svg>`,'','');renderKpi(insightsKpiElements.cancelled.el,'Cancelled',d,`<svg class="w-5 h-5 text-red-500" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M18.364 18.364A9 9 0 005.636 5.636m12.728 12.728A9 9 0 015.636 5.636m12.728 12.728L5.636 5.636"></path></svg>`,'','')}
 function renderInsightCharts(o,s,e){if(revenueChartInstance)revenueChartInstance.destroy();if(platformChartInstance)platformChartInstance.destroy();if(paymentChartInstance)paymentChartInstance.destroy();const d={};if(s&&e){let c=new Date(s);while(c<=e){d[c.toISOString().split('T')[0]]=0;c.setDate(c.getDate()+1)}}
-o.forEach(r=>{if(r.status!=='Cancelled'){const i=new Date(r.date).toISOString().split('T')[0];if(d[i]!==undefined)d[i]+=r.total}});revenueChartInstance=new Chart(revenueChartCanvas,{type:'line',data:{labels:Object.keys(d).map(l=>new Date(l).toLocaleDateString('en-US',{timeZone:'UTC',month:'short',day:'numeric'})),datasets:[{label:'Revenue',data:Object.values(d),borderColor:'rgb(79, 70, 229)',backgroundColor:'rgba(79, 70, 229, 0.1)',fill:true,tension:0.1}]},options:{responsive:true,maintainAspectRatio:false,plugins:{title:{display:true,text:'Revenue Over Time'}}}});const p={Shopify:0,Amazon:0};o.forEach(r=>{if(r.status!=='Cancelled'&&p[r.platform]!==undefined)p[r.platform]+=r.total});platformChartInstance=new Chart(platformChartCanvas,{type:'doughnut',data:{labels:Object.keys(p),datasets:[{data:Object.values(p),backgroundColor:['#96bf48','#ff9900']}]},options:{responsive:true,maintainAspectRatio:false,plugins:{title:{display:true,text:'Revenue by Platform'}}}});const m={Prepaid:0,COD:0};o.forEach(r=>{if(r.paymentMethod){const i=r.paymentMethod.toLowerCase();if(i.includes("cod")||i.includes("cash")){m.COD++}else{m.Prepaid++}}});paymentChartInstance=new Chart(paymentChartCanvas,{type:'doughnut',data:{labels:Object.keys(m),datasets:[{data:Object.values(m),backgroundColor:['#10b981','#f59e0b']}]},options:{responsive:true,maintainAspectRatio:false,plugins:{title:{display:true,text:'Prepaid vs. COD'},tooltip:{callbacks:{label:c=>{const t=c.chart.data.datasets[0].data.reduce((a,b)=>a+b,0);const p=t>0?((c.raw/t)*100).toFixed(1)+'%':'0%';return`${c.label}: ${c.raw} (${p})`}}}}}})}
+o.forEach(r=>{if(r.status!=='Cancelled'){const i=new Date(r.date).toISOString().split('T')[0];if(d[i]!==undefined)d[i]+=r.total}});revenueChartInstance=new Chart(revenueChartCanvas,{type:'line',data:{labels:Object.keys(d).map(l=>new Date(l).toLocaleDateString('en-US',{timeZone:'UTC',month:'short',day:'numeric'})),datasets:[{label:'Revenue',data:Object.values(d),borderColor:'rgb(79, 70, 229)',backgroundColor:'rgba(79, 70, 229, 0.1)',fill:true,tension:0.1}]},options:{responsive:true,maintainAspectRatio:false,plugins:{title:{display:true,text:'Revenue Over Time'}}}});const p={Shopify:0,Amazon:0};o.forEach(r=>{if(r.status!=='Cancelled'&&p[r.platform]!==undefined)p[r.platform]+=r.total});platformChartInstance=new Chart(platformChartCanvas,{type:'doughnut',data:{labels:Object.keys(p),datasets:[{data:Object.values(p),backgroundColor:['#96bf48','#ff9900']}]},options:{responsive:true,maintainAspectRatio:false,plugins:{title:{display:true,text:'Revenue by Platform'}}}});const m={Prepaid:0,COD:0};o.forEach(r=>{if(r.paymentMethod&&r.paymentMethod!=='Unknown'){const i=r.paymentMethod.toLowerCase();if(i.includes("cod")||i.includes("cash")){m.COD++}else{m.Prepaid++}}});paymentChartInstance=new Chart(paymentChartCanvas,{type:'doughnut',data:{labels:Object.keys(m),datasets:[{data:Object.values(m),backgroundColor:['#10b981','#f59e0b']}]},options:{responsive:true,maintainAspectRatio:false,plugins:{title:{display:true,text:'Prepaid vs. COD'},tooltip:{callbacks:{label:c=>{const t=c.chart.data.datasets[0].data.reduce((a,b)=>a+b,0);const p=t>0?((c.raw/t)*100).toFixed(1)+'%':'0%';return`${c.label}: ${c.raw} (${p})`}}}}}})}
 function renderSettings(){const c=document.getElementById('seller-connections');c.innerHTML=connections.map(e=>`<div class="bg-white p-4 rounded-lg shadow-sm flex items-center justify-between"><div class="flex items-center"><img src="${platformLogos[e.name]}" class="w-10 h-10 mr-4"><div><p class="font-semibold text-lg">${e.name}</p><p class="text-sm text-slate-500">${e.status==='Connected'?e.user:'Click to connect'}</p></div></div><button data-platform="${e.name}" data-action="${e.status==='Connected'?'disconnect':'connect'}" class="connection-btn ${e.status==='Connected'?'font-medium text-sm text-red-600 hover:text-red-800':'font-medium text-sm text-white bg-indigo-600 hover:bg-indigo-700 px-4 py-2 rounded-lg'}">${e.status==='Connected'?'Disconnect':'Connect'}</button></div>`).join('');document.querySelectorAll('.connection-btn').forEach(b=>b.addEventListener('click',e=>handleConnection(e.currentTarget.dataset.platform,e.currentTarget.dataset.action)))}
 function handleConnection(p,a){if(a==='connect'){showNotification(`Simulating connection to ${p}...`);setTimeout(()=>{showNotification(`Successfully connected to ${p}.`)},1500)}else if(a==='disconnect'){if(confirm(`Are you sure you want to disconnect from ${p}?`)){showNotification(`Disconnected from ${p}.`)}}}
-async function loadInitialData(){try{allOrders=await fetchOrdersFromServer();initializeAllFilters();navigate('orders-dashboard');setInterval(async()=>{if(['orders-dashboard','order-insights'].includes(currentView)){try{allOrders=await fetchOrdersFromServer();if(currentView==='orders-dashboard')renderAllDashboard();else renderAllInsights()}catch(e){console.error("Periodic refresh failed.")}}},120000)}catch(error){}}
+async function loadInitialData(){try{allOrders=await fetchOrdersFromServer();initializeAllFilters();navigate('orders-dashboard');startOrderStream();setInterval(async()=>{if(['orders-dashboard','order-insights'].includes(currentView)){try{if(!await refreshOrders())return;renderOrderViews()}catch(e){console.error("Periodic refresh failed.")}}},ORDER_POLL_INTERVAL_MS)}catch(error){}}
 function initializeAllFilters(){statusFilterEl.innerHTML=['All Statuses','New','Processing','Shipped','Cancelled'].map(s=>`<option value="${s==='All Statuses'?'All':s}">${s}</option>`).join('');statusFilterEl.value=activeStatusFilter;statusFilterEl.addEventListener('change',e=>{activeStatusFilter=e.target.value;renderAllDashboard()});const d={'today':'Today','yesterday':'Yesterday','last_7_days':'Last 7 Days','mtd':'Month to Date','last_month':'Last Month','custom':'Custom Range...'};initializeDateFilters(insightsDatePresetFilter,insightsCustomDateContainer,insightsStartDateFilterEl,insightsEndDateFilterEl,'insightsDatePreset',renderAllInsights,d);initializeDateFilters(adDatePresetFilter,adCustomDateContainer,adStartDateFilterEl,adEndDateFilterEl,'adPerformanceDatePreset',handleAdPerformanceDateChange,d);initializeDateFilters(adsetDatePresetFilter,adsetCustomDateContainer,adsetStartDateFilterEl,adsetEndDateFilterEl,'adsetDatePreset',handleAdsetDateChange,d);initializeDateFilters(orderDatePresetFilter,customDateContainer,startDateFilterEl,endDateFilterEl,'activeDatePreset',renderAllDashboard,d);renderInsightsPlatformFilters()}
 function initializeDateFilters(d,c,s,e,p,h,t){d.innerHTML=Object.entries(t).map(([k,v])=>`<option value="${k}">${v}</option>`).join('');if(p==='insightsDatePreset')d.value=insightsDatePreset;else if(p==='adPerformanceDatePreset')d.value=adPerformanceDatePreset;else if(p==='adsetDatePreset')d.value=adsetDatePreset;else if(p==='activeDatePreset')d.value=activeDatePreset;const dateChange=()=>{const v=d.value;if(p==='insightsDatePreset')insightsDatePreset=v;else if(p==='adPerformanceDatePreset')adPerformanceDatePreset=v;else if(p==='adsetDatePreset')adsetDatePreset=v;else if(p==='activeDatePreset')activeDatePreset=v;c.classList.toggle('hidden',v!=='custom');h()};d.addEventListener('change',dateChange);s.addEventListener('change',h);e.addEventListener('change',h)}
 async function handlePdfDownload(){const[s,e]=calculateDateRange(adsetDatePreset,adsetStartDateFilterEl.value,adsetEndDateFilterEl.value);if(!adsetPerformanceData||adsetPerformanceData.length===0){showNotification("No data available to download.",true);return}
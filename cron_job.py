@@ -16,6 +16,7 @@ if project_root not in sys.path:
 
 from app import create_app
 from app.api.adset_performance import get_adset_performance_data
+from app.api.http_client import log_http_stats
 from app.api.pdf_generator import PDF
 
 
@@ -118,6 +119,7 @@ def generate_report():
         send_email_with_attachment(attachments, since_mtd, until_mtd)
     else:
         print("[ERROR] No PDFs generated. No email sent.")
+    log_http_stats()
 
 
 if __name__ == '__main__':
@@ -1,66 +1,109 @@
+import argparse
 import json
-import os
-import tempfile
+import time
 from datetime import datetime, timedelta
 import pytz
 from app import create_app
 from app.api.helpers import (
-    get_all_shopify_orders_paginated,
-    get_raw_rapidshyp_status,
-    get_rapidshyp_timeline,
-    save_cache,
-    load_cache,
+    iter_shopify_order_pages,
+    fetch_rapidshyp_tracking,
+    RapidShypTrackingSession,
+    is_terminal_shipment,
+    RAPIDSHYP_ERROR_STATUS,
     infer_shipped_datetime,
-    infer_delivered_datetime
+    infer_delivered_datetime,
+    materialize_order_fields,
+    newest_updated_at,
+    safe_parse_date
 )
-import concurrent.futures
+from app.api import http_client
+from app.api.shopify_bulk import import_bulk_orders
+from app.api.order_store import get_order_store
+from app.api.sync_pipeline import SyncPipeline
+from app.api.tracking_cache import get_tracking_cache
+from app.api.tracking_scheduler import TrackingScheduler
 
-MASTER_DATA_FILE = 'master_order_data.json'
 TZ_INDIA = pytz.timezone('Asia/Kolkata')
+SHOPIFY_ORDER_FIELDS = 'id,name,created_at,updated_at,total_price,fulfillments,note_attributes,source_name,referring_site,cancelled_at,fulfillment_status,financial_status,refunds,tags,line_items,email,shipping_address'
+WATERMARK_KEY = 'shopify_updated_at_watermark'
+LAST_FULL_SYNC_KEY = 'shopify_last_full_sync_at'
+# Field set of the last full reconcile; a change forces a full resync to backfill stored orders
+ORDER_FIELDS_KEY = 'shopify_order_fields'
+CHECKPOINT_KEY = 'sync_checkpoint'
+# Pipeline sizing: at most PIPELINE_QUEUE_SIZE batches wait between stages
+PIPELINE_QUEUE_SIZE = 4
+ENRICH_WORKERS = 10
+ENRICH_BATCH_SIZE = 50
+# Async workers share one RapidShypTrackingSession, so RAPIDSHYP_ASYNC_CONCURRENCY caps them together
+ASYNC_ENRICH_WORKERS = 2
+ASYNC_ENRICH_BATCH_SIZE = 250
 
-def atomic_write_json_utf8(path, data):
+def get_order_awb(order):
+    return next((f.get('tracking_number') for f in order.get('fulfillments', []) if f.get('tracking_number')), None)
+
+def needs_tracking_fetch(order, status_cache, scheduler=None):
     """
-    Atomically write JSON data to a file with UTF-8 encoding.
-    Validates the file after writing to ensure it's readable.
+    Returns the AWB to poll for this order, or None when its stored tracking
+    data can be reused (no AWB, terminal shipment, or not due yet).
     """
-    dir_ = os.path.dirname(path) or '.'
-    fd, tmp_path = tempfile.mkstemp(dir=dir_, prefix='.tmp_', suffix='.json')
-    try:
-        # Write UTF-8
-        with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        # Validate read-back as UTF-8
-        with open(tmp_path, 'r', encoding='utf-8') as v:
-            json.load(v)
-        
-        # Atomically replace the original file
-        os.replace(tmp_path, path)
-        print(f"✓ File validated and saved successfully")
-    except Exception as e:
-        print(f"✗ Error during atomic write: {e}")
-        raise
-    finally:
-        # Clean up temp file if it still exists
-        if os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except:
-                pass
-
-def enrich_order(order, status_cache, config):
+    awb = get_order_awb(order)
+    if not awb:
+        return None
+    if order.get('rapidshyp_events') and is_terminal_shipment(order, status_cache.get(awb)):
+        return None
+    if scheduler is not None and 'raw_rapidshyp_status' in order and not scheduler.is_due(awb):
+        cache_entry = status_cache.get(awb)
+        cached_status = cache_entry.get('raw_status') if isinstance(cache_entry, dict) else None
+        # A poll checkpointed by an interrupted run whose order was never written is not "done"
+        if not cached_status or cached_status == order.get('raw_rapidshyp_status'):
+            return None
+    return awb
+
+def enrich_order(order, status_cache, config, scheduler=None, prefetched=None):
     """
     Enriches a single order with RapidShyp data. This function is designed
-    to be run in a separate thread.
+    to be run in a separate thread. With a scheduler, AWBs that are not due
+    for a poll keep their stored tracking data. `prefetched` maps AWBs to
+    details already fetched in bulk (see RapidShypTrackingSession).
     """
-    awb = next((f.get('tracking_number') for f in order.get('fulfillments', []) if f.get('tracking_number')), None)
+    awb = get_order_awb(order)
     order['awb'] = awb
+    polled = False
 
-    if awb:
-        raw_status = get_raw_rapidshyp_status(awb, status_cache, config)
-        order['raw_rapidshyp_status'] = raw_status
-        timeline = get_rapidshyp_timeline(awb, config)
-        order['rapidshyp_events'] = timeline
+    cache_entry = status_cache.get(awb) if awb else None
+    fetch_awb = needs_tracking_fetch(order, status_cache, scheduler)
+    if awb and not fetch_awb and order.get('rapidshyp_events') and is_terminal_shipment(order, cache_entry):
+        # Delivered/RTO shipments don't change: reuse stored events and dates, no HTTP call
+        if isinstance(cache_entry, dict) and cache_entry.get('raw_status'):
+            order['raw_rapidshyp_status'] = cache_entry['raw_status']
+        elif not order.get('raw_rapidshyp_status'):
+            order['raw_rapidshyp_status'] = order.get('rapidshyp_webhook_status')
+        if not (order.get('shipped_at') and order.get('delivered_at')):
+            shipped_dt = infer_shipped_datetime(order)
+            delivered_dt = infer_delivered_datetime(order)
+            order['shipped_at'] = order.get('shipped_at') or (shipped_dt.isoformat() if shipped_dt else None)
+            order['delivered_at'] = order.get('delivered_at') or (delivered_dt.isoformat() if delivered_dt else None)
+        if scheduler is not None:
+            scheduler.forget(awb)
+    elif awb and not fetch_awb:
+        # Not due according to the adaptive schedule: keep the stored status and events
+        pass
+    elif awb:
+        # One track_order call yields both the status and the timeline, and fills the cache
+        if prefetched is not None and awb in prefetched:
+            details = prefetched[awb]
+        else:
+            details = fetch_rapidshyp_tracking(awb, status_cache, config)
+        polled = details is not None
+        if details:
+            order['raw_rapidshyp_status'] = details['raw_status']
+            order['rapidshyp_events'] = details['events']
+        elif http_client.is_open('rapidshyp') and order.get('raw_rapidshyp_status') not in (None, RAPIDSHYP_ERROR_STATUS):
+            # RapidShyp is down: keep the stored status and events; the AWB stays due for the next run
+            order['rapidshyp_events'] = order.get('rapidshyp_events', [])
+        else:
+            order['raw_rapidshyp_status'] = RAPIDSHYP_ERROR_STATUS if config.get('RAPIDSHYP_API_KEY') else "API Key Missing"
+            order['rapidshyp_events'] = order.get('rapidshyp_events', [])
         shipped_dt = infer_shipped_datetime(order)
         delivered_dt = infer_delivered_datetime(order)
         order['shipped_at'] = shipped_dt.isoformat() if shipped_dt else order.get('shipped_at')
@@ -72,10 +115,73 @@ def enrich_order(order, status_cache, config):
         delivered_dt = infer_delivered_datetime(order)
         order['shipped_at'] = shipped_dt.isoformat() if shipped_dt else order.get('shipped_at')
         order['delivered_at'] = delivered_dt.isoformat() if delivered_dt else order.get('delivered_at')
-    
+
+    # Persist derived dates, status and attribution so requests don't re-derive them
+    materialize_order_fields(order)
+    if scheduler is not None and polled:
+        scheduler.record_check(awb, order)
     return order
 
-def run_data_sync():
+def is_full_reconcile_due(store, config, now):
+    last_full = safe_parse_date(store.get_state(LAST_FULL_SYNC_KEY))
+    if not last_full or not store.get_state(WATERMARK_KEY):
+        return True
+    if store.get_state(ORDER_FIELDS_KEY) != SHOPIFY_ORDER_FIELDS:
+        print("Shopify order fields changed since the last full reconcile; running one to backfill them.")
+        return True
+    return now - last_full >= timedelta(hours=config['SHOPIFY_FULL_RECONCILE_HOURS'])
+
+def merge_with_stored(store, page, done_ids=frozenset()):
+    """
+    Overlays a page of Shopify orders on their stored versions, keeping
+    RapidShyp fields. Orders in done_ids that Shopify has not changed since
+    they were written are dropped (already handled by an interrupted run).
+    """
+    existing = store.get_orders(order['id'] for order in page)
+    merged = []
+    for new_order_data in page:
+        order = existing.get(str(new_order_data['id']))
+        if order is None:
+            merged.append(new_order_data)
+        elif str(new_order_data['id']) in done_ids and order.get('updated_at') == new_order_data.get('updated_at'):
+            continue
+        else:
+            order.update(new_order_data)
+            merged.append(order)
+    return merged
+
+def iter_sync_batches(store, shopify_passes, progress, batch_size, done_ids=frozenset()):
+    """
+    Pipeline source: merged Shopify pages first, then every stored order the
+    crawl did not return (those still need their tracking refreshed).
+    `progress` collects the ids seen and the newest Shopify updated_at;
+    done_ids are orders a resumed run already wrote. An order returned by
+    more than one pass is only taken the first time, so callers list the
+    pass with the newest copies first.
+    """
+    seen = progress['seen']
+    for pages in shopify_passes:
+        for page in pages:
+            page = [order for order in page if str(order['id']) not in seen]
+            seen.update(str(order['id']) for order in page)
+            progress['newest'] = newest_updated_at(page, progress['newest'])
+            for start in range(0, len(page), batch_size):
+                batch = merge_with_stored(store, page[start:start + batch_size], done_ids)
+                if batch:
+                    yield batch
+    for batch in store.iter_order_batches(batch_size):
+        batch = [order for order in batch if str(order['id']) not in seen and str(order['id']) not in done_ids]
+        if batch:
+            yield batch
+
+def enrich_batch(batch, status_cache, config, scheduler, tracking_session=None):
+    if tracking_session:
+        awbs = {needs_tracking_fetch(order, status_cache, scheduler) for order in batch} - {None}
+        prefetched = tracking_session.fetch_many(sorted(awbs), status_cache) if awbs else {}
+        return [enrich_order(order, status_cache, config, scheduler, prefetched) for order in batch]
+    return [enrich_order(order, status_cache, config, scheduler) for order in batch]
+
+def run_data_sync(use_async=False, force_full=False, use_bulk=False, resume=False):
     print(f"\n{'='*70}")
     print(f"[{datetime.now(TZ_INDIA).strftime('%Y-%m-%d %H:%M:%S')}] Starting Data Sync Job")
     print(f"{'='*70}\n")
@@ -84,83 +190,145 @@ def run_data_sync():
     with app.app_context():
         config = app.config
 
-        # --- MODIFIED: Load existing master data first ---
-        existing_orders_dict = {}
-        if os.path.exists(MASTER_DATA_FILE):
-            print("Loading existing master data file...")
-            try:
-                with open(MASTER_DATA_FILE, 'r', encoding='utf-8') as f:
-                    existing_orders = json.load(f)
-                existing_orders_dict = {order['id']: order for order in existing_orders}
-                print(f"✓ Loaded {len(existing_orders_dict)} existing orders.\n")
-            except (json.JSONDecodeError, FileNotFoundError):
-                print("Could not load existing master data file. Starting fresh.")
-
-        fetch_since_date = datetime.now(TZ_INDIA) - timedelta(days=180)
-        print(f"Fetching Shopify orders created OR updated since {fetch_since_date.strftime('%Y-%m-%d')}...\n")
-
-        params_created = {
-            'status': 'any', 'limit': 250, 'created_at_min': fetch_since_date.isoformat(),
-            'fields': 'id,name,created_at,total_price,fulfillments,note_attributes,source_name,referring_site,cancelled_at,fulfillment_status,line_items,email,shipping_address'
-        }
-        print("Step 1: Fetching orders by created_at...")
-        created_orders = get_all_shopify_orders_paginated(config, params_created)
-
-        params_updated = {
-            'status': 'any', 'limit': 250, 'updated_at_min': fetch_since_date.isoformat(),
-            'fields': 'id,name,created_at,total_price,fulfillments,note_attributes,source_name,referring_site,cancelled_at,fulfillment_status,line_items,email,shipping_address'
-        }
-        print("\nStep 2: Fetching orders by updated_at...")
-        updated_orders = get_all_shopify_orders_paginated(config, params_updated)
-
-        print("\nStep 3: Combining and de-duplicating orders...")
-        all_recent_orders_dict = {order['id']: order for order in created_orders}
-        all_recent_orders_dict.update({order['id']: order for order in updated_orders})
-        
-        # --- MODIFIED: Merge new data with existing data ---
-        for order_id, new_order_data in all_recent_orders_dict.items():
-            if order_id in existing_orders_dict:
-                # Get the existing order
-                existing_order = existing_orders_dict[order_id]
-                # Update it with new data from Shopify
-                existing_order.update(new_order_data)
-                # But if 'rapidshyp_webhook_status' exists, keep it
-                if 'rapidshyp_webhook_status' in existing_orders_dict[order_id]:
-                    existing_order['rapidshyp_webhook_status'] = existing_orders_dict[order_id]['rapidshyp_webhook_status']
-            else:
-                # It's a completely new order, just add it
-                existing_orders_dict[order_id] = new_order_data
-
-        all_orders_to_process = list(existing_orders_dict.values())
-        
-        print(f"✓ Combined to {len(all_orders_to_process)} total unique orders\n")
-
-        print("Step 4: Loading RapidShyp cache...")
-        status_cache = load_cache()
-        print(f"✓ Loaded cache with {len(status_cache)} entries\n")
-
-        print(f"Step 5: Enriching {len(all_orders_to_process)} orders with RapidShyp tracking data (in parallel)...")
-        enriched_orders = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            future_to_order = {executor.submit(enrich_order, order, status_cache, config): order for order in all_orders_to_process}
-            for i, future in enumerate(concurrent.futures.as_completed(future_to_order), start=1):
-                enriched_orders.append(future.result())
-                if i % 50 == 0 or i == len(all_orders_to_process):
-                    print(f"    → Enriched {i}/{len(all_orders_to_process)} orders")
-
-        print(f"✓ Enriched all {len(all_orders_to_process)} orders\n")
-
-        print("Step 6: Saving RapidShyp cache...")
-        save_cache(status_cache)
-        print("✓ Cache saved\n")
-
-        print(f"Step 7: Writing to '{MASTER_DATA_FILE}'...")
-        atomic_write_json_utf8(MASTER_DATA_FILE, enriched_orders)
-        print(f"✓ Saved {len(enriched_orders)} orders\n")
+        store = get_order_store(config)
+        # Fold pending webhook status deltas in so they are not lost when orders are rewritten
+        store.compact_status_deltas()
+        print(f"Order store '{store.db_path}' holds {store.count()} orders.\n")
+
+        watermark = store.get_state(WATERMARK_KEY)
+        checkpoint = json.loads(store.get_state(CHECKPOINT_KEY) or 'null')
+        if resume and checkpoint:
+            # Same run parameters as the interrupted run; orders it already wrote are skipped
+            sync_started_at = safe_parse_date(checkpoint['started_at'])
+            full_sync, bulk_newest = checkpoint['full_sync'], checkpoint.get('bulk_newest')
+            done_ids = store.synced_order_ids()
+            print(f"Resuming sync started at {checkpoint['started_at']}: {len(done_ids)} orders already written.\n")
+        else:
+            if checkpoint:
+                print(f"Discarding checkpoint of the interrupted sync started at {checkpoint['started_at']} (use --resume to continue it).\n")
+            elif resume:
+                print("No checkpoint found, starting a fresh sync.\n")
+            store.clear_sync_progress()
+            sync_started_at = datetime.now(TZ_INDIA)
+            full_sync = force_full or is_full_reconcile_due(store, config, sync_started_at)
+            bulk_newest, done_ids = None, set()
+            checkpoint = {'started_at': sync_started_at.isoformat(), 'full_sync': full_sync}
+            store.set_state(CHECKPOINT_KEY, json.dumps(checkpoint))
+
+        # Shopify passes are generators, so pages are fetched as the pipeline pulls them
+        if full_sync and use_bulk and bulk_newest:
+            print("Step 1: Full reconcile (bulk): export already imported by the interrupted run\n")
+            shopify_passes = []
+        elif full_sync and use_bulk:
+            # The bulk export streams straight into the store; the pipeline then refreshes tracking from the store
+            fetch_since_date = sync_started_at - timedelta(days=180)
+            print(f"Step 1: Full reconcile (bulk): exporting Shopify orders created OR updated since {fetch_since_date.strftime('%Y-%m-%d')}...")
+            imported, bulk_newest = import_bulk_orders(config, store, fetch_since_date.isoformat())
+            print(f"✓ Bulk export imported {imported} orders\n")
+            checkpoint['bulk_newest'] = bulk_newest
+            store.set_state(CHECKPOINT_KEY, json.dumps(checkpoint))
+            shopify_passes = []
+        elif full_sync:
+            fetch_since_date = sync_started_at - timedelta(days=180)
+            print(f"Step 1: Full reconcile: Shopify orders created OR updated since {fetch_since_date.strftime('%Y-%m-%d')} will be streamed\n")
+            params_created = {
+                'status': 'any', 'limit': 250, 'created_at_min': fetch_since_date.isoformat(),
+                'fields': SHOPIFY_ORDER_FIELDS
+            }
+            params_updated = {
+                'status': 'any', 'limit': 250, 'updated_at_min': fetch_since_date.isoformat(),
+                'fields': SHOPIFY_ORDER_FIELDS
+            }
+            # A skipped page would be missing until the next full reconcile, so a failure ends
+            # the run before LAST_FULL_SYNC_KEY or the watermark move; --resume picks it up.
+            # The updated pass runs first: an order in both passes keeps its first (newer) copy.
+            shopify_passes = [iter_shopify_order_pages(config, params_updated, raise_on_error=True),
+                              iter_shopify_order_pages(config, params_created, raise_on_error=True)]
+        else:
+            # Incremental: only orders updated since the last run, minus a safety overlap
+            fetch_since_date = safe_parse_date(watermark) - timedelta(minutes=config['SHOPIFY_SYNC_OVERLAP_MINUTES'])
+            print(f"Step 1: Incremental sync: Shopify orders updated since {fetch_since_date.isoformat()} (watermark {watermark}) will be streamed\n")
+            params_updated = {
+                'status': 'any', 'limit': 250, 'updated_at_min': fetch_since_date.isoformat(),
+                'fields': SHOPIFY_ORDER_FIELDS
+            }
+            # An incremental run must not advance the watermark past a failed page
+            shopify_passes = [iter_shopify_order_pages(config, params_updated, raise_on_error=True)]
+
+        print("Step 2: Loading RapidShyp cache...")
+        status_cache = get_tracking_cache(config)
+        print(f"✓ Loaded cache with {len(status_cache)} entries")
+        scheduler = TrackingScheduler(config['RAPIDSHYP_SCHEDULE_FILE'])
+        due_count = scheduler.due_count()
+        print(f"✓ Loaded polling schedule for {len(scheduler)} AWBs ({due_count} due, unscheduled AWBs are always due)\n")
+
+        if use_async:
+            print(f"Step 3: Streaming orders through RapidShyp enrichment (async, {config['RAPIDSHYP_ASYNC_CONCURRENCY']} in flight across workers) into the store...")
+            workers, batch_size = ASYNC_ENRICH_WORKERS, ASYNC_ENRICH_BATCH_SIZE
+            tracking_session = RapidShypTrackingSession(config)
+        else:
+            print(f"Step 3: Streaming orders through RapidShyp enrichment ({ENRICH_WORKERS} threads) into the store...")
+            workers, batch_size = ENRICH_WORKERS, ENRICH_BATCH_SIZE
+            tracking_session = None
+        progress = {'seen': set(), 'newest': bulk_newest or watermark}
+        last_checkpoint = [time.time()]
+
+        def write_batch(batch):
+            store.upsert_orders(batch, record_progress=True)
+            if time.time() - last_checkpoint[0] >= config['SYNC_CHECKPOINT_INTERVAL_SECONDS']:
+                status_cache.flush()
+                scheduler.save()
+                last_checkpoint[0] = time.time()
+                print(f"[Checkpoint] Saved RapidShyp cache ({len(status_cache)} entries) and polling schedule")
+
+        pipeline = SyncPipeline(
+            source=iter_sync_batches(store, shopify_passes, progress, batch_size, done_ids),
+            stages=[('enrich', lambda batch: enrich_batch(batch, status_cache, config, scheduler, tracking_session), workers)],
+            sink=write_batch,
+            queue_size=PIPELINE_QUEUE_SIZE,
+        )
+        try:
+            stats = pipeline.run()
+        except BaseException:
+            # Keep the tracking data gathered so far for --resume
+            status_cache.flush()
+            scheduler.save()
+            print("[Checkpoint] Sync interrupted; progress saved, rerun with --resume to continue")
+            raise
+        finally:
+            if tracking_session:
+                tracking_session.close()
+        print(f"✓ Enriched and saved {stats[-1].items} orders ({len(progress['seen'])} from Shopify)\n")
+
+        print("Step 4: Saving RapidShyp cache...")
+        status_cache.flush()
+        scheduler.save()
+        print("✓ Cache and polling schedule saved\n")
+
+        new_watermark = progress['newest']
+        if new_watermark:
+            store.set_state(WATERMARK_KEY, new_watermark)
+        if full_sync:
+            store.set_state(LAST_FULL_SYNC_KEY, sync_started_at.isoformat())
+            store.set_state(ORDER_FIELDS_KEY, SHOPIFY_ORDER_FIELDS)
+        print(f"✓ Shopify watermark is now {new_watermark}\n")
+        store.set_state(CHECKPOINT_KEY, None)
+        store.clear_sync_progress()
+        http_client.log_http_stats()
 
         print(f"{'='*70}")
         print(f"[{datetime.now(TZ_INDIA).strftime('%Y-%m-%d %H:%M:%S')}] Data Sync Job Finished Successfully")
         print(f"{'='*70}\n")
 
 if __name__ == '__main__':
-    run_data_sync()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sync Shopify orders and RapidShyp tracking into the order store.")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="fetch RapidShyp tracking with the asyncio client instead of a thread pool")
+    parser.add_argument('--full', dest='force_full', action='store_true',
+                        help="run a full 180-day Shopify reconcile even if one is not due")
+    parser.add_argument('--bulk', dest='use_bulk', action='store_true',
+                        help="use a Shopify GraphQL bulk export for full reconciles instead of REST pagination")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue the last interrupted sync from its checkpoint")
+    args = parser.parse_args()
+    run_data_sync(use_async=args.use_async, force_full=args.force_full, use_bulk=args.use_bulk, resume=args.resume)
\ No newline at end of file
@@ -0,0 +1,123 @@
+import gzip
+import json
+from http.server import BaseHTTPRequestHandler
+
+from app.api.amazon import (
+    fetch_amazon_orders_via_report, iter_report_document_lines, iter_report_orders, merge_amazon_orders,
+    normalize_report_order,
+)
+from app.api.amazon_items_store import get_amazon_items_store
+
+REPORT_COLUMNS = ['amazon-order-id', 'purchase-date', 'last-updated-date', 'order-status', 'product-name', 'sku',
+                  'asin', 'quantity', 'currency', 'item-price', 'item-tax', 'shipping-price',
+                  'item-promotion-discount', 'ship-city', 'ship-state']
+REPORT_ROWS = [
+    ['405-1', '2026-10-01T08:00:00+00:00', '2026-10-02T08:00:00+00:00', 'Shipped', 'Tea Pack', 'TEA-1',
+     'B001', '2', 'INR', '400.00', '20.00', '50.00', '30.00', 'Pune', 'MH'],
+    ['405-1', '2026-10-01T08:00:00+00:00', '2026-10-02T08:00:00+00:00', 'Shipped', 'Mug', 'MUG-1',
+     'B002', '1', 'INR', '250.00', '12.50', '0.00', '', 'Pune', 'MH'],
+    ['405-2', '2026-10-03T08:00:00+00:00', '2026-10-03T09:00:00+00:00', 'Cancelled', 'Tea Pack', 'TEA-1',
+     'B001', '1', 'INR', '200.00', '10.00', '0.00', '', 'Delhi', 'DL'],
+    ['405-3', '2026-10-04T08:00:00+00:00', '2026-10-04T09:00:00+00:00', 'Pending', 'Mug', 'MUG-1',
+     'B002', '1', 'INR', '250.00', '12.50', '0.00', '', '', ''],
+]
+REPORT_TSV = '\n'.join('\t'.join(row) for row in [REPORT_COLUMNS] + REPORT_ROWS) + '\n'
+
+
+class FakeSPAPI(BaseHTTPRequestHandler):
+    """LWA token endpoint, the Reports API calls used by ingestion, and a gzipped report document."""
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type='application/json'):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path == '/auth/o2/token':
+            self._send({'access_token': 'test-access-token', 'expires_in': 3600})
+        else:
+            self._send({'reportId': 'R1'})
+
+    def do_GET(self):
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        if self.path.startswith('/reports/2021-06-30/reports/'):
+            self._send({'reportId': 'R1', 'processingStatus': 'DONE', 'reportDocumentId': 'DOC1'})
+        elif self.path.startswith('/reports/2021-06-30/documents/'):
+            self._send({'reportDocumentId': 'DOC1', 'url': f'{base}/documents/doc1.gz', 'compressionAlgorithm': 'GZIP'})
+        else:
+            self._send(gzip.compress(REPORT_TSV.encode('utf-8')), 'application/octet-stream')
+
+
+def sp_api_config(base, tmp_path):
+    return {
+        'BASE_URL': base, 'LWA_TOKEN_URL': f'{base}/auth/o2/token',
+        'AWS_ACCESS_KEY': 'AKIDTEST', 'AWS_SECRET_KEY': 'secret', 'AWS_REGION': 'eu-west-1',
+        'LWA_CLIENT_ID': f'client-{base}', 'LWA_CLIENT_SECRET': 'client-secret', 'REFRESH_TOKEN': 'refresh',
+        'MARKETPLACE_ID': 'A21TJRUUN4KGV',
+        'CREDENTIALS_DB_FILE': str(tmp_path / 'credentials.db'),
+        'AMAZON_ITEMS_DB_FILE': str(tmp_path / 'amazon_items.db'),
+    }
+
+
+def test_report_document_is_decompressed_and_grouped_by_order(local_server, tmp_path):
+    config = sp_api_config(local_server(FakeSPAPI), tmp_path)
+    orders = list(iter_report_orders(iter_report_document_lines(config, 'DOC1')))
+
+    assert [order['id'] for order, _ in orders] == ['405-1', '405-2', '405-3']
+    first, items = orders[0]
+    assert first['date'] == '2026-10-01'
+    assert first['status'] == 'Shipped'
+    assert first['total'] == 400.0 + 50.0 - 30.0 + 250.0
+    assert first['address'] == 'Pune, MH'
+    assert first['items'] == [{'name': 'Tea Pack', 'sku': 'TEA-1', 'qty': 2}, {'name': 'Mug', 'sku': 'MUG-1', 'qty': 1}]
+    assert items[0]['ItemPrice'] == {'CurrencyCode': 'INR', 'Amount': '400.00'}
+    assert orders[1][0]['status'] == 'Cancelled'
+    assert orders[2][0]['address'] == 'No address'
+
+
+def test_normalize_report_order_has_no_buyer_pii():
+    row = dict(zip(REPORT_COLUMNS, REPORT_ROWS[2]))
+    order, items = normalize_report_order([row])
+    assert order['name'] == 'N/A' and order['paymentMethod'] == 'N/A'
+    assert order['lastUpdated'] == '2026-10-03T09:00:00+00:00'
+    assert items[0]['QuantityOrdered'] == 1
+
+
+def test_fetch_via_report_stores_items(local_server, tmp_path):
+    config = sp_api_config(local_server(FakeSPAPI), tmp_path)
+    orders = fetch_amazon_orders_via_report(config, days=30)
+
+    assert sorted(order['id'] for order in orders) == ['405-1', '405-2', '405-3']
+    stored = get_amazon_items_store(config).get_many(['405-1', '405-3'])
+    assert [item['SellerSKU'] for item in stored['405-1']] == ['TEA-1', 'MUG-1']
+    assert len(stored['405-3']) == 1
+
+
+def test_report_orders_merge_keeps_known_buyer_details():
+    cached = [{'platform': 'Amazon', 'id': '405-1', 'date': '2026-10-01', 'name': 'Asha Rao',
+               'address': '12 MG Road, Pune', 'paymentMethod': 'COD', 'status': 'Processing',
+               'items': [{'name': 'Tea Pack', 'sku': 'TEA-1', 'qty': 2}]}]
+    report_order, _ = normalize_report_order([dict(zip(REPORT_COLUMNS, REPORT_ROWS[0]))])
+
+    merged = {order['id']: order for order in merge_amazon_orders(cached, [report_order])}
+
+    assert merged['405-1']['name'] == 'Asha Rao'
+    assert merged['405-1']['paymentMethod'] == 'COD'
+    assert merged['405-1']['status'] == 'Shipped'
+    assert merged['405-1']['address'] == '12 MG Road, Pune'
+
+
+def test_report_address_fills_in_unknown_address():
+    cached = [{'platform': 'Amazon', 'id': '405-1', 'date': '2026-10-01', 'name': 'N/A', 'address': 'No address'}]
+    report_order, _ = normalize_report_order([dict(zip(REPORT_COLUMNS, REPORT_ROWS[0]))])
+
+    merged = merge_amazon_orders(cached, [report_order])
+
+    assert merged[0]['address'] == 'Pune, MH'
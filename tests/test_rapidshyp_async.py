@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from aiohttp import web
+
+from app.api import http_client
+from app.api.helpers import RapidShypTrackingSession, fetch_rapidshyp_tracking_many
+
+
+class FakeRapidShyp:
+    """track_order stand-in: counts requests in flight, throttles and fails chosen AWBs."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = {}
+
+    async def track_order(self, request):
+        assert request.headers.get('rapidshyp-token') == 'test-key'
+        awb = (await request.json())['awb']
+        self.calls[awb] = self.calls.get(awb, 0) + 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.05)
+            if awb == 'THROTTLED' and self.calls[awb] == 1:
+                return web.json_response({'message': 'Too many requests'}, status=429)
+            if awb == 'BROKEN':
+                return web.json_response({'message': 'upstream error'}, status=500)
+            if awb == 'UNKNOWN':
+                return web.json_response({'success': False, 'records': []})
+            return web.json_response({'success': True, 'records': [{'shipment_details': [{
+                'shipment_status': 'In Transit',
+                'tracking_history': [{'status_desc': 'Picked up', 'date': '2026-10-01 10:00', 'location': 'Pune'}],
+            }]}]})
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def rapidshyp_server():
+    """Runs the fake on its own event loop thread, since fetch_rapidshyp_tracking_many calls asyncio.run()."""
+    fake, loop, started = FakeRapidShyp(), asyncio.new_event_loop(), threading.Event()
+    app = web.Application()
+    app.router.add_post('/track_order', fake.track_order)
+    runner = web.AppRunner(app)
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        loop.run_until_complete(site.start())
+        fake.port = runner.addresses[0][1]
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    started.wait(5)
+    http_client._breakers.pop('rapidshyp', None)   # start every test with a closed breaker
+    yield fake, {'RAPIDSHYP_API_KEY': 'test-key', 'RAPIDSHYP_API_BASE': f'http://127.0.0.1:{fake.port}'}
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+def test_concurrency_limit_is_respected(rapidshyp_server):
+    fake, config = rapidshyp_server
+    awbs = [f'AWB{i:03d}' for i in range(20)]
+    cache = {}
+
+    results = fetch_rapidshyp_tracking_many(awbs, cache, config, concurrency=4)
+
+    assert fake.max_in_flight == 4
+    assert all(results[awb]['raw_status'] == 'In Transit' for awb in awbs)
+    assert results['AWB000']['events'] == [{'status': 'Picked up', 'timestamp': '2026-10-01 10:00', 'location': 'Pune'}]
+    assert set(cache) == set(awbs) and cache['AWB000']['raw_status'] == 'In Transit'
+
+
+def test_shared_session_caps_concurrency_across_threads(rapidshyp_server):
+    fake, config = rapidshyp_server
+    batches = [[f'A{i:03d}' for i in range(12)], [f'B{i:03d}' for i in range(12)]]
+    cache = {}
+
+    with RapidShypTrackingSession(config, concurrency=4) as session:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(lambda awbs: session.fetch_many(awbs, cache), batches))
+
+    assert fake.max_in_flight == 4
+    assert all(results[i][awb]['raw_status'] == 'In Transit' for i, awbs in enumerate(batches) for awb in awbs)
+    assert len(cache) == 24
+
+
+def test_throttled_request_backs_off_and_retries(rapidshyp_server):
+    fake, config = rapidshyp_server
+    started = time.time()
+
+    results = fetch_rapidshyp_tracking_many(['THROTTLED', 'AWB1'], {}, config, concurrency=2)
+
+    assert fake.calls['THROTTLED'] == 2
+    assert results['THROTTLED']['raw_status'] == 'In Transit'
+    assert time.time() - started >= 1   # first backoff is 1-2s
+
+
+def test_failures_return_none_without_caching(rapidshyp_server):
+    fake, config = rapidshyp_server
+    cache = {}
+
+    results = fetch_rapidshyp_tracking_many(['BROKEN', 'UNKNOWN', 'AWB1'], cache, config, concurrency=2)
+
+    assert results['BROKEN'] is None and results['UNKNOWN'] is None
+    assert fake.calls['BROKEN'] == 3       # retried, then given up
+    assert fake.calls['UNKNOWN'] == 1      # a valid "not found" answer is not retried
+    assert set(cache) == {'AWB1'}
+
+
+def test_open_breaker_fails_fast(rapidshyp_server):
+    fake, config = rapidshyp_server
+    breaker = http_client.get_breaker('rapidshyp')
+    for _ in range(http_client.BREAKER_MIN_REQUESTS):
+        breaker.record(False)
+
+    results = fetch_rapidshyp_tracking_many(['AWB1', 'AWB2'], {}, config)
+
+    assert results == {'AWB1': None, 'AWB2': None}
+    assert fake.calls == {}
+
+
+def test_missing_api_key_skips_requests(rapidshyp_server):
+    fake, config = rapidshyp_server
+    config['RAPIDSHYP_API_KEY'] = None
+
+    assert fetch_rapidshyp_tracking_many(['AWB1'], {}, config) == {'AWB1': None}
+    assert fake.calls == {}
@@ -0,0 +1,111 @@
+import json
+from http.server import BaseHTTPRequestHandler
+
+from app.api.order_store import OrderStore
+from app.api.shopify_bulk import graphql_order_to_rest, import_bulk_orders, iter_bulk_orders
+
+ORDER_1 = {
+    'id': 'gid://shopify/Order/1001', 'legacyResourceId': '1001', 'name': '#1001',
+    'createdAt': '2026-10-01T10:00:00+05:30', 'updatedAt': '2026-10-02T09:00:00+05:30', 'cancelledAt': None,
+    'email': 'a@example.com', 'sourceName': 'web',
+    'displayFulfillmentStatus': 'FULFILLED', 'displayFinancialStatus': 'PARTIALLY_REFUNDED', 'tags': ['vip', 'repeat'],
+    'totalPriceSet': {'shopMoney': {'amount': '1499.00'}},
+    'customAttributes': [{'key': 'utm_source', 'value': 'facebook'}],
+    'refunds': [{'createdAt': '2026-10-03T10:00:00+05:30', 'totalRefundedSet': {'shopMoney': {'amount': '200.00'}}}],
+    'customerJourneySummary': {'lastVisit': {'referrerUrl': 'https://m.facebook.com/'}},
+    'shippingAddress': {'firstName': 'Asha', 'lastName': 'Rao', 'address1': '12 MG Road', 'city': 'Pune',
+                        'province': 'MH', 'zip': '411001', 'phone': '99999'},
+    'fulfillments': [{'createdAt': '2026-10-01T12:00:00+05:30', 'updatedAt': '2026-10-01T12:00:00+05:30',
+                      'trackingInfo': [{'number': 'AWB1', 'company': 'RapidShyp'}]}],
+}
+ORDER_2 = {
+    'id': 'gid://shopify/Order/1002', 'legacyResourceId': '1002', 'name': '#1002',
+    'createdAt': '2026-10-04T10:00:00+05:30', 'updatedAt': '2026-10-05T09:00:00+05:30',
+    'displayFulfillmentStatus': 'UNFULFILLED', 'displayFinancialStatus': 'PENDING', 'tags': [],
+    'totalPriceSet': {'shopMoney': {'amount': '499.00'}}, 'refunds': [], 'fulfillments': [],
+}
+
+
+def line_item(item_id, parent, sku, qty, price):
+    return {'id': f'gid://shopify/LineItem/{item_id}', 'sku': sku, 'name': f'Item {sku}', 'quantity': qty,
+            'originalUnitPriceSet': {'shopMoney': {'amount': price}}, '__parentId': parent}
+
+
+EXPORT_LINES = [
+    ORDER_1,
+    line_item(1, ORDER_1['id'], 'SKU-A', 2, '499.50'),
+    line_item(2, ORDER_1['id'], 'SKU-B', 1, '500.00'),
+    ORDER_2,
+    line_item(3, ORDER_2['id'], 'SKU-C', 1, '499.00'),
+]
+
+
+class FakeShopify(BaseHTTPRequestHandler):
+    """Answers the bulk mutation and status query, and serves the canned JSONL export."""
+    jsonl = '\n'.join(json.dumps(line) for line in EXPORT_LINES) + '\n'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type='application/json'):
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        query = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['query']
+        if 'bulkOperationRunQuery' in query:
+            self._send(json.dumps({'data': {'bulkOperationRunQuery': {
+                'bulkOperation': {'id': 'gid://shopify/BulkOperation/1', 'status': 'CREATED'}, 'userErrors': []}}}))
+        else:
+            url = f"http://127.0.0.1:{self.server.server_address[1]}/export.jsonl"
+            self._send(json.dumps({'data': {'node': {'id': 'gid://shopify/BulkOperation/1', 'status': 'COMPLETED',
+                                                     'objectCount': str(len(EXPORT_LINES)), 'url': url}}}))
+
+    def do_GET(self):
+        self._send(self.jsonl, 'application/jsonl')
+
+
+def test_graphql_order_to_rest_matches_rest_shape():
+    order = graphql_order_to_rest(ORDER_1, [line_item(1, ORDER_1['id'], 'SKU-A', 2, '499.50')])
+    assert order['id'] == 1001 and order['name'] == '#1001'
+    assert order['fulfillment_status'] == 'fulfilled'
+    assert order['financial_status'] == 'partially_refunded'
+    assert order['tags'] == 'vip, repeat'
+    assert order['total_price'] == '1499.00'
+    assert order['refunds'][0]['transactions'] == [{'kind': 'refund', 'status': 'success', 'amount': '200.00'}]
+    assert order['note_attributes'] == [{'name': 'utm_source', 'value': 'facebook'}]
+    assert order['referring_site'] == 'https://m.facebook.com/'
+    assert order['shipping_address']['city'] == 'Pune'
+    assert order['fulfillments'][0]['tracking_number'] == 'AWB1'
+    assert order['line_items'] == [{'id': 1, 'sku': 'SKU-A', 'name': 'Item SKU-A', 'quantity': 2, 'price': '499.50'}]
+
+
+def test_iter_bulk_orders_groups_line_items_by_parent(local_server):
+    base = local_server(FakeShopify)
+    orders = list(iter_bulk_orders(f"{base}/export.jsonl"))
+    assert [o['name'] for o in orders] == ['#1001', '#1002']
+    assert [i['sku'] for i in orders[0]['line_items']] == ['SKU-A', 'SKU-B']
+    assert [i['sku'] for i in orders[1]['line_items']] == ['SKU-C']
+    assert orders[1]['shipping_address'] is None
+
+
+def test_import_bulk_orders_keeps_rapidshyp_fields(local_server, tmp_path):
+    base = local_server(FakeShopify)
+    config = {'SHOPIFY_SHOP_URL': base, 'SHOPIFY_TOKEN': 'test-token'}
+    store = OrderStore(str(tmp_path / 'orders.db'))
+    store.upsert_orders([{'id': 1001, 'name': '#1001', 'created_at': '2026-10-01T10:00:00+05:30',
+                          'updated_at': '2026-10-01T10:00:00+05:30', 'raw_rapidshyp_status': 'DELIVERED'}])
+
+    imported, newest = import_bulk_orders(config, store, '2026-04-01T00:00:00+05:30', batch_size=1)
+
+    assert imported == 2
+    assert newest == '2026-10-05T09:00:00+05:30'
+    stored = store.get_orders([1001, 1002])
+    assert stored['1001']['raw_rapidshyp_status'] == 'DELIVERED'
+    assert stored['1001']['updated_at'] == '2026-10-02T09:00:00+05:30'
+    assert [i['price'] for i in stored['1001']['line_items']] == ['499.50', '500.00']
+    assert stored['1002']['financial_status'] == 'pending'
@@ -0,0 +1,85 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+from app.api.helpers import make_signed_api_request
+from app.api.sp_rate_limiter import TokenBucket, _buckets, sp_api_operation, sp_api_rate
+
+SERVER_RATE, SERVER_BURST = 20.0, 30
+
+
+class ThrottledSPAPI(BaseHTTPRequestHandler):
+    """
+    orderItems stand-in that enforces its own token bucket, answers 429 when
+    it is empty and advertises its rate in x-amzn-RateLimit-Limit.
+    """
+    bucket = None
+    lock = threading.Lock()
+    counts = {'ok': 0, 'throttled': 0}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self._send(200, {'access_token': 'test-access-token', 'expires_in': 3600})
+
+    def do_GET(self):
+        with self.lock:
+            bucket = type(self).bucket
+            bucket._refill(time.monotonic())
+            allowed = bucket._tokens >= 1
+            if allowed:
+                bucket._tokens -= 1
+            self.counts['ok' if allowed else 'throttled'] += 1
+        headers = [('x-amzn-RateLimit-Limit', str(SERVER_RATE))]
+        if allowed:
+            self._send(200, {'payload': {'OrderItems': []}}, headers)
+        else:
+            self._send(429, {'errors': [{'code': 'QuotaExceeded'}]}, headers)
+
+
+def test_unknown_operations_share_a_bucket_per_path_pattern():
+    first = sp_api_operation('GET', '/orders/v0/orders/405-1111111-1111111/address')
+    second = sp_api_operation('GET', '/orders/v0/orders/405-2222222-2222222/address')
+    assert first == second
+    assert first[0] == 'GET /orders/v0/orders/{id}/address'
+    assert sp_api_operation('GET', '/reports/2021-06-30/schedules/12345')[0] == 'GET /reports/2021-06-30/schedules/{id}'
+    assert sp_api_operation('GET', '/orders/v0/orders/405-1/orderItems')[0] == 'getOrderItems'
+
+
+def test_items_backfill_is_paced_without_throttling(local_server, tmp_path):
+    ThrottledSPAPI.bucket = TokenBucket(SERVER_RATE, SERVER_BURST)
+    ThrottledSPAPI.counts.update(ok=0, throttled=0)
+    _buckets.pop('getOrderItems', None)   # start from the documented 0.5/s, burst 30
+    base = local_server(ThrottledSPAPI)
+    config = {
+        'BASE_URL': base, 'LWA_TOKEN_URL': f'{base}/auth/o2/token',
+        'AWS_ACCESS_KEY': 'AKIDTEST', 'AWS_SECRET_KEY': 'secret', 'AWS_REGION': 'eu-west-1',
+        'LWA_CLIENT_ID': f'client-{base}', 'LWA_CLIENT_SECRET': 'client-secret', 'REFRESH_TOKEN': 'refresh',
+        'CREDENTIALS_DB_FILE': str(tmp_path / 'credentials.db'),
+    }
+    calls = 60
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        list(pool.map(lambda i: make_signed_api_request(
+            config, {'method': 'GET', 'path': f'/orders/v0/orders/405-{i:07d}/orderItems'}), range(calls)))
+    elapsed = time.time() - started
+
+    assert ThrottledSPAPI.counts == {'ok': calls, 'throttled': 0}
+    assert sp_api_rate('GET', '/orders/v0/orders/405-1/orderItems') == SERVER_RATE
+    # The burst goes out at once, the rest at the advertised rate
+    assert elapsed >= (calls - SERVER_BURST) / SERVER_RATE * 0.8